@@ -0,0 +1,366 @@
+"""
+Server-authoritative multiplayer arena
+
+Players join a room over ``/api/arena/{room_id}`` (WebSocket) and only
+send turns; the server moves every snake. One ``TickScheduler`` task per
+worker advances all rooms every ``ARENA_TICK_MS`` and measures how late
+each tick started (jitter) and how long it took against
+``ARENA_TICK_BUDGET_MS``; both are reported by ``GET /api/metrics``.
+
+Rules follow ``snake_engine`` (reversals ignored, walls or wrapping by
+game mode, food from a seeded xorshift32) on a shared board: a head moving
+onto any snake, tail included, or onto the same cell as another head,
+dies, and the player respawns ``ARENA_RESPAWN_TICKS`` later. Occupancy is
+one bitset per room (a Python int, bit = cell), so a collision test is a
+shift and a mask whatever the number of snakes.
+
+Clients get a keyframe (the whole room) when they join and then one delta
+per tick holding only what changed, encoded once per room and shared by
+its subscribers. Each subscriber has a bounded queue; a client that falls
+``ARENA_SEND_QUEUE`` messages behind has its backlog replaced by a fresh
+keyframe, so a slow connection never delays the tick or grows memory.
+
+Rooms live in the worker's memory: with several uvicorn workers, players
+only meet if their connections land on the same worker.
+"""
+
+import asyncio
+import os
+import random
+from collections import Counter, deque
+from typing import Dict, List, Optional
+
+import orjson
+from models import GameMode
+from snake_engine import FOOD_POINTS, seed_state, xorshift32
+
+# Board width and height
+GRID_SIZE = int(os.getenv("ARENA_GRID_SIZE", "32"))
+# Most players in a room
+ROOM_PLAYERS = int(os.getenv("ARENA_ROOM_PLAYERS", "8"))
+# Milliseconds between ticks, and the time a tick may take
+TICK_SECONDS = float(os.getenv("ARENA_TICK_MS", "150")) / 1000
+TICK_BUDGET_SECONDS = float(os.getenv("ARENA_TICK_BUDGET_MS", "50")) / 1000
+# Ticks a dead snake waits before it respawns
+RESPAWN_TICKS = int(os.getenv("ARENA_RESPAWN_TICKS", "10"))
+# Messages queued per client before it is resynced with a keyframe
+SEND_QUEUE = int(os.getenv("ARENA_SEND_QUEUE", "16"))
+
+CELLS = GRID_SIZE * GRID_SIZE
+_DX = (0, 1, 0, -1)
+_DY = (-1, 0, 1, 0)
+
+
+class RoomFull(Exception):
+    pass
+
+
+class Player:
+    """A snake in a room"""
+
+    __slots__ = ("id", "name", "body", "direction", "turn_to", "score", "respawn_at")
+
+    def __init__(self, player_id: int, name: str):
+        self.id = player_id
+        self.name = name
+        self.body = deque()
+        self.direction = 1
+        self.turn_to = 1
+        self.score = 0
+        self.respawn_at = 0
+
+    @property
+    def alive(self) -> bool:
+        return bool(self.body)
+
+
+class Subscriber:
+    """Bounded outgoing message queue of one connection"""
+
+    def __init__(self, room: "Room"):
+        self.room = room
+        self.messages = deque()
+        self.resyncs = 0
+        self._ready = asyncio.Event()
+
+    def push(self, message: str):
+        if len(self.messages) >= SEND_QUEUE:
+            # Too far behind for deltas to be worth sending: start over
+            self.messages.clear()
+            message = self.room.keyframe()
+            self.resyncs += 1
+        self.messages.append(message)
+        self._ready.set()
+
+    async def get(self) -> str:
+        """Next message, waiting for one if needed"""
+        while not self.messages:
+            self._ready.clear()
+            await self._ready.wait()
+        return self.messages.popleft()
+
+
+class Room:
+    """Shared board, its snakes and subscribers"""
+
+    def __init__(self, room_id: str, game_mode: GameMode, seed: Optional[int] = None):
+        self.id = room_id
+        self.game_mode = GameMode(game_mode)
+        self.wraps = self.game_mode == GameMode.PASS_THROUGH
+        self.points = FOOD_POINTS[self.game_mode]
+        self.tick = 0
+        self.players: Dict[int, Player] = {}
+        self.subscribers: List[Subscriber] = []
+        self.occupied = 0
+        self._rng = seed_state(random.getrandbits(32) if seed is None else seed)
+        self._next_player = 1
+        self.food = self._free_cell()
+
+    def _free_cell(self) -> int:
+        """A random unoccupied cell (any cell if the board is full)"""
+        for _ in range(8):
+            self._rng = xorshift32(self._rng)
+            cell = self._rng % CELLS
+            if not self.occupied >> cell & 1:
+                return cell
+        free = [cell for cell in range(CELLS) if not self.occupied >> cell & 1]
+        return free[self._rng % len(free)] if free else cell
+
+    def _spawn(self, player: Player):
+        cell = self._free_cell()
+        player.body = deque([cell])
+        player.direction = player.turn_to = 1
+        self.occupied |= 1 << cell
+
+    def _clear(self, player: Player):
+        for cell in player.body:
+            self.occupied &= ~(1 << cell)
+        player.body.clear()
+
+    def join(self, name: str) -> Player:
+        if len(self.players) >= ROOM_PLAYERS:
+            raise RoomFull(self.id)
+        player = Player(self._next_player, name)
+        self._next_player += 1
+        self.players[player.id] = player
+        self._spawn(player)
+        return player
+
+    def leave(self, player_id: int):
+        player = self.players.pop(player_id, None)
+        if player is not None:
+            self._clear(player)
+
+    def turn(self, player_id: int, direction: int):
+        """Set the direction a player takes next tick"""
+        player = self.players.get(player_id)
+        if player is not None and 0 <= direction < 4:
+            player.turn_to = direction
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(self)
+        subscriber.push(self.keyframe())
+        self.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.remove(subscriber)
+
+    def _next_cell(self, player: Player) -> Optional[int]:
+        head = player.body[0]
+        x = head % GRID_SIZE + _DX[player.direction]
+        y = head // GRID_SIZE + _DY[player.direction]
+        if self.wraps:
+            x, y = x % GRID_SIZE, y % GRID_SIZE
+        elif not (0 <= x < GRID_SIZE and 0 <= y < GRID_SIZE):
+            return None
+        return y * GRID_SIZE + x
+
+    def step(self) -> dict:
+        """Advance one tick; returns the delta"""
+        self.tick += 1
+        heads = {}
+        for player in self.players.values():
+            if player.body:
+                if player.turn_to != (player.direction + 2) % 4:
+                    player.direction = player.turn_to
+                heads[player.id] = self._next_cell(player)
+
+        # Collisions are against the board before anyone moves
+        contested = Counter(heads.values())
+        dead = [
+            player_id
+            for player_id, cell in heads.items()
+            if cell is None or self.occupied >> cell & 1 or contested[cell] > 1
+        ]
+        for player_id in dead:
+            player = self.players[player_id]
+            self._clear(player)
+            player.respawn_at = self.tick + RESPAWN_TICKS
+            del heads[player_id]
+
+        moved, scores, food = [], [], None
+        for player_id, cell in heads.items():
+            player = self.players[player_id]
+            player.body.appendleft(cell)
+            self.occupied |= 1 << cell
+            grew = cell == self.food
+            if grew:
+                player.score += self.points
+                scores.append([player_id, player.score])
+                food = True
+            else:
+                self.occupied &= ~(1 << player.body.pop())
+            moved.append([player_id, cell, int(grew)])
+        if food:
+            self.food = self._free_cell()
+
+        spawned = []
+        for player in self.players.values():
+            if not player.alive and player.respawn_at <= self.tick:
+                self._spawn(player)
+                spawned.append([player.id, player.body[0]])
+
+        delta = {"t": self.tick}
+        if moved:
+            delta["m"] = moved
+        if dead:
+            delta["x"] = dead
+        if spawned:
+            delta["s"] = spawned
+        if scores:
+            delta["p"] = scores
+        if food:
+            delta["f"] = self.food
+        return delta
+
+    def keyframe(self) -> str:
+        """The whole room, as sent to a client that (re)joins"""
+        return orjson.dumps(
+            {
+                "t": self.tick,
+                "k": 1,
+                "room": self.id,
+                "mode": self.game_mode,
+                "grid": GRID_SIZE,
+                "f": self.food,
+                "players": [
+                    {
+                        "id": player.id,
+                        "name": player.name,
+                        "body": list(player.body),
+                        "d": player.direction,
+                        "score": player.score,
+                    }
+                    for player in self.players.values()
+                ],
+            }
+        ).decode()
+
+
+def _percentiles(samples) -> dict:
+    ordered = sorted(samples)
+    if not ordered:
+        return {"p50": 0.0, "p99": 0.0, "max": 0.0}
+
+    def at(fraction):
+        return round(
+            ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000, 3
+        )
+
+    return {"p50": at(0.5), "p99": at(0.99), "max": round(ordered[-1] * 1000, 3)}
+
+
+class TickScheduler:
+    """Advances every room of the worker on one fixed-rate asyncio task"""
+
+    def __init__(
+        self, interval: float = TICK_SECONDS, budget: float = TICK_BUDGET_SECONDS
+    ):
+        self.interval = interval
+        self.budget = budget
+        self.rooms: Dict[str, Room] = {}
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        # Recent ticks: seconds late, and seconds taken
+        self.jitter = deque(maxlen=1000)
+        self.durations = deque(maxlen=1000)
+        self._task: Optional[asyncio.Task] = None
+
+    def room(self, room_id: str, game_mode: GameMode = GameMode.WALLS) -> Room:
+        """The room with this id, created (and ticking) if needed"""
+        room = self.rooms.get(room_id)
+        if room is None:
+            room = self.rooms[room_id] = Room(room_id, game_mode)
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        return room
+
+    def release(self, room: Room):
+        """Drop a room once nobody plays or watches it"""
+        if not room.players and not room.subscribers:
+            self.rooms.pop(room.id, None)
+
+    def tick_all(self):
+        """Step every room and queue its delta for its subscribers"""
+        for room in list(self.rooms.values()):
+            delta = room.step()
+            if room.subscribers:
+                message = orjson.dumps(delta).decode()
+                for subscriber in room.subscribers:
+                    subscriber.push(message)
+        self.ticks += 1
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.interval
+        while True:
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+            started = loop.time()
+            self.jitter.append(max(0.0, started - deadline))
+            self.tick_all()
+            finished = loop.time()
+            self.durations.append(finished - started)
+            if finished - started > self.budget:
+                self.overruns += 1
+
+            deadline += self.interval
+            if finished > deadline:
+                # Fell a whole tick behind: skip ticks rather than burst
+                missed = int((finished - deadline) // self.interval) + 1
+                self.skipped += missed
+                deadline += missed * self.interval
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.rooms.clear()
+
+    def stats(self) -> dict:
+        """Room counts and tick timing (milliseconds, over recent ticks)"""
+        return {
+            "rooms": len(self.rooms),
+            "players": sum(len(room.players) for room in self.rooms.values()),
+            "ticks": self.ticks,
+            "tick_ms": self.interval * 1000,
+            "budget_ms": self.budget * 1000,
+            "jitter_ms": _percentiles(self.jitter),
+            "duration_ms": _percentiles(self.durations),
+            "overruns": self.overruns,
+            "skipped_ticks": self.skipped,
+            "resyncs": sum(
+                subscriber.resyncs
+                for room in self.rooms.values()
+                for subscriber in room.subscribers
+            ),
+        }
+
+
+scheduler = TickScheduler()
@@ -0,0 +1,123 @@
+"""
+Async CRUD operations for the async routers
+
+Each function runs the matching ``crud`` function on an ``AsyncSession``
+through ``run_sync``: the queries and their side effects (rank counters,
+user stats, in-memory leaderboard structures) stay defined once in crud,
+while every database round trip is awaited on the async driver instead of
+blocking the event loop.
+"""
+
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import auth
+import crud
+import models
+import schemas
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+# User operations
+async def get_user_by_username(
+    db: AsyncSession, username: str
+) -> Optional[models.User]:
+    """Get a user by username"""
+    return await db.run_sync(crud.get_user_by_username, username)
+
+
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[models.User]:
+    """Get a user by email"""
+    return await db.run_sync(crud.get_user_by_email, email)
+
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate) -> models.User:
+    """Create a new user, hashing the password in the hashing pool"""
+    hashed_password = await auth.get_password_hash_async(user.password)
+    return await db.run_sync(crud.create_user, user, hashed_password)
+
+
+async def authenticate_user(
+    db: AsyncSession, username: str, password: str
+) -> Optional[models.User]:
+    """Authenticate a user, verifying the password in the hashing pool"""
+    user = await get_user_by_username(db, username)
+    if not user:
+        return None
+    if not await auth.verify_password_async(password, user.hashed_password):
+        return None
+    return user
+
+
+# Game operations
+async def get_game(db: AsyncSession, game_id: int) -> Optional[models.Game]:
+    """Get a game by ID"""
+    return await db.run_sync(crud.get_game, game_id)
+
+
+async def get_games_by_user(
+    db: AsyncSession,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    before: Optional[Tuple[datetime, int]] = None,
+) -> List[models.Game]:
+    """Get all games for a specific user, newest first"""
+    return await db.run_sync(crud.get_games_by_user, user_id, skip, limit, before)
+
+
+async def create_game(db: AsyncSession, game: schemas.GameCreate) -> models.Game:
+    """Create a new game"""
+    return await db.run_sync(crud.create_game, game)
+
+
+async def update_game(
+    db: AsyncSession, game_id: int, game_update: schemas.GameUpdate
+) -> Optional[models.Game]:
+    """Update a game"""
+    return await db.run_sync(crud.update_game, game_id, game_update)
+
+
+async def finish_game(
+    db: AsyncSession,
+    game_id: int,
+    final_score: Optional[int],
+    snake_length: Optional[int],
+    username: str,
+    progress: Optional[dict] = None,
+) -> Optional[Tuple[models.Game, Optional[models.LeaderboardEntry]]]:
+    """Complete a game and submit a positive score, in one transaction"""
+    return await db.run_sync(
+        crud.finish_game, game_id, final_score, snake_length, username, progress
+    )
+
+
+async def mark_replay_verified(
+    db: AsyncSession, game_id: int, user_id: int, score: int, snake_length: int
+) -> bool:
+    """Record that a game's replay reproduces its score and length; False if
+    the game's result changed since it was checked"""
+    marked = await db.run_sync(
+        crud.mark_replays_verified, [(game_id, user_id, score, snake_length)]
+    )
+    return marked == 1
+
+
+async def create_completed_games(
+    db: AsyncSession, user_id: int, username: str, games: List[schemas.CompletedGame]
+) -> List[Tuple[models.Game, Optional[models.LeaderboardEntry]]]:
+    """Store games played offline and submit their scores, in one transaction"""
+    return await db.run_sync(crud.create_completed_games, user_id, username, games)
+
+
+# Leaderboard operations
+async def game_has_leaderboard_entry(db: AsyncSession, game_id: int) -> bool:
+    """Whether a game's score was submitted to the leaderboard"""
+    return await db.run_sync(crud.game_has_leaderboard_entry, game_id)
+
+
+async def get_score_percentile(
+    db: AsyncSession, game_mode: models.GameMode, score: int
+) -> dict:
+    """Get the share of entries in a game mode scoring below a score"""
+    return await db.run_sync(crud.get_score_percentile, game_mode, score)
@@ -2,38 +2,116 @@
 Authentication utilities for JWT token management and password hashing
 """
 
+import asyncio
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 
-import crud
-from database import get_db
+import async_crud
+import cache
+import schemas
+import versions
+from database import get_async_db
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from passwords import get_password_hash, verify_password
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # JWT Configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing pool: bcrypt runs in separate processes so a burst of
+# logins uses at most this many cores and never holds up game requests
+PASSWORD_HASH_WORKERS = int(
+    os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2)))
+)
+# Hashing requests allowed in flight (running + queued) before returning 503
+PASSWORD_HASH_MAX_PENDING = int(
+    os.getenv("PASSWORD_HASH_MAX_PENDING", str(PASSWORD_HASH_WORKERS * 16))
+)
 
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
-
-
-def get_password_hash(password: str) -> str:
-    """Hash a password"""
-    return pwd_context.hash(password)
+class PasswordHashPool:
+    """Size-capped process pool for bcrypt with queue-depth backpressure"""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: the app process runs threads, which fork doesn't mix with
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def run(self, func, *args):
+        """Run func(*args) in the pool, or fail fast with 503 when saturated"""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many authentication requests, try again shortly",
+                headers={"Retry-After": "1"},
+            )
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._get_executor(), func, *args)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+        self.completed += 1
+        return result
+
+    def stats(self) -> dict:
+        """Pool size, queue depth and counters"""
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "queued": max(0, self.pending - self.workers),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        """Stop the worker processes (started again on the next use)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+password_pool = PasswordHashPool(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password against its hash in the hashing pool"""
+    return await password_pool.run(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password in the hashing pool"""
+    return await password_pool.run(get_password_hash, password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -59,7 +137,7 @@ def decode_access_token(token: str) -> Optional[dict]:
 
 
 async def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)
 ):
     """Get the current authenticated user from JWT token"""
     credentials_exception = HTTPException(
@@ -68,21 +146,52 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    payload = decode_access_token(token)
+    payload = cache.auth_tokens.get(token)
     if payload is None:
-        raise credentials_exception
+        payload = decode_access_token(token)
+        if payload is None:
+            raise credentials_exception
+        # Never keep claims past the token's own expiry
+        expires_in = payload.get("exp", 0) - datetime.utcnow().timestamp()
+        cache.auth_tokens.set(
+            token, payload, ttl=min(cache.auth_tokens.ttl, expires_in)
+        )
 
     username: str = payload.get("sub")
     if username is None:
         raise credentials_exception
 
-    user = crud.get_user_by_username(db, username=username)
+    version, user = cached_user(username)
     if user is None:
-        raise credentials_exception
+        db_user = await async_crud.get_user_by_username(db, username=username)
+        if db_user is None:
+            raise credentials_exception
+        user = schemas.User.model_validate(db_user)
+        cache_user(username, version, user)
 
     return user
 
 
+def cached_user(username: str) -> Tuple[int, Optional[schemas.User]]:
+    """The account's shared version, and this worker's snapshot of the user
+    row if it was taken at that version.
+
+    crud.update_user/delete_user bump the version, so a change made on any
+    worker (deactivation, rename, deletion) is seen by every worker's next
+    request, not after the cache's TTL.
+    """
+    version = versions.counters.version(versions.account_scope(username))
+    cached = cache.auth_users.get(username)
+    if cached is not None and cached[0] == version:
+        return version, cached[1]
+    return version, None
+
+
+def cache_user(username: str, version: int, user: schemas.User):
+    """Keep a user snapshot read at version (from cached_user)"""
+    cache.auth_users.set(username, (version, user))
+
+
 async def get_current_active_user(current_user=Depends(get_current_user)):
     """Get the current active user"""
     if not current_user.is_active:
@@ -90,3 +199,12 @@ async def get_current_active_user(current_user=Depends(get_current_user)):
             status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user"
         )
     return current_user
+
+
+async def get_current_admin_user(current_user=Depends(get_current_active_user)):
+    """Get the current user, who must be an admin (users.is_admin)"""
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required"
+        )
+    return current_user
@@ -0,0 +1,94 @@
+"""
+Benchmark the arena tick scheduler: many rooms on one worker
+
+Opens --rooms rooms of --players bot players each, with one subscriber per
+player whose queue is drained by a consumer task (standing in for the
+WebSocket writers), then runs arena.TickScheduler for --seconds and reports
+tick jitter (how late each tick started), tick duration against the
+budget, overruns and skipped ticks.
+
+Usage:
+    cd backend
+    uv run python benchmarks/bench_arena.py
+    uv run python benchmarks/bench_arena.py --rooms 2000 --players 8 --tick-ms 100
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import arena
+from models import GameMode
+
+
+async def drain(subscriber: arena.Subscriber):
+    while True:
+        await subscriber.get()
+
+
+async def bots(scheduler: arena.TickScheduler, rng: random.Random):
+    """Turn a few snakes each tick, like players would"""
+    players = [
+        (room, player_id)
+        for room in scheduler.rooms.values()
+        for player_id in room.players
+    ]
+    while True:
+        for room, player_id in rng.sample(players, max(1, len(players) // 10)):
+            room.turn(player_id, rng.randrange(4))
+        await asyncio.sleep(scheduler.interval)
+
+
+async def run(args) -> dict:
+    scheduler = arena.TickScheduler(args.tick_ms / 1000, args.budget_ms / 1000)
+    rng = random.Random(args.rooms)
+    consumers = []
+    for number in range(args.rooms):
+        room = scheduler.room(str(number), rng.choice(list(GameMode)))
+        for player in range(args.players):
+            room.join(f"bot{player}")
+            consumers.append(asyncio.create_task(drain(room.subscribe())))
+    consumers.append(asyncio.create_task(bots(scheduler, rng)))
+
+    await asyncio.sleep(args.seconds)
+    stats = scheduler.stats()
+    for task in consumers:
+        task.cancel()
+    await scheduler.stop()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rooms", type=int, default=1000)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--tick-ms", type=float, default=arena.TICK_SECONDS * 1000)
+    parser.add_argument(
+        "--budget-ms", type=float, default=arena.TICK_BUDGET_SECONDS * 1000
+    )
+    args = parser.parse_args()
+
+    stats = asyncio.run(run(args))
+    print(
+        f"{args.rooms} rooms x {args.players} players, {stats['ticks']} ticks "
+        f"of {args.tick_ms:.0f} ms (budget {args.budget_ms:.0f} ms)"
+    )
+    print(f"{'ms':>12} {'p50':>8} {'p99':>8} {'max':>8}")
+    for name in ("jitter_ms", "duration_ms"):
+        row = stats[name]
+        print(
+            f"{name[:-3]:>12} {row['p50']:>8.2f} {row['p99']:>8.2f} {row['max']:>8.2f}"
+        )
+    print(
+        f"overruns {stats['overruns']}, skipped ticks {stats['skipped_ticks']}, "
+        f"resyncs {stats['resyncs']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark end-of-game latency against leaderboards of increasing size
+
+Runs the same CRUD call as POST /api/games/{id}/end (finish_game) against a
+scratch SQLite database pre-filled with N leaderboard entries, and reports
+latency per table size. --legacy runs the old sequence instead:
+complete_game, create_leaderboard_entry and a full rank rewrite, each
+committing separately.
+
+Usage:
+    cd backend
+    uv run python benchmarks/bench_end_game.py
+    uv run python benchmarks/bench_end_game.py --sizes 1000,100000 --legacy
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import crud
+import models
+import schemas
+from database import Base
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+BATCH_SIZE = 50_000
+
+
+def random_score(rng: random.Random) -> int:
+    """Long-tailed score distribution in food-sized steps"""
+    return int(rng.lognormvariate(4.5, 0.8)) // 5 * 5
+
+
+def populate(session, size: int, user_id: int, rng: random.Random):
+    """Bulk insert size leaderboard entries for the walls mode"""
+    table = models.LeaderboardEntry.__table__
+    for start in range(0, size, BATCH_SIZE):
+        rows = [
+            {
+                "user_id": user_id,
+                "score": random_score(rng),
+                "snake_length": 1,
+                "game_mode": models.GameMode.WALLS,
+            }
+            for _ in range(min(BATCH_SIZE, size - start))
+        ]
+        session.execute(insert(table), rows)
+    session.commit()
+    crud.rebuild_leaderboard_score_counts(session)
+
+
+def run(size: int, iterations: int, legacy: bool) -> list:
+    """Return end-of-game latencies in milliseconds for one table size"""
+    rng = random.Random(size)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+        user = models.User(username="bench", hashed_password="x")
+        session.add(user)
+        session.commit()
+        populate(session, size, user.id, rng)
+
+        timings = []
+        for _ in range(iterations):
+            game = crud.create_game(
+                session,
+                schemas.GameCreate(user_id=user.id, game_mode=models.GameMode.WALLS),
+            )
+            score = random_score(rng)
+
+            started = time.perf_counter()
+            if legacy:
+                crud.complete_game(session, game.id, final_score=score, snake_length=1)
+                crud.create_leaderboard_entry(
+                    session,
+                    schemas.LeaderboardEntryCreate(
+                        user_id=user.id,
+                        game_id=game.id,
+                        score=score,
+                        snake_length=1,
+                        game_mode=models.GameMode.WALLS,
+                    ),
+                )
+                crud.update_leaderboard_ranks(session, models.GameMode.WALLS)
+            else:
+                crud.finish_game(
+                    session,
+                    game.id,
+                    final_score=score,
+                    snake_length=1,
+                    username=user.username,
+                )
+            timings.append((time.perf_counter() - started) * 1000)
+
+        session.close()
+        engine.dispose()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument(
+        "--legacy",
+        action="store_true",
+        help="separate commits plus a full rank rewrite (the old behaviour)",
+    )
+    args = parser.parse_args()
+
+    print(f"{'entries':>10} {'mean ms':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    for size in (int(value) for value in args.sizes.split(",")):
+        timings = sorted(run(size, args.iterations, args.legacy))
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        print(
+            f"{size:>10} {statistics.mean(timings):>10.3f} "
+            f"{statistics.median(timings):>10.3f} {p99:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
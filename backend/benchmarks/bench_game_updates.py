@@ -0,0 +1,106 @@
+"""
+Benchmark game progress updates: write-through versus write-behind
+
+Plays N concurrent games against a scratch SQLite database, sending a
+progress update per game per tick. Write-through commits every update
+(crud.update_game, what PATCH /api/games/{id} does by default); write-behind
+merges them in write_behind.GameUpdateBuffer and flushes every --flush-every
+ticks (GAME_WRITE_BEHIND=1). Reports updates per second for both.
+
+Usage:
+    cd backend
+    uv run python benchmarks/bench_game_updates.py
+    uv run python benchmarks/bench_game_updates.py --games 200 --ticks 100
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import crud
+import models
+import schemas
+from database import Base
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from write_behind import GameUpdateBuffer
+
+
+def setup(directory: str, name: str, games: int):
+    engine = create_engine(f"sqlite:///{os.path.join(directory, name)}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+    user = models.User(username="bench", hashed_password="x")
+    session.add(user)
+    session.commit()
+    game_ids = [
+        crud.create_game(
+            session,
+            schemas.GameCreate(user_id=user.id, game_mode=models.GameMode.WALLS),
+        ).id
+        for _ in range(games)
+    ]
+    return engine, session, user.id, game_ids
+
+
+def write_through(session, game_ids, ticks: int) -> float:
+    started = time.perf_counter()
+    for tick in range(1, ticks + 1):
+        for game_id in game_ids:
+            crud.update_game(
+                session,
+                game_id,
+                schemas.GameUpdate(score=tick * 10, moves_count=tick),
+            )
+    return time.perf_counter() - started
+
+
+def write_behind(session, user_id, game_ids, ticks: int, flush_every: int) -> float:
+    buffer = GameUpdateBuffer(enabled=True)
+    started = time.perf_counter()
+    for tick in range(1, ticks + 1):
+        for game_id in game_ids:
+            buffer.put(game_id, user_id, {"score": tick * 10, "moves_count": tick})
+        if tick % flush_every == 0:
+            buffer.flush(session)
+    buffer.flush(session)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--ticks", type=int, default=50)
+    parser.add_argument(
+        "--flush-every", type=int, default=10, help="ticks between flushes"
+    )
+    args = parser.parse_args()
+    updates = args.games * args.ticks
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, session, _, game_ids = setup(tmp, "through.db", args.games)
+        through = write_through(session, game_ids, args.ticks)
+        session.close()
+        engine.dispose()
+
+        engine, session, user_id, game_ids = setup(tmp, "behind.db", args.games)
+        behind = write_behind(session, user_id, game_ids, args.ticks, args.flush_every)
+        stored = session.get(models.Game, game_ids[-1]).score
+        assert stored == args.ticks * 10, stored
+        session.close()
+        engine.dispose()
+
+    print(f"{updates} updates ({args.games} games x {args.ticks} ticks)")
+    print(f"{'mode':>14} {'seconds':>10} {'updates/s':>12}")
+    print(f"{'write-through':>14} {through:>10.3f} {updates / through:>12.0f}")
+    print(f"{'write-behind':>14} {behind:>10.3f} {updates / behind:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
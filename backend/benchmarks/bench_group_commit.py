@@ -0,0 +1,104 @@
+"""
+Benchmark finishing games one commit at a time versus in group commits
+
+Finishes N games with leaderboard entries against a scratch SQLite
+database: one crud.finish_game per game (what POST /api/games/{id}/end does
+by default), then crud.finish_games over batches of --batch games (what
+group_commit does with LEADERBOARD_GROUP_COMMIT=1). Reports games per
+second for both.
+
+Usage:
+    cd backend
+    uv run python benchmarks/bench_group_commit.py
+    uv run python benchmarks/bench_group_commit.py --games 5000 --batch 64
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import crud
+import models
+import schemas
+from database import Base
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+
+def setup(directory: str, name: str, games: int):
+    engine = create_engine(f"sqlite:///{os.path.join(directory, name)}")
+    Base.metadata.create_all(bind=engine)
+    # Like database.AsyncSessionLocal, which end_game runs on
+    session = sessionmaker(
+        autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+    )()
+
+    user = models.User(username="bench", hashed_password="x")
+    session.add(user)
+    session.commit()
+    game_ids = [
+        crud.create_game(
+            session,
+            schemas.GameCreate(user_id=user.id, game_mode=models.GameMode.WALLS),
+        ).id
+        for _ in range(games)
+    ]
+    return engine, session, game_ids
+
+
+def one_by_one(session, game_ids, scores) -> float:
+    started = time.perf_counter()
+    for game_id, score in zip(game_ids, scores):
+        crud.finish_game(session, game_id, score, 1, "bench")
+    return time.perf_counter() - started
+
+
+def grouped(session, game_ids, scores, batch: int) -> float:
+    started = time.perf_counter()
+    for start in range(0, len(game_ids), batch):
+        ids = game_ids[start : start + batch]
+        games = crud.get_games_for_update(session, ids)
+        crud.finish_games(
+            session,
+            [
+                (games[game_id], score, 1, "bench")
+                for game_id, score in zip(ids, scores[start : start + batch])
+            ],
+        )
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--games", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=32, help="games per commit")
+    args = parser.parse_args()
+    rng = random.Random(args.games)
+    scores = [rng.randrange(5, 500, 5) for _ in range(args.games)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, session, game_ids = setup(tmp, "single.db", args.games)
+        single = one_by_one(session, game_ids, scores)
+        session.close()
+        engine.dispose()
+
+        engine, session, game_ids = setup(tmp, "grouped.db", args.games)
+        group = grouped(session, game_ids, scores, args.batch)
+        assert crud.check_leaderboard_score_counts(session) == []
+        session.close()
+        engine.dispose()
+
+    print(f"{args.games} games, group commits of {args.batch}")
+    print(f"{'mode':>14} {'seconds':>10} {'games/s':>10}")
+    print(f"{'one by one':>14} {single:>10.3f} {args.games / single:>10.0f}")
+    print(f"{'grouped':>14} {group:>10.3f} {args.games / group:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
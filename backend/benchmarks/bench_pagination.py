@@ -0,0 +1,118 @@
+"""
+Benchmark deep pages of game history: OFFSET versus cursor
+
+Fills a scratch SQLite database with one player's game history and times
+crud.get_games_by_user for increasingly deep pages, once with skip (OFFSET)
+and once with the keyset cursor of the previous page.
+
+Usage:
+    cd backend
+    uv run python benchmarks/bench_pagination.py
+    uv run python benchmarks/bench_pagination.py --games 500000 --pages 1,10,100,10000
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import crud
+import models
+from database import Base
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+BATCH_SIZE = 50_000
+
+
+def populate(session, user_id: int, games: int):
+    """Bulk insert a game history, one game per minute"""
+    table = models.Game.__table__
+    started = datetime(2024, 1, 1)
+    for start in range(0, games, BATCH_SIZE):
+        session.execute(
+            insert(table),
+            [
+                {
+                    "user_id": user_id,
+                    "game_mode": models.GameMode.WALLS,
+                    "score": 0,
+                    "snake_length": 1,
+                    "moves_count": 0,
+                    "food_eaten": 0,
+                    "is_completed": True,
+                    "started_at": started + timedelta(minutes=i),
+                }
+                for i in range(start, min(start + BATCH_SIZE, games))
+            ],
+        )
+    session.commit()
+
+
+def time_ms(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--games", type=int, default=250_000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--pages", default="1,10,100,1000,10000")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+        user = models.User(username="bench", hashed_password="x")
+        session.add(user)
+        session.commit()
+        populate(session, user.id, args.games)
+
+        print(f"{'page':>8} {'offset ms':>10} {'cursor ms':>10}")
+        for page in (int(value) for value in args.pages.split(",")):
+            skip = (page - 1) * args.limit
+            if skip >= args.games:
+                break
+
+            # Cursor of the previous page, looked up once outside the timing
+            before = None
+            if skip:
+                previous = crud.get_games_by_user(
+                    session, user.id, skip=skip - 1, limit=1
+                )
+                before = (previous[0].started_at, previous[0].id)
+
+            offset_ms = time_ms(
+                lambda: crud.get_games_by_user(
+                    session, user.id, skip=skip, limit=args.limit
+                ),
+                args.repeat,
+            )
+            cursor_ms = time_ms(
+                lambda: crud.get_games_by_user(
+                    session, user.id, limit=args.limit, before=before
+                ),
+                args.repeat,
+            )
+            print(f"{page:>8} {offset_ms:>10.3f} {cursor_ms:>10.3f}")
+
+        session.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
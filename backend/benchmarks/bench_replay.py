@@ -0,0 +1,83 @@
+"""
+Benchmark replay verification: one game at a time versus vectorized batches
+
+Generates N move logs with a greedy bot (snake_engine.SnakeGame), then
+verifies every claimed result with snake_engine.verify (plain Python, one
+game at a time) and snake_engine.verify_batch over batches of --batch
+games (NumPy). Reports replays and ticks per second for both.
+
+Usage:
+    cd backend
+    uv run python benchmarks/bench_replay.py
+    uv run python benchmarks/bench_replay.py --games 20000 --batch 4096
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from models import GameMode
+from snake_engine import Claim, Direction, SnakeGame, position, verify, verify_batch
+
+
+def bot_game(rng: random.Random) -> Claim:
+    """A claim backed by a greedy bot's move log"""
+    game_mode = rng.choice(list(GameMode))
+    seed = rng.getrandbits(32)
+    game = SnakeGame(game_mode, seed)
+    moves = []
+    while game.alive:
+        safe = [
+            d
+            for d in Direction
+            if game.turn(d) == d and game.is_free(game.next_cell(d))
+        ]
+        if not safe or rng.random() < 0.01:
+            move = rng.choice(list(Direction))
+        else:
+            fx, fy = position(game.food)
+            move = min(
+                safe,
+                key=lambda d: sum(
+                    abs(a - b) for a, b in zip(position(game.next_cell(d)), (fx, fy))
+                ),
+            )
+        moves.append(move)
+        game.step(move)
+    return Claim(game_mode, seed, bytes(moves), game.score, game.snake_length)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--games", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=2048, help="games per batch")
+    args = parser.parse_args()
+
+    rng = random.Random(args.games)
+    claims = [bot_game(rng) for _ in range(args.games)]
+    ticks = sum(len(claim.moves) for claim in claims)
+
+    started = time.perf_counter()
+    assert all(verify(claim) for claim in claims)
+    single = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for start in range(0, len(claims), args.batch):
+        assert all(verify_batch(claims[start : start + args.batch]))
+    batched = time.perf_counter() - started
+
+    print(f"{args.games} games, {ticks} ticks ({ticks / args.games:.0f} per game)")
+    print(f"{'mode':>12} {'seconds':>10} {'replays/s':>12} {'ticks/s':>12}")
+    for name, seconds in (("one by one", single), ("batched", batched)):
+        print(
+            f"{name:>12} {seconds:>10.3f} {args.games / seconds:>12.0f} "
+            f"{ticks / seconds:>12.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Load test for concurrent game start/end traffic
+
+Signs up a set of players, then runs many concurrent start -> end game
+cycles and reports per-endpoint latency percentiles. Without --url the app
+is driven in-process through httpx's ASGI transport against a scratch
+SQLite database; pass --url to load a running server instead.
+
+Usage:
+    cd backend
+    uv run python benchmarks/load_games.py --concurrency 50 --games 20
+    uv run python benchmarks/load_games.py --url http://localhost:3000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+def percentile(timings: list, fraction: float) -> float:
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def timed(timings: list, request):
+    started = time.perf_counter()
+    response = await request
+    timings.append((time.perf_counter() - started) * 1000)
+    response.raise_for_status()
+    return response.json()
+
+
+async def sign_up(client: httpx.AsyncClient, index: int) -> dict:
+    credentials = {"username": f"load{index}", "password": "loadtest123"}
+    await client.post("/api/auth/signup", json=credentials)
+    response = await client.post("/api/auth/login/json", json=credentials)
+    response.raise_for_status()
+    token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    user = (await client.get("/api/auth/me", headers=headers)).json()
+    return {"id": user["id"], "headers": headers}
+
+
+async def play(client: httpx.AsyncClient, player: dict, games: int, timings: dict):
+    rng = random.Random(player["id"])
+    for _ in range(games):
+        mode = rng.choice(["walls", "pass-through"])
+        game = await timed(
+            timings["start"],
+            client.post(
+                "/api/games/start",
+                json={"user_id": player["id"], "game_mode": mode},
+                headers=player["headers"],
+            ),
+        )
+        score = rng.randrange(0, 60) * 5
+        await timed(
+            timings["end"],
+            client.post(
+                f"/api/games/{game['id']}/end",
+                json={"score": score, "snake_length": score // 10 + 1},
+                headers=player["headers"],
+            ),
+        )
+
+
+async def run(args):
+    if args.url:
+        transport = None
+        base_url = args.url
+    else:
+        from main import app
+
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://loadtest"
+
+    async with httpx.AsyncClient(
+        transport=transport, base_url=base_url, timeout=60
+    ) as client:
+        players = [await sign_up(client, i) for i in range(args.concurrency)]
+        timings = {"start": [], "end": []}
+
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(play(client, player, args.games, timings) for player in players)
+        )
+        elapsed = time.perf_counter() - started
+
+    total = sum(len(values) for values in timings.values())
+    print(f"{total} requests in {elapsed:.2f}s ({total / elapsed:.0f} req/s)")
+    print(f"{'endpoint':>10} {'mean ms':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    for name, values in timings.items():
+        print(
+            f"{name:>10} {statistics.mean(values):>10.2f} "
+            f"{percentile(values, 0.5):>10.2f} {percentile(values, 0.99):>10.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="base URL of a running server")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--games", type=int, default=10, help="games per player")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.url:
+            os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'load.db')}"
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
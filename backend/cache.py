@@ -0,0 +1,194 @@
+"""
+In-process caches
+
+``TTLCache`` is a thread-safe, size-bounded LRU cache whose entries also
+expire after a time-to-live. Every cache registers itself by name so the
+counters can be reported together (``stats``) and tests can reset them
+(``clear_all``).
+
+``QueryCache`` adds table tags: each entry records the tables its query
+read, and a write invalidates every entry tagged with a table it changed.
+
+Caches are per worker process: an invalidation only reaches the worker that
+made the change, so the TTL bounds how long other workers may serve a stale
+value.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+_MISSING = object()
+
+_registry: Dict[str, "TTLCache"] = {}
+
+
+class TTLCache:
+    """Size-bounded LRU cache with per-entry expiry and hit/miss counters"""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        _registry[name] = self
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value, or default if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self._discarded(key)
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Cache value, evicting the least recently used entry if full"""
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def _store(self, key: Hashable, value: Any, ttl: Optional[float]):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            evicted, _ = self._entries.popitem(last=False)
+            self._discarded(evicted)
+
+    def pop(self, key: Hashable):
+        """Drop a single entry"""
+        with self._lock:
+            if self._entries.pop(key, _MISSING) is not _MISSING:
+                self._discarded(key)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+            self._cleared()
+
+    def _discarded(self, key: Hashable):
+        """Called with the lock held when an entry is expired or evicted"""
+
+    def _cleared(self):
+        """Called with the lock held when every entry is dropped"""
+
+    def stats(self) -> dict:
+        """Size and hit/miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class QueryCache(TTLCache):
+    """TTLCache of query results tagged with the tables they read.
+
+    Reads take ``versions`` of their tables before querying and pass them to
+    ``set``; if a write invalidated one of the tables in between, the result
+    may predate the write and is not cached.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        super().__init__(name, maxsize, ttl)
+        self.invalidations = 0
+        self._tagged: Dict[str, Set[Hashable]] = {}
+        self._tags: Dict[Hashable, Tuple[str, ...]] = {}
+        self._versions: Dict[str, int] = {}
+
+    def versions(self, tables: Iterable[str]) -> Tuple[int, ...]:
+        """Current invalidation counters of tables"""
+        with self._lock:
+            return tuple(self._versions.get(table, 0) for table in tables)
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        tables: Tuple[str, ...] = (),
+        versions: Optional[Tuple[int, ...]] = None,
+        ttl: Optional[float] = None,
+    ):
+        """Cache value tagged with tables, unless they changed since versions"""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if versions is not None and versions != tuple(
+                self._versions.get(table, 0) for table in tables
+            ):
+                return
+            if self._entries.pop(key, _MISSING) is not _MISSING:
+                self._discarded(key)
+            self._tags[key] = tables
+            for table in tables:
+                self._tagged.setdefault(table, set()).add(key)
+            self._store(key, value, ttl)
+
+    def invalidate(self, *tables: str):
+        """Drop every entry that read one of tables"""
+        with self._lock:
+            self.invalidations += 1
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+                for key in self._tagged.pop(table, ()):
+                    if self._entries.pop(key, _MISSING) is not _MISSING:
+                        self._discarded(key)
+
+    def _discarded(self, key: Hashable):
+        for table in self._tags.pop(key, ()):
+            keys = self._tagged.get(table)
+            if keys is not None:
+                keys.discard(key)
+
+    def _cleared(self):
+        self._tagged.clear()
+        self._tags.clear()
+
+    def stats(self) -> dict:
+        """Size, hit/miss and invalidation counters"""
+        return {**super().stats(), "invalidations": self.invalidations}
+
+
+def stats() -> dict:
+    """Counters of every registered cache, by name"""
+    return {name: cache.stats() for name, cache in _registry.items()}
+
+
+def clear_all():
+    """Empty every registered cache"""
+    for cache in _registry.values():
+        cache.clear()
+
+
+# Authentication caches (see auth.get_current_user)
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "30"))
+
+# Decoded JWT claims by token
+auth_tokens = TTLCache("auth_tokens", AUTH_CACHE_SIZE, AUTH_CACHE_TTL_SECONDS)
+# (Shared version, user snapshot (id, username, is_active, ...)) by username,
+# see auth.cached_user
+auth_users = TTLCache("auth_users", AUTH_CACHE_SIZE, AUTH_CACHE_TTL_SECONDS)
+
+# Query results of read-heavy crud functions (see crud._cached)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "10000"))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "5"))
+
+queries = QueryCache("queries", QUERY_CACHE_SIZE, QUERY_CACHE_TTL_SECONDS)
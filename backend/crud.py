@@ -2,14 +2,76 @@
 CRUD operations for Snake Game database models
 """
 
+import bisect
+import copy
 from datetime import datetime
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 
+import cache
+import leaderboard_index
+import leaderboard_snapshot
 import models
 import schemas
-from auth import get_password_hash, verify_password
-from sqlalchemy import desc, func
-from sqlalchemy.orm import Session
+import score_sketch
+import versions
+from passwords import get_password_hash, verify_password
+from sqlalchemy import (
+    bindparam,
+    case,
+    desc,
+    false,
+    func,
+    insert,
+    inspect,
+    select,
+    true,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Result
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+_MISSING = object()
+
+
+# Query cache helpers
+def _cached(key: tuple, tables: Tuple[str, ...], load: Callable):
+    """Serve load() from the query cache, tagged with the tables it reads.
+
+    Values are copied into and out of the cache so callers never share them.
+    """
+    value = cache.queries.get(key, _MISSING)
+    if value is not _MISSING:
+        return copy.deepcopy(value)
+
+    table_versions = cache.queries.versions(tables)
+    value = load()
+    cache.queries.set(key, copy.deepcopy(value), tables, table_versions)
+    return value
+
+
+def _snapshot(instance) -> Optional[dict]:
+    """Column values of an ORM instance, for caching"""
+    if instance is None:
+        return None
+    return {
+        attr.key: getattr(instance, attr.key)
+        for attr in inspect(instance).mapper.column_attrs
+    }
+
+
+def _attach(db: Session, model, snapshot: Optional[dict]):
+    """Turn a cached snapshot back into an instance of db, without a SELECT"""
+    if snapshot is None:
+        return None
+    existing = db.identity_map.get(db.identity_key(model, snapshot["id"]))
+    if existing is not None:
+        return existing
+    instance = model(**snapshot)
+    make_transient_to_detached(instance)
+    return db.merge(instance, load=False)
 
 
 # User CRUD operations
@@ -28,20 +90,31 @@ def get_user_by_email(db: Session, email: str) -> Optional[models.User]:
     return db.query(models.User).filter(models.User.email == email).first()
 
 
-def get_users(db: Session, skip: int = 0, limit: int = 100) -> List[models.User]:
-    """Get all users with pagination"""
-    return db.query(models.User).offset(skip).limit(limit).all()
+def get_users(
+    db: Session, skip: int = 0, limit: int = 100, after_id: Optional[int] = None
+) -> List[models.User]:
+    """Get all users with pagination (keyset on id when after_id is given)"""
+    query = db.query(models.User).order_by(models.User.id)
+    if after_id is not None:
+        query = query.filter(models.User.id > after_id)
+    elif skip:
+        query = query.offset(skip)
+    return query.limit(limit).all()
 
 
-def create_user(db: Session, user: schemas.UserCreate) -> models.User:
+def create_user(
+    db: Session, user: schemas.UserCreate, hashed_password: Optional[str] = None
+) -> models.User:
     """Create a new user with hashed password"""
-    hashed_password = get_password_hash(user.password)
+    if hashed_password is None:
+        hashed_password = get_password_hash(user.password)
     db_user = models.User(
         username=user.username, email=user.email, hashed_password=hashed_password
     )
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    cache.queries.invalidate("users")
     return db_user
 
 
@@ -65,6 +138,7 @@ def update_user(
     if not db_user:
         return None
 
+    previous_username = db_user.username
     update_data = user_update.model_dump(exclude_unset=True)
     for field, value in update_data.items():
         setattr(db_user, field, value)
@@ -72,6 +146,40 @@ def update_user(
     db_user.updated_at = datetime.utcnow()
     db.commit()
     db.refresh(db_user)
+
+    cache.auth_users.pop(previous_username)
+    cache.queries.invalidate("users")
+    versions.counters.bump(
+        versions.user_scope(user_id),
+        versions.account_scope(previous_username),
+        versions.account_scope(db_user.username),
+    )
+    if "username" in update_data:
+        leaderboard_index.index.invalidate()
+        leaderboard_snapshot.snapshot.mark_dirty()
+        versions.counters.bump(
+            *(
+                versions.leaderboard_scope(game_mode)
+                for game_mode in [None, *models.GameMode]
+            )
+        )
+    return db_user
+
+
+def set_user_admin(db: Session, username: str, is_admin: bool) -> Optional[models.User]:
+    """Grant or revoke admin access to an existing user"""
+    db_user = get_user_by_username(db, username)
+    if not db_user:
+        return None
+
+    db_user.is_admin = is_admin
+    db_user.updated_at = datetime.utcnow()
+    db.commit()
+    db.refresh(db_user)
+
+    cache.auth_users.pop(username)
+    cache.queries.invalidate("users")
+    versions.counters.bump(versions.account_scope(username))
     return db_user
 
 
@@ -81,29 +189,97 @@ def delete_user(db: Session, user_id: int) -> bool:
     if not db_user:
         return False
 
+    # The user's leaderboard entries go with them, so drop them from the counts
+    removed = (
+        db.query(
+            models.LeaderboardEntry.game_mode,
+            models.LeaderboardEntry.score,
+            func.count(models.LeaderboardEntry.id),
+        )
+        .filter(models.LeaderboardEntry.user_id == user_id)
+        .group_by(models.LeaderboardEntry.game_mode, models.LeaderboardEntry.score)
+        .all()
+    )
+    for game_mode, score, count in removed:
+        _adjust_score_count(db, game_mode, score, -count)
+    db.query(models.LeaderboardScoreCount).filter(
+        models.LeaderboardScoreCount.entry_count <= 0
+    ).delete(synchronize_session=False)
+
+    username = db_user.username
     db.delete(db_user)
     db.commit()
+    cache.auth_users.pop(username)
+    versions.counters.bump(versions.account_scope(username))
+    cache.queries.invalidate(
+        "users",
+        "games",
+        "leaderboard_entries",
+        "leaderboard_score_counts",
+        "user_stats",
+    )
+    leaderboard_index.index.invalidate()
+    leaderboard_snapshot.snapshot.mark_dirty()
+    versions.counters.reset()
+    score_sketch.sketch.invalidate()
     return True
 
 
 # Game CRUD operations
 def get_game(db: Session, game_id: int) -> Optional[models.Game]:
-    """Get a game by ID"""
-    return db.query(models.Game).filter(models.Game.id == game_id).first()
+    """Get a game by ID, to read (cached; a hit is attached to db without a
+    SELECT). Writes load it with get_game_for_update instead."""
+    key = ("game", game_id)
+    snapshot = cache.queries.get(key, _MISSING)
+    if snapshot is not _MISSING:
+        return _attach(db, models.Game, snapshot)
+
+    table_versions = cache.queries.versions(("games",))
+    db_game = db.query(models.Game).filter(models.Game.id == game_id).first()
+    cache.queries.set(key, _snapshot(db_game), ("games",), table_versions)
+    return db_game
+
+
+def get_games_for_update(db: Session, game_ids: List[int]) -> Dict[int, models.Game]:
+    """Load games to write to, by ID: never from the cache, which may be
+    another worker's changes behind, and locked (SELECT ... FOR UPDATE where
+    the database supports it) until the transaction ends"""
+    query = (
+        db.query(models.Game)
+        .filter(models.Game.id.in_(game_ids))
+        .populate_existing()
+        .with_for_update()
+    )
+    return {db_game.id: db_game for db_game in query}
+
+
+def get_game_for_update(db: Session, game_id: int) -> Optional[models.Game]:
+    """Load a game to write to (see get_games_for_update)"""
+    return get_games_for_update(db, [game_id]).get(game_id)
 
 
 def get_games_by_user(
-    db: Session, user_id: int, skip: int = 0, limit: int = 100
+    db: Session,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    before: Optional[Tuple[datetime, int]] = None,
 ) -> List[models.Game]:
-    """Get all games for a specific user"""
-    return (
+    """Get all games for a specific user, newest first.
+
+    before is the (started_at, id) of the last game of the previous page;
+    it seeks on the (user_id, started_at, id) index instead of using OFFSET.
+    """
+    query = (
         db.query(models.Game)
         .filter(models.Game.user_id == user_id)
-        .order_by(desc(models.Game.started_at))
-        .offset(skip)
-        .limit(limit)
-        .all()
+        .order_by(desc(models.Game.started_at), desc(models.Game.id))
     )
+    if before is not None:
+        query = query.filter(tuple_(models.Game.started_at, models.Game.id) < before)
+    elif skip:
+        query = query.offset(skip)
+    return query.limit(limit).all()
 
 
 def create_game(db: Session, game: schemas.GameCreate) -> models.Game:
@@ -112,59 +288,430 @@ def create_game(db: Session, game: schemas.GameCreate) -> models.Game:
     db.add(db_game)
     db.commit()
     db.refresh(db_game)
+    cache.queries.invalidate("games")
+    versions.counters.bump(versions.user_scope(db_game.user_id))
     return db_game
 
 
 def update_game(
     db: Session, game_id: int, game_update: schemas.GameUpdate
 ) -> Optional[models.Game]:
-    """Update a game"""
-    db_game = get_game(db, game_id)
+    """Update a game.
+
+    Completing a game, or changing the score or length of a completed one,
+    updates user_stats like ending it does. Raises ValueError for an update
+    that would reopen a completed game.
+    """
+    db_game = get_game_for_update(db, game_id)
     if not db_game:
         return None
 
     update_data = game_update.model_dump(exclude_unset=True)
+    completing = update_data.pop("is_completed", None)
+    if completing is False and db_game.is_completed:
+        raise ValueError("A completed game cannot be reopened")
+
+    score = update_data.pop("score", None)
+    snake_length = update_data.pop("snake_length", None)
+    if (completing and not db_game.is_completed) or (
+        db_game.is_completed and (score is not None or snake_length is not None)
+    ):
+        _apply_completion(
+            db,
+            db_game,
+            db_game.score if score is None else score,
+            db_game.snake_length if snake_length is None else snake_length,
+        )
+    else:
+        update_data.update(
+            {
+                field: value
+                for field, value in (("score", score), ("snake_length", snake_length))
+                if value is not None
+            }
+        )
     for field, value in update_data.items():
         setattr(db_game, field, value)
 
     db.commit()
     db.refresh(db_game)
+    cache.queries.invalidate("games", "user_stats")
+    versions.counters.bump(versions.user_scope(db_game.user_id))
     return db_game
 
 
+def mark_replays_verified(db: Session, games: List[Tuple[int, int, int, int]]) -> int:
+    """Record that the replays of games, as (game_id, user_id, score,
+    snake_length), reproduce that score and length, in one commit.
+
+    Games whose result changed since their replay was checked are skipped.
+    Returns the number of games marked.
+    """
+    if not games:
+        return 0
+    table = models.Game.__table__
+    updated = db.execute(
+        update(table)
+        .where(
+            table.c.id == bindparam("game_id"),
+            table.c.score == bindparam("checked_score"),
+            table.c.snake_length == bindparam("checked_length"),
+        )
+        .values(replay_verified=True),
+        [
+            {"game_id": game_id, "checked_score": score, "checked_length": length}
+            for game_id, _, score, length in games
+        ],
+    ).rowcount
+    db.commit()
+    cache.queries.invalidate("games")
+    versions.counters.bump(
+        *{versions.user_scope(user_id) for _, user_id, _, _ in games}
+    )
+    return updated
+
+
+def update_games_progress(db: Session, updates: Dict[int, Tuple[int, dict]]) -> int:
+    """Apply buffered progress updates, {game_id: (user_id, fields)}, in one commit.
+
+    Games with the same set of fields share one executemany UPDATE. Games
+    completed in the meantime are skipped, so a late flush never overwrites
+    a final score. Returns the number of games updated.
+    """
+    table = models.Game.__table__
+    groups: Dict[Tuple[str, ...], List[dict]] = {}
+    for game_id, (_, fields) in updates.items():
+        groups.setdefault(tuple(sorted(fields)), []).append(
+            {"game_id": game_id, **fields}
+        )
+
+    updated = 0
+    for keys, rows in groups.items():
+        result = db.execute(
+            update(table)
+            .where(table.c.id == bindparam("game_id"), table.c.is_completed == false())
+            .values({key: bindparam(key) for key in keys}),
+            rows,
+        )
+        updated += result.rowcount
+    db.commit()
+
+    cache.queries.invalidate("games")
+    versions.counters.bump(
+        *{versions.user_scope(user_id) for user_id, _ in updates.values()}
+    )
+    return updated
+
+
 def complete_game(
     db: Session, game_id: int, final_score: int, snake_length: int
 ) -> Optional[models.Game]:
-    """Mark a game as completed"""
-    db_game = get_game(db, game_id)
+    """Mark a game as completed and fold it into the user's stats"""
+    db_game = get_game_for_update(db, game_id)
     if not db_game:
         return None
 
+    _apply_completion(db, db_game, final_score, snake_length)
+    db.commit()
+    db.refresh(db_game)
+    cache.queries.invalidate("games", "user_stats")
+    versions.counters.bump(versions.user_scope(db_game.user_id))
+    return db_game
+
+
+def finish_game(
+    db: Session,
+    game_id: int,
+    final_score: Optional[int],
+    snake_length: Optional[int],
+    username: str,
+    progress: Optional[dict] = None,
+) -> Optional[Tuple[models.Game, Optional[models.LeaderboardEntry]]]:
+    """Complete a game and submit a positive score, in one transaction;
+    None if the game doesn't exist.
+
+    The game is loaded for update, with progress (buffered fields) applied
+    to it; a missing final score or length keeps the game's. The game
+    UPDATE, user_stats upsert, leaderboard INSERT ... RETURNING and score
+    counter upsert share a single commit, and nothing is re-selected
+    afterwards. username is used to add the entry to the leaderboard index
+    without loading the user.
+    """
+    db_game = get_game_for_update(db, game_id)
+    if not db_game:
+        return None
+    for field, value in (progress or {}).items():
+        setattr(db_game, field, value)
+    return finish_games(
+        db,
+        [
+            (
+                db_game,
+                final_score or db_game.score,
+                snake_length or db_game.snake_length,
+                username,
+            )
+        ],
+    )[0]
+
+
+def finish_games(
+    db: Session, finishes: List[Tuple[models.Game, int, int, str]]
+) -> List[Tuple[models.Game, Optional[models.LeaderboardEntry]]]:
+    """Complete several games loaded with get_games_for_update and submit
+    their positive scores, in one transaction.
+
+    finishes holds (game, final_score, snake_length, username) in submission
+    order. The entries are added with a single multi-row INSERT ... RETURNING
+    and their submission ranks computed once for the batch (see
+    group_commit); returns (game, entry or None) per finish.
+    """
+    stats, entries, submitted = {}, [], []
+    for position, (db_game, final_score, snake_length, _) in enumerate(finishes):
+        _add_stats(stats, db_game, _complete(db_game, final_score, snake_length))
+        if db_game.score > 0:
+            entries.append(
+                schemas.LeaderboardEntryCreate(
+                    user_id=db_game.user_id,
+                    game_id=db_game.id,
+                    score=db_game.score,
+                    snake_length=db_game.snake_length,
+                    game_mode=db_game.game_mode,
+                )
+            )
+            submitted.append(position)
+    _record_completed_games(db, stats)
+    db_entries = _insert_leaderboard_entries(db, entries)
+    db.commit()
+
+    cache.queries.invalidate("games", "user_stats")
+    versions.counters.bump(
+        *{versions.user_scope(db_game.user_id) for db_game, *_ in finishes}
+    )
+    # Paired by game_id, not by RETURNING order; a game finished twice in
+    # the batch has an entry per finish, in submission (id) order
+    by_game: Dict[int, List[models.LeaderboardEntry]] = {}
+    for db_entry in db_entries:
+        by_game.setdefault(db_entry.game_id, []).append(db_entry)
+    results = [(db_game, None) for db_game, *_ in finishes]
+    for position in submitted:
+        db_game, _, _, username = finishes[position]
+        db_entry = by_game[db_game.id].pop(0)
+        results[position] = (db_game, db_entry)
+        _publish_leaderboard_entry(db_entry, username)
+    return results
+
+
+def create_completed_games(
+    db: Session, user_id: int, username: str, games: List[schemas.CompletedGame]
+) -> List[Tuple[models.Game, Optional[models.LeaderboardEntry]]]:
+    """Store games played offline and submit their positive scores, in one
+    transaction.
+
+    Games and leaderboard entries are each added with one multi-row
+    INSERT ... RETURNING, user_stats with one upsert per game mode, and the
+    entries' ranks computed once for the batch (in submission order).
+    """
+    db_games = _insert_returning(
+        db,
+        models.Game,
+        [
+            {
+                **game.model_dump(),
+                "user_id": user_id,
+                "duration_seconds": int(
+                    (game.ended_at - game.started_at).total_seconds()
+                ),
+                "is_completed": True,
+            }
+            for game in games
+        ],
+    )
+
+    stats = {}
+    for db_game in db_games:
+        _add_stats(stats, db_game, (1, db_game.score, db_game.score))
+    _record_completed_games(db, stats)
+
+    scored = [db_game for db_game in db_games if db_game.score > 0]
+    db_entries = _insert_leaderboard_entries(
+        db,
+        [
+            schemas.LeaderboardEntryCreate(
+                user_id=user_id,
+                game_id=db_game.id,
+                score=db_game.score,
+                snake_length=db_game.snake_length,
+                game_mode=db_game.game_mode,
+            )
+            for db_game in scored
+        ],
+    )
+    db.commit()
+
+    cache.queries.invalidate("games", "user_stats")
+    versions.counters.bump(versions.user_scope(user_id))
+    entries = {db_entry.game_id: db_entry for db_entry in db_entries}
+    for db_game in scored:
+        _publish_leaderboard_entry(entries[db_game.id], username)
+    return [(db_game, entries.get(db_game.id)) for db_game in db_games]
+
+
+def _apply_completion(
+    db: Session, db_game: models.Game, final_score: int, snake_length: int
+):
+    """Mark a loaded game as completed and upsert user_stats (no commit)"""
+    stats = {}
+    _add_stats(stats, db_game, _complete(db_game, final_score, snake_length))
+    _record_completed_games(db, stats)
+
+
+def _complete(
+    db_game: models.Game, final_score: int, snake_length: int
+) -> Tuple[int, int, Optional[int]]:
+    """Mark a loaded game as completed; returns what it adds to user_stats
+    as (games_played, total_score, best_score).
+
+    A game that was already completed keeps its ended_at and duration, is
+    not counted again, and only its score difference is added; if its score went down, best_score is None,
+    meaning it has to be recomputed from the games.
+    """
+    previous_score = db_game.score if db_game.is_completed else None
+    if previous_score is not None and (final_score, snake_length) != (
+        db_game.score,
+        db_game.snake_length,
+    ):
+        # The replay was checked against the old result
+        db_game.replay_verified = False
     db_game.score = final_score
     db_game.snake_length = snake_length
-    db_game.ended_at = datetime.utcnow()
     db_game.is_completed = True
 
-    if db_game.started_at and db_game.ended_at:
-        duration = (db_game.ended_at - db_game.started_at).total_seconds()
-        db_game.duration_seconds = int(duration)
+    # A correction to a completed game keeps the time it ended
+    if previous_score is None:
+        db_game.ended_at = datetime.utcnow()
+        if db_game.started_at:
+            duration = (db_game.ended_at - db_game.started_at).total_seconds()
+            db_game.duration_seconds = int(duration)
 
-    db.commit()
-    db.refresh(db_game)
-    return db_game
+    played = 0 if previous_score is not None else 1
+    lowered = previous_score is not None and final_score < previous_score
+    return played, final_score - (previous_score or 0), None if lowered else final_score
+
+
+def _add_stats(
+    stats: Dict[Tuple[int, models.GameMode], Tuple[int, int, int]],
+    db_game: models.Game,
+    added: Tuple[int, int, Optional[int]],
+):
+    """Sum (games_played, total_score, best_score) per (user, game mode); a
+    best_score of None (to recompute) sticks"""
+    key = (db_game.user_id, db_game.game_mode)
+    played, total, best = stats.get(key, (0, 0, 0))
+    if best is not None and added[2] is not None:
+        best = max(best, added[2])
+    else:
+        best = None
+    stats[key] = (played + added[0], total + added[1], best)
+
+
+def _record_completed_games(
+    db: Session,
+    stats: Dict[Tuple[int, models.GameMode], Tuple[int, int, Optional[int]]],
+):
+    """Add completed games to user_stats, one upsert per (user, game mode).
+
+    Where a completed game's score went down, best_score is recomputed from
+    the completed games instead.
+    """
+    table = models.UserStats.__table__
+    if any(best is None for _, _, best in stats.values()):
+        # The lowered scores must be visible to the recomputation
+        db.flush()
+    for (user_id, game_mode), (played, total, best) in stats.items():
+        if best is None:
+            best = best_update = (
+                select(func.coalesce(func.max(models.Game.score), 0))
+                .where(
+                    models.Game.user_id == user_id,
+                    models.Game.game_mode == game_mode,
+                    models.Game.is_completed == true(),
+                )
+                .scalar_subquery()
+            )
+        else:
+            best_update = case(
+                (table.c.best_score < best, best), else_=table.c.best_score
+            )
+        _upsert(
+            db,
+            models.UserStats,
+            {
+                "user_id": user_id,
+                "game_mode": game_mode,
+                "games_played": played,
+                "total_score": total,
+                "best_score": best,
+                "updated_at": datetime.utcnow(),
+            },
+            ["user_id", "game_mode"],
+            {
+                "games_played": table.c.games_played + played,
+                "total_score": table.c.total_score + total,
+                "best_score": best_update,
+                "updated_at": datetime.utcnow(),
+            },
+        )
 
 
 # LeaderboardEntry CRUD operations
+def _live_ranks(entries: List[models.LeaderboardEntry]) -> List[int]:
+    """Competition ranks ("1224") per game mode for entries sorted by score.
+
+    Every same-mode entry with a higher score sorts before an entry, so the
+    rank can be read off the prefix without querying the rest of the table.
+    """
+    seen = {}
+    last = {}
+    ranks = []
+    for entry in entries:
+        seen[entry.game_mode] = seen.get(entry.game_mode, 0) + 1
+        previous = last.get(entry.game_mode)
+        if previous is None or previous[0] != entry.score:
+            last[entry.game_mode] = (entry.score, seen[entry.game_mode])
+        ranks.append(last[entry.game_mode][1])
+    return ranks
+
+
 def get_leaderboard(
     db: Session, game_mode: Optional[models.GameMode] = None, limit: int = 10
 ) -> List[dict]:
     """Get leaderboard entries with user information"""
+    indexed = leaderboard_index.index.top(game_mode, limit)
+    if indexed is not None:
+        return indexed
+
+    return _cached(
+        ("leaderboard", game_mode, limit),
+        ("leaderboard_entries", "users"),
+        lambda: _query_leaderboard(db, game_mode, limit),
+    )
+
+
+def _query_leaderboard(
+    db: Session, game_mode: Optional[models.GameMode], limit: int
+) -> List[dict]:
     query = db.query(models.LeaderboardEntry, models.User.username).join(models.User)
 
     if game_mode:
         query = query.filter(models.LeaderboardEntry.game_mode == game_mode)
 
-    results = query.order_by(desc(models.LeaderboardEntry.score)).limit(limit).all()
+    results = (
+        query.order_by(desc(models.LeaderboardEntry.score), models.LeaderboardEntry.id)
+        .limit(limit)
+        .all()
+    )
+    ranks = _live_ranks([entry for entry, _ in results])
 
     return [
         {
@@ -174,98 +721,509 @@ def get_leaderboard(
             "score": entry.score,
             "snake_length": entry.snake_length,
             "game_mode": entry.game_mode,
-            "rank": entry.rank,
+            "rank": rank,
             "created_at": entry.created_at,
         }
-        for entry, username in results
+        for (entry, username), rank in zip(results, ranks)
     ]
 
 
+def publish_leaderboard_snapshot(db: Session):
+    """Publish the shared leaderboard snapshot if this worker is its writer"""
+    leaderboard_snapshot.publish_if_needed(
+        lambda game_mode, limit: _query_leaderboard(db, game_mode, limit)
+    )
+
+
+def get_leaderboard_around(
+    db: Session, user_id: int, game_mode: models.GameMode, radius: int = 10
+) -> Optional[dict]:
+    """Get a user's best entry and up to radius neighbours on each side.
+
+    Neighbours are read with keyset seeks on (game_mode, score, id), so the
+    cost does not depend on how many entries rank above the user.
+    """
+    around = leaderboard_index.index.around(game_mode, user_id, radius)
+    if around is not None:
+        return around if around["entries"] else None
+
+    entry = models.LeaderboardEntry
+    best = (
+        db.query(entry)
+        .filter(entry.user_id == user_id, entry.game_mode == game_mode)
+        .order_by(desc(entry.score), entry.id)
+        .first()
+    )
+    if not best:
+        return None
+
+    query = (
+        db.query(entry, models.User.username)
+        .join(models.User)
+        .filter(entry.game_mode == game_mode)
+    )
+    above = (
+        query.filter(
+            (entry.score > best.score)
+            | ((entry.score == best.score) & (entry.id < best.id))
+        )
+        .order_by(entry.score, desc(entry.id))
+        .limit(radius)
+        .all()
+    )
+    below = (
+        query.filter(
+            (entry.score < best.score)
+            | ((entry.score == best.score) & (entry.id >= best.id))
+        )
+        .order_by(desc(entry.score), entry.id)
+        .limit(radius + 1)
+        .all()
+    )
+
+    ranks = {}
+    entries = []
+    for db_entry, username in above[::-1] + below:
+        if db_entry.score not in ranks:
+            ranks[db_entry.score] = get_score_rank(db, game_mode, db_entry.score)
+        entries.append(
+            {
+                "id": db_entry.id,
+                "user_id": db_entry.user_id,
+                "username": username,
+                "score": db_entry.score,
+                "snake_length": db_entry.snake_length,
+                "game_mode": db_entry.game_mode,
+                "rank": ranks[db_entry.score],
+                "created_at": db_entry.created_at,
+            }
+        )
+
+    return {"rank": ranks[best.score], "entries": entries}
+
+
+def get_score_rank(db: Session, game_mode: models.GameMode, score: int) -> int:
+    """Get the rank a score holds in a game mode (1 + entries scoring higher)"""
+    higher = (
+        db.query(func.coalesce(func.sum(models.LeaderboardScoreCount.entry_count), 0))
+        .filter(
+            models.LeaderboardScoreCount.game_mode == game_mode,
+            models.LeaderboardScoreCount.score > score,
+        )
+        .scalar()
+    )
+    return int(higher) + 1
+
+
+def get_score_percentile(db: Session, game_mode: models.GameMode, score: int) -> dict:
+    """Get the share of entries in a game mode scoring below a score.
+
+    Served from the in-memory score sketch when warm (see score_sketch for
+    its error bound), otherwise summed exactly from the per-score counters.
+    """
+    sketched = score_sketch.sketch.percentile(game_mode, score)
+    if sketched is not None:
+        return sketched
+
+    counter = models.LeaderboardScoreCount
+    below, total = (
+        db.query(
+            func.coalesce(
+                func.sum(case((counter.score < score, counter.entry_count), else_=0)),
+                0,
+            ),
+            func.coalesce(func.sum(counter.entry_count), 0),
+        )
+        .filter(counter.game_mode == game_mode)
+        .one()
+    )
+    return {
+        "percentile": 100 * below / total if total else 0.0,
+        "error_bound": 0.0,
+    }
+
+
+def _insert_returning(db: Session, model, rows: List[dict]) -> list:
+    """Multi-row INSERT ... RETURNING instances of model, in the order of rows.
+
+    The rows go out as one statement (or a few, for large batches), which
+    assigns ids in parameter order; RETURNING itself promises no order, so
+    the instances are sorted by id. Asking SQLAlchemy to sort instead
+    (sort_by_parameter_order) makes it insert one row at a time on SQLite.
+    """
+    instances = db.scalars(insert(model).returning(model), rows).all()
+    return sorted(instances, key=lambda instance: instance.id)
+
+
+def _upsert(db: Session, model, values: dict, keys: List[str], set_: dict):
+    """Insert values, or apply set_ to the existing row with the same keys"""
+    table = model.__table__
+    dialect = db.get_bind().dialect.name
+
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite_insert if dialect == "sqlite" else postgresql_insert
+        stmt = insert(table).values(**values)
+        stmt = stmt.on_conflict_do_update(index_elements=keys, set_=set_)
+        db.execute(stmt)
+        return
+
+    updated = (
+        db.query(model)
+        .filter(*[getattr(model, key) == values[key] for key in keys])
+        .update(set_, synchronize_session=False)
+    )
+    if not updated:
+        db.add(model(**values))
+
+
+def _adjust_score_count(
+    db: Session, game_mode: models.GameMode, score: int, amount: int
+):
+    """Add amount to the (game_mode, score) counter, creating it if needed"""
+    table = models.LeaderboardScoreCount.__table__
+    _upsert(
+        db,
+        models.LeaderboardScoreCount,
+        {"game_mode": game_mode, "score": score, "entry_count": amount},
+        ["game_mode", "score"],
+        {"entry_count": table.c.entry_count + amount},
+    )
+
+
+def game_has_leaderboard_entry(db: Session, game_id: int) -> bool:
+    """Whether a game's score was submitted to the leaderboard"""
+    return (
+        db.query(models.LeaderboardEntry.id)
+        .filter(models.LeaderboardEntry.game_id == game_id)
+        .first()
+        is not None
+    )
+
+
 def create_leaderboard_entry(
     db: Session, entry: schemas.LeaderboardEntryCreate
 ) -> models.LeaderboardEntry:
-    """Create a new leaderboard entry"""
-    db_entry = models.LeaderboardEntry(
-        user_id=entry.user_id,
-        game_id=entry.game_id,
-        score=entry.score,
-        snake_length=entry.snake_length,
-        game_mode=entry.game_mode,
-    )
-    db.add(db_entry)
+    """Create a new leaderboard entry, recording its rank at submission time"""
+    db_entry = _insert_leaderboard_entry(db, entry)
     db.commit()
     db.refresh(db_entry)
 
-    # Update rank
-    update_leaderboard_ranks(db, entry.game_mode)
-
+    _publish_leaderboard_entry(db_entry, db_entry.user.username)
     return db_entry
 
 
+def _insert_leaderboard_entry(
+    db: Session, entry: schemas.LeaderboardEntryCreate
+) -> models.LeaderboardEntry:
+    """INSERT ... RETURNING a leaderboard entry and count its score (no commit)"""
+    return _insert_leaderboard_entries(db, [entry])[0]
+
+
+def _insert_leaderboard_entries(
+    db: Session, entries: List[schemas.LeaderboardEntryCreate]
+) -> List[models.LeaderboardEntry]:
+    """INSERT ... RETURNING leaderboard entries in one statement and count
+    their scores (no commit)"""
+    if not entries:
+        return []
+    ranks = _submission_ranks(db, entries)
+    db_entries = _insert_returning(
+        db,
+        models.LeaderboardEntry,
+        [
+            {
+                "user_id": entry.user_id,
+                "game_id": entry.game_id,
+                "score": entry.score,
+                "snake_length": entry.snake_length,
+                "game_mode": entry.game_mode,
+                "rank": rank,
+            }
+            for entry, rank in zip(entries, ranks)
+        ],
+    )
+
+    counts: Dict[Tuple[models.GameMode, int], int] = {}
+    for entry in entries:
+        key = (entry.game_mode, entry.score)
+        counts[key] = counts.get(key, 0) + 1
+    for (game_mode, score), amount in counts.items():
+        _adjust_score_count(db, game_mode, score, amount)
+    return db_entries
+
+
+def _submission_ranks(
+    db: Session, entries: List[schemas.LeaderboardEntryCreate]
+) -> List[int]:
+    """Rank of each new entry when submitted: 1 + stored entries scoring
+    higher + entries earlier in the batch scoring higher.
+
+    One query per game mode in the batch, instead of one per entry.
+    """
+    if len(entries) == 1:
+        return [get_score_rank(db, entries[0].game_mode, entries[0].score)]
+
+    counter = models.LeaderboardScoreCount
+    lowest: Dict[models.GameMode, int] = {}
+    for entry in entries:
+        lowest[entry.game_mode] = min(
+            entry.score, lowest.get(entry.game_mode, entry.score)
+        )
+
+    # Per mode: stored scores ascending, and how many entries score at
+    # least each of them (plus a trailing 0)
+    stored = {}
+    for game_mode, score in lowest.items():
+        rows = (
+            db.query(counter.score, counter.entry_count)
+            .filter(counter.game_mode == game_mode, counter.score > score)
+            .order_by(counter.score)
+            .all()
+        )
+        at_least = [0]
+        for row in reversed(rows):
+            at_least.append(at_least[-1] + row.entry_count)
+        stored[game_mode] = ([row.score for row in rows], at_least[::-1])
+
+    ranks = []
+    for position, entry in enumerate(entries):
+        scores, at_least = stored[entry.game_mode]
+        higher = at_least[bisect.bisect_right(scores, entry.score)]
+        higher += sum(
+            1
+            for earlier in entries[:position]
+            if earlier.game_mode == entry.game_mode and earlier.score > entry.score
+        )
+        ranks.append(higher + 1)
+    return ranks
+
+
+def _publish_leaderboard_entry(db_entry: models.LeaderboardEntry, username: str):
+    """Add a committed entry to the in-memory leaderboard structures"""
+    cache.queries.invalidate("leaderboard_entries", "leaderboard_score_counts")
+    # Mark the snapshot dirty before bumping, so a reader that sees the new
+    # version never gets a snapshot published without this entry
+    leaderboard_snapshot.snapshot.mark_dirty()
+    versions.counters.bump(
+        versions.leaderboard_scope(None),
+        versions.leaderboard_scope(db_entry.game_mode),
+    )
+    if leaderboard_index.index.is_warm():
+        leaderboard_index.index.add(db_entry, username)
+    score_sketch.sketch.add(db_entry.game_mode, db_entry.score)
+
+
 def update_leaderboard_ranks(db: Session, game_mode: Optional[models.GameMode] = None):
-    """Update ranks for all leaderboard entries"""
-    query = db.query(models.LeaderboardEntry)
+    """Rewrite the stored rank of every entry to its current rank.
 
-    if game_mode:
-        query = query.filter(models.LeaderboardEntry.game_mode == game_mode)
+    Ranks are computed on read, so this is only needed to backfill the
+    stored column; it loads every entry of the mode.
+    """
+    modes = [game_mode] if game_mode else list(models.GameMode)
+
+    for mode in modes:
+        entries = (
+            db.query(models.LeaderboardEntry)
+            .filter(models.LeaderboardEntry.game_mode == mode)
+            .order_by(desc(models.LeaderboardEntry.score), models.LeaderboardEntry.id)
+            .all()
+        )
+        for entry, rank in zip(entries, _live_ranks(entries)):
+            entry.rank = rank
 
-    entries = query.order_by(desc(models.LeaderboardEntry.score)).all()
+    db.commit()
+    cache.queries.invalidate("leaderboard_entries")
 
-    for rank, entry in enumerate(entries, start=1):
-        entry.rank = rank
 
+def rebuild_leaderboard_score_counts(db: Session):
+    """Recompute the per-score counters from the leaderboard entries"""
+    db.query(models.LeaderboardScoreCount).delete(synchronize_session=False)
+    counts = (
+        db.query(
+            models.LeaderboardEntry.game_mode,
+            models.LeaderboardEntry.score,
+            func.count(models.LeaderboardEntry.id),
+        )
+        .group_by(models.LeaderboardEntry.game_mode, models.LeaderboardEntry.score)
+        .all()
+    )
+    db.add_all(
+        models.LeaderboardScoreCount(game_mode=mode, score=score, entry_count=count)
+        for mode, score, count in counts
+    )
     db.commit()
+    cache.queries.invalidate("leaderboard_score_counts")
+    versions.counters.reset()
+
+
+def check_leaderboard_score_counts(db: Session) -> List[dict]:
+    """Compare the per-score counters with the leaderboard entries.
+
+    Returns one dict per (game_mode, score) whose counter disagrees with the
+    number of entries; an empty list means ranks are consistent.
+    """
+    expected = {
+        (mode, score): count
+        for mode, score, count in db.query(
+            models.LeaderboardEntry.game_mode,
+            models.LeaderboardEntry.score,
+            func.count(models.LeaderboardEntry.id),
+        ).group_by(models.LeaderboardEntry.game_mode, models.LeaderboardEntry.score)
+    }
+    actual = {
+        (row.game_mode, row.score): row.entry_count
+        for row in db.query(models.LeaderboardScoreCount)
+    }
+
+    mismatches = []
+    for mode, score in sorted(
+        expected.keys() | actual.keys(), key=lambda key: (key[0].value, -key[1])
+    ):
+        counted = actual.get((mode, score), 0)
+        stored = expected.get((mode, score), 0)
+        if counted != stored:
+            mismatches.append(
+                {
+                    "game_mode": mode,
+                    "score": score,
+                    "expected": stored,
+                    "actual": counted,
+                }
+            )
+    return mismatches
 
 
 def get_user_best_score(
     db: Session, user_id: int, game_mode: models.GameMode
 ) -> Optional[int]:
     """Get user's best score for a specific game mode"""
-    result = (
-        db.query(func.max(models.LeaderboardEntry.score))
-        .filter(
-            models.LeaderboardEntry.user_id == user_id,
-            models.LeaderboardEntry.game_mode == game_mode,
-        )
-        .scalar()
+    query = db.query(func.max(models.LeaderboardEntry.score)).filter(
+        models.LeaderboardEntry.user_id == user_id,
+        models.LeaderboardEntry.game_mode == game_mode,
+    )
+    return _cached(
+        ("best_score", user_id, game_mode), ("leaderboard_entries",), query.scalar
     )
-
-    return result
 
 
 def get_user_stats(db: Session, user_id: int) -> dict:
-    """Get comprehensive statistics for a user"""
-    games_played = (
-        db.query(func.count(models.Game.id))
-        .filter(models.Game.user_id == user_id, models.Game.is_completed == True)
-        .scalar()
+    """Get comprehensive statistics for a user, with a breakdown per mode"""
+    # Keyed by the user's shared version, so a change made by another worker
+    # is never answered from this worker's cache
+    return _cached(
+        (
+            "user_stats",
+            user_id,
+            versions.counters.version(versions.user_scope(user_id)),
+        ),
+        ("user_stats",),
+        lambda: _query_user_stats(db, user_id),
     )
 
-    total_score = (
-        db.query(func.sum(models.Game.score))
-        .filter(models.Game.user_id == user_id, models.Game.is_completed == True)
-        .scalar()
-        or 0
-    )
 
-    best_score = (
-        db.query(func.max(models.Game.score))
-        .filter(models.Game.user_id == user_id)
-        .scalar()
-        or 0
-    )
+def _query_user_stats(db: Session, user_id: int) -> dict:
+    rows = db.query(models.UserStats).filter(models.UserStats.user_id == user_id)
+    modes = {
+        row.game_mode: {
+            "games_played": row.games_played,
+            "total_score": row.total_score,
+            "best_score": row.best_score,
+            "average_score": (
+                round(row.total_score / row.games_played, 2) if row.games_played else 0
+            ),
+        }
+        for row in rows
+    }
 
-    avg_score = (
-        db.query(func.avg(models.Game.score))
-        .filter(models.Game.user_id == user_id, models.Game.is_completed == True)
-        .scalar()
-        or 0
-    )
+    games_played = sum(mode["games_played"] for mode in modes.values())
+    total_score = sum(mode["total_score"] for mode in modes.values())
 
     return {
         "user_id": user_id,
-        "games_played": games_played or 0,
+        "games_played": games_played,
         "total_score": total_score,
-        "best_score": best_score,
-        "average_score": round(float(avg_score), 2),
+        "best_score": max((mode["best_score"] for mode in modes.values()), default=0),
+        "average_score": round(total_score / games_played, 2) if games_played else 0,
+        "modes": modes,
     }
+
+
+def rebuild_user_stats(db: Session):
+    """Recompute user_stats from the games table (backfill)"""
+    db.query(models.UserStats).delete(synchronize_session=False)
+    totals = (
+        db.query(
+            models.Game.user_id,
+            models.Game.game_mode,
+            func.count(models.Game.id),
+            func.sum(models.Game.score),
+            func.max(models.Game.score),
+        )
+        .filter(models.Game.is_completed == True)
+        .group_by(models.Game.user_id, models.Game.game_mode)
+        .all()
+    )
+    db.add_all(
+        models.UserStats(
+            user_id=user_id,
+            game_mode=game_mode,
+            games_played=games_played,
+            total_score=total_score or 0,
+            best_score=best_score or 0,
+        )
+        for user_id, game_mode, games_played, total_score, best_score in totals
+    )
+    db.commit()
+    cache.queries.invalidate("user_stats")
+    versions.counters.reset()
+
+
+# Export operations
+def export_games(
+    db: Session,
+    game_mode: Optional[models.GameMode] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    batch_size: int = 1000,
+) -> Result:
+    """Games started in [since, until), in id order, to stream batch_size
+    rows at a time: partitions() yields lists of plain column tuples, and
+    keys() names the columns.
+
+    Rows are read through a server-side cursor (yield_per), so memory is
+    bounded by batch_size however many match.
+    """
+    table = models.Game.__table__
+    query = select(table).order_by(table.c.id)
+    if game_mode:
+        query = query.where(table.c.game_mode == game_mode)
+    if since:
+        query = query.where(table.c.started_at >= since)
+    if until:
+        query = query.where(table.c.started_at < until)
+    return db.execute(query.execution_options(yield_per=batch_size))
+
+
+def export_leaderboard_entries(
+    db: Session,
+    game_mode: Optional[models.GameMode] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    batch_size: int = 1000,
+) -> Result:
+    """Leaderboard entries created in [since, until) with their usernames,
+    to stream like export_games"""
+    table = models.LeaderboardEntry.__table__
+    users = models.User.__table__
+    query = (
+        select(table, users.c.username)
+        .join(users, users.c.id == table.c.user_id)
+        .order_by(table.c.id)
+    )
+    if game_mode:
+        query = query.where(table.c.game_mode == game_mode)
+    if since:
+        query = query.where(table.c.created_at >= since)
+    if until:
+        query = query.where(table.c.created_at < until)
+    return db.execute(query.execution_options(yield_per=batch_size))
@@ -1,6 +1,11 @@
+import asyncio
+import logging
 import os
+import tempfile
+import zlib
 
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -16,12 +21,76 @@ if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=connect_args)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def get_async_url(url: str) -> str:
+    """Map a DATABASE_URL onto the matching asyncio driver"""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:") :]
+    for prefix in ("postgresql+psycopg2:", "postgresql:"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg:" + url[len(prefix) :]
+    return url
+
+
+# Async engine for the async routers, so DB round trips don't block the loop
+ASYNC_DATABASE_URL = get_async_url(SQLALCHEMY_DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+
 Base = declarative_base()
 
 
+def shared_memory_path(name: str) -> str:
+    """Path of a file shared by the workers serving this database.
+
+    Lives in /dev/shm where available; the database URL is hashed into the
+    name so test and development servers never share files.
+    """
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    database = SQLALCHEMY_DATABASE_URL
+    if database.startswith("sqlite:///"):
+        database = os.path.abspath(database[len("sqlite:///") :])
+    return os.path.join(directory, f"snake-{name}-{zlib.crc32(database.encode()):08x}")
+
+
+logger = logging.getLogger(__name__)
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+def get_session_factory():
+    """Factory for sessions that outlive the request's own, such as the one
+    a streamed response reads from while its body is sent"""
+    return SessionLocal
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def run_with_session(refresh):
+    """Call refresh(db) with a new session, closing it afterwards"""
+    db = SessionLocal()
+    try:
+        refresh(db)
+    finally:
+        db.close()
+
+
+async def refresh_periodically(refresh, interval: float):
+    """Call refresh(db) in a worker thread every interval seconds, forever"""
+    while True:
+        try:
+            await asyncio.to_thread(run_with_session, refresh)
+        except Exception:
+            logger.exception("Periodic refresh %s failed", refresh.__qualname__)
+        await asyncio.sleep(interval)
@@ -0,0 +1,178 @@
+"""
+Opt-in group commit for finished games and their leaderboard entries
+
+By default every ``POST /api/games/{game_id}/end`` commits on its own, so
+under load each one pays for a commit (and its fsync). With
+``LEADERBOARD_GROUP_COMMIT=1`` the endpoint instead queues the game and
+awaits a future. One consumer task per worker collects everything queued
+within ``LEADERBOARD_GROUP_COMMIT_WINDOW_MS`` of the first arrival (at most
+``LEADERBOARD_GROUP_COMMIT_MAX_BATCH`` games) and finishes the batch with
+``crud.finish_games``: one transaction, one multi-row INSERT ... RETURNING
+for the leaderboard entries and one rank query per game mode. Each future
+then resolves with its completed game and entry, id and submission rank
+included. Entries of a batch rank in arrival order, as if committed one by
+one.
+
+Trade-off: each end_game waits up to the window before its commit starts,
+in exchange for far fewer commits at peak. Nothing is acknowledged before
+its batch has committed, so durability is unchanged. If a batch fails, its
+games are retried one per transaction, so a bad game only fails its own
+request.
+"""
+
+import asyncio
+import logging
+import os
+from typing import List, NamedTuple, Optional, Tuple
+
+import crud
+import models
+from database import AsyncSessionLocal
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Queue end_game commits instead of committing each one
+ENABLED = os.getenv("LEADERBOARD_GROUP_COMMIT", "0").lower() in ("1", "true", "yes")
+# Milliseconds to gather games after the first one arrives
+WINDOW_MS = float(os.getenv("LEADERBOARD_GROUP_COMMIT_WINDOW_MS", "5"))
+# Most games committed together
+MAX_BATCH = int(os.getenv("LEADERBOARD_GROUP_COMMIT_MAX_BATCH", "256"))
+
+
+class Finish(NamedTuple):
+    """A queued end_game: the game, its final result and buffered progress"""
+
+    game_id: int
+    # None (or 0) keeps the game's
+    final_score: Optional[int]
+    snake_length: Optional[int]
+    username: str
+    progress: dict = {}
+
+
+Result = Optional[Tuple[models.Game, Optional[models.LeaderboardEntry]]]
+
+
+def _finish_batch(db: Session, finishes: List[Finish]) -> List[Result]:
+    """Finish a batch in one transaction; None for games that no longer exist"""
+    games = crud.get_games_for_update(db, [finish.game_id for finish in finishes])
+    present = [finish for finish in finishes if finish.game_id in games]
+    for finish in present:
+        for field, value in finish.progress.items():
+            setattr(games[finish.game_id], field, value)
+
+    finished = iter(
+        crud.finish_games(
+            db,
+            [
+                (
+                    games[finish.game_id],
+                    finish.final_score or games[finish.game_id].score,
+                    finish.snake_length or games[finish.game_id].snake_length,
+                    finish.username,
+                )
+                for finish in present
+            ],
+        )
+    )
+    return [next(finished) if finish.game_id in games else None for finish in finishes]
+
+
+class GroupCommitQueue:
+    """Batches end_game commits from concurrent requests"""
+
+    def __init__(
+        self,
+        enabled: bool = ENABLED,
+        window: float = WINDOW_MS / 1000,
+        max_batch: int = MAX_BATCH,
+    ):
+        self.enabled = enabled
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.committed = 0
+        self.largest_batch = 0
+        self.retried_batches = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def submit(self, finish: Finish) -> Result:
+        """Queue a finished game; returns (game, entry) once committed"""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((finish, future))
+        return await future
+
+    async def stop(self):
+        """Commit everything queued so far and stop the consumer"""
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._queue = self._task = None
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            if batch[0] is not None and self.window > 0:
+                await asyncio.sleep(self.window)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            stopping = None in batch
+            batch = [item for item in batch if item is not None]
+            if batch:
+                await self._commit(batch)
+            if stopping:
+                return
+
+    async def _commit(self, batch: List[Tuple[Finish, asyncio.Future]]):
+        finishes = [finish for finish, _ in batch]
+        try:
+            results = await self._finish(finishes)
+        except Exception:
+            logger.exception("Group commit of %d games failed, retrying", len(batch))
+            self.retried_batches += 1
+            results = []
+            for finish in finishes:
+                try:
+                    results.extend(await self._finish([finish]))
+                except Exception as error:
+                    results.append(error)
+
+        self.batches += 1
+        self.committed += sum(not isinstance(r, Exception) for r in results)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for (_, future), result in zip(batch, results):
+            # The request may have gone away; its game is committed anyway
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _finish(self, finishes: List[Finish]) -> List[Result]:
+        async with AsyncSessionLocal() as db:
+            return await db.run_sync(_finish_batch, finishes)
+
+    def stats(self) -> dict:
+        """Batch counters"""
+        return {
+            "enabled": self.enabled,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "batches": self.batches,
+            "committed": self.committed,
+            "largest_batch": self.largest_batch,
+            "average_batch": (
+                round(self.committed / self.batches, 2) if self.batches else 0.0
+            ),
+            "retried_batches": self.retried_batches,
+        }
+
+
+queue = GroupCommitQueue()
@@ -3,10 +3,25 @@ Database initialization script for Snake Game
 Creates all tables and optionally seeds initial data
 """
 
+import argparse
+import csv
+import io
+import random
+import struct
 import sys
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Sequence
 
+import crud
 import models
-from database import Base, engine
+import replays
+import simulator
+from database import Base, SessionLocal, engine
+from passwords import get_password_hash
+from snake_engine import Claim, verify_batch
+from sqlalchemy import false, func, inspect, select, text, true
+from sqlalchemy.schema import CreateColumn
 
 
 def init_database():
@@ -14,7 +29,14 @@ def init_database():
     print("Creating database tables...")
     try:
         # Import all models to ensure they're registered with Base
-        from models import Game, LeaderboardEntry, Score, User
+        from models import (
+            Game,
+            LeaderboardEntry,
+            LeaderboardScoreCount,
+            Score,
+            User,
+            UserStats,
+        )
 
         # Create all tables
         Base.metadata.create_all(bind=engine)
@@ -23,13 +45,60 @@ def init_database():
         print("  - users")
         print("  - games")
         print("  - leaderboard_entries")
+        print("  - leaderboard_score_counts")
+        print("  - user_stats")
         print("  - scores (legacy)")
 
+        upgrade_database()
+
     except Exception as e:
         print(f"✗ Error creating database tables: {e}")
         sys.exit(1)
 
 
+def _has_rows(db, query) -> bool:
+    return db.scalar(query.limit(1)) is not None
+
+
+def upgrade_database():
+    """Bring a database created by an older version up to date.
+
+    create_all only creates missing tables, so the columns (each with a
+    server default) and indexes added to existing tables are created here,
+    and user_stats and the rank counters are backfilled when they are empty
+    next to existing games and entries.
+    """
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                with engine.begin() as connection:
+                    connection.execute(
+                        text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+                    )
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+    db = SessionLocal()
+    try:
+        completed = select(models.Game.id).where(models.Game.is_completed == true())
+        missing_counts = _has_rows(
+            db, select(models.LeaderboardEntry.id)
+        ) and not _has_rows(db, select(models.LeaderboardScoreCount.score))
+        missing_stats = _has_rows(db, completed) and not _has_rows(
+            db, select(models.UserStats.user_id)
+        )
+    finally:
+        db.close()
+
+    if missing_counts:
+        rebuild_ranks()
+    if missing_stats:
+        rebuild_stats()
+
+
 def drop_all_tables():
     """Drop all tables (use with caution!)"""
     print("WARNING: This will delete all data!")
@@ -42,8 +111,422 @@ def drop_all_tables():
         print("Operation cancelled.")
 
 
+def check_ranks():
+    """Verify the per-score counters that leaderboard ranks are derived from"""
+    print("Checking leaderboard rank counters...")
+    db = SessionLocal()
+    try:
+        mismatches = crud.check_leaderboard_score_counts(db)
+    finally:
+        db.close()
+
+    if not mismatches:
+        print("✓ Leaderboard ranks are consistent")
+        return
+
+    for mismatch in mismatches:
+        print(
+            f"  - {mismatch['game_mode'].value} score {mismatch['score']}: "
+            f"{mismatch['actual']} counted, {mismatch['expected']} entries"
+        )
+    print(f"✗ {len(mismatches)} inconsistent score counters (run --rebuild-ranks)")
+    sys.exit(1)
+
+
+def rebuild_ranks():
+    """Rebuild the rank counters and backfill the stored entry ranks"""
+    print("Rebuilding leaderboard rank counters...")
+    db = SessionLocal()
+    try:
+        crud.rebuild_leaderboard_score_counts(db)
+        crud.update_leaderboard_ranks(db)
+    finally:
+        db.close()
+    print("✓ Leaderboard ranks rebuilt successfully!")
+
+
+def rebuild_stats():
+    """Backfill the per-user stats from the games table"""
+    print("Rebuilding user stats...")
+    db = SessionLocal()
+    try:
+        crud.rebuild_user_stats(db)
+    finally:
+        db.close()
+    print("✓ User stats rebuilt successfully!")
+
+
+def set_admin(username: str, is_admin: bool = True):
+    """Grant or revoke admin access; the account must already exist"""
+    db = SessionLocal()
+    try:
+        user = crud.set_user_admin(db, username, is_admin)
+    finally:
+        db.close()
+
+    if user is None:
+        print(f"✗ No user named {username!r} (sign up first)")
+        sys.exit(1)
+    print(f"✓ {username} is {'now' if is_admin else 'no longer'} an admin")
+
+
+def verify_replays(batch_size: int = 1000):
+    """Check the stored replays of finished games not verified yet, such as
+    seeded ones, batch_size games at a time with snake_engine.verify_batch,
+    and record those that reproduce their game"""
+    print("Verifying replays...")
+    table = models.Game.__table__
+    checked = verified = 0
+    last_id = 0
+    db = SessionLocal()
+    try:
+        while True:
+            games = db.execute(
+                select(
+                    table.c.id,
+                    table.c.user_id,
+                    table.c.game_mode,
+                    table.c.score,
+                    table.c.snake_length,
+                )
+                .where(
+                    table.c.id > last_id,
+                    table.c.is_completed == true(),
+                    table.c.replay_verified == false(),
+                )
+                .order_by(table.c.id)
+                .limit(batch_size)
+            ).all()
+            if not games:
+                break
+            last_id = games[-1].id
+
+            stored, claims = [], []
+            for game in games:
+                try:
+                    with open(replays.path(game.id), "rb") as file:
+                        seed, moves = replays.unpack(file.read())
+                except FileNotFoundError:
+                    continue
+                except (ValueError, struct.error):
+                    # Unreadable counts as not reproducing the game
+                    checked += 1
+                    continue
+                stored.append(game)
+                claims.append(
+                    Claim(game.game_mode, seed, moves, game.score, game.snake_length)
+                )
+
+            checked += len(claims)
+            verified += crud.mark_replays_verified(
+                db,
+                [
+                    (game.id, game.user_id, game.score, game.snake_length)
+                    for game, ok in zip(stored, verify_batch(claims))
+                    if ok
+                ],
+            )
+    finally:
+        db.close()
+    print(f"✓ {verified} of {checked} replays reproduce their game")
+
+
+# Password of every seeded user
+SEED_PASSWORD = "seed-password"
+# Points per food, and milliseconds per move, as in the frontend
+SEED_POINTS = {models.GameMode.WALLS: 15, models.GameMode.PASS_THROUGH: 10}
+SEED_MOVE_MS = 150
+
+_MODES = list(models.GameMode)
+
+_USER_COLUMNS = (
+    "id",
+    "username",
+    "hashed_password",
+    "created_at",
+    "updated_at",
+    "is_active",
+)
+_GAME_COLUMNS = (
+    "id",
+    "user_id",
+    "score",
+    "snake_length",
+    "game_mode",
+    "duration_seconds",
+    "moves_count",
+    "food_eaten",
+    "started_at",
+    "ended_at",
+    "is_completed",
+)
+_ENTRY_COLUMNS = (
+    "user_id",
+    "game_id",
+    "score",
+    "snake_length",
+    "game_mode",
+    "created_at",
+)
+
+
+def _next_id(connection, model) -> int:
+    table = model.__table__
+    return (
+        connection.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar() + 1
+    )
+
+
+def _raw_value(value):
+    # Stored as SQLAlchemy stores them: enums by name, SQLite datetimes as
+    # "YYYY-MM-DD HH:MM:SS.ffffff"
+    if isinstance(value, models.GameMode):
+        return value.name
+    if isinstance(value, datetime):
+        return value.isoformat(" ", "microseconds")
+    return value
+
+
+def _bulk_insert(connection, model, columns, rows):
+    """COPY rows into the model's table on PostgreSQL, executemany elsewhere.
+
+    Both bypass SQLAlchemy's per-row parameter processing, which would
+    otherwise take about as long as the inserts themselves.
+    """
+    table = model.__table__
+    rows = [tuple(_raw_value(value) for value in row) for row in rows]
+    if connection.dialect.name == "postgresql":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {table.name} ({', '.join(columns)}) "
+                "FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+        finally:
+            cursor.close()
+    else:
+        marker = "?" if connection.dialect.paramstyle == "qmark" else "%s"
+        connection.exec_driver_sql(
+            f"INSERT INTO {table.name} ({', '.join(columns)}) "
+            f"VALUES ({', '.join([marker] * len(columns))})",
+            rows,
+        )
+
+
+def _seed_game(
+    rng: random.Random,
+    game_id: int,
+    user_id: int,
+    now: datetime,
+    simulated: Optional[simulator.SimulatedGame] = None,
+):
+    """A synthetic game row and, if completed with a score, its entry row.
+    With a simulated game, its result is used and the game is completed."""
+    if simulated is None:
+        game_mode = rng.choice(_MODES)
+        # Long-tailed: most games end after a few food, a few go on for ages
+        food_eaten = int(rng.lognormvariate(1.6, 0.9))
+        score = food_eaten * SEED_POINTS[game_mode]
+        snake_length = 1 + food_eaten
+        moves_count = food_eaten * rng.randint(8, 30) + rng.randint(5, 40)
+    else:
+        game_mode = simulated.game_mode
+        food_eaten = simulated.food_eaten
+        score = simulated.score
+        snake_length = simulated.snake_length
+        moves_count = len(simulated.moves)
+    duration_seconds = moves_count * SEED_MOVE_MS // 1000
+    started_at = now - timedelta(seconds=rng.randrange(365 * 24 * 3600))
+    completed = simulated is not None or rng.random() < 0.95
+    ended_at = started_at + timedelta(seconds=duration_seconds) if completed else None
+
+    game = (
+        game_id,
+        user_id,
+        score,
+        snake_length,
+        game_mode,
+        duration_seconds if completed else None,
+        moves_count,
+        food_eaten,
+        started_at,
+        ended_at,
+        completed,
+    )
+    entry = None
+    if completed and score > 0:
+        entry = (user_id, game_id, score, snake_length, game_mode, ended_at)
+    return game, entry
+
+
+def seed_database(
+    users: int,
+    games: int,
+    batch_size: int = 50_000,
+    random_seed=0,
+    policies: Optional[Sequence[str]] = None,
+    processes: int = 0,
+    max_ticks: int = simulator.MAX_TICKS,
+    save_replays: bool = False,
+):
+    """Bulk-load synthetic users, games and leaderboard entries.
+
+    Scores follow a long-tailed distribution and a few users play most of
+    the games. With policies, each game is instead played by one of those
+    simulator bots (on processes processes), and save_replays stores its
+    move log as the game's replay. Rows are added next to any existing data
+    with COPY on PostgreSQL (executemany elsewhere), committing every
+    batch_size rows; the rank counters and user stats are rebuilt at the end.
+    """
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(random_seed)
+    run = f"{rng.getrandbits(32):08x}"
+    hashed_password = get_password_hash(SEED_PASSWORD)
+    now = datetime.utcnow()
+    started = time.perf_counter()
+    entries = 0
+
+    with engine.connect() as connection:
+        first_user = _next_id(connection, models.User)
+        first_game = _next_id(connection, models.Game)
+
+        print(f"Seeding {users} users...")
+        for start in range(0, users, batch_size):
+            rows = []
+            for user_id in range(
+                first_user + start, first_user + min(users, start + batch_size)
+            ):
+                created_at = now - timedelta(seconds=rng.randrange(400 * 24 * 3600))
+                rows.append(
+                    (
+                        user_id,
+                        f"seed_{run}_{user_id}",
+                        hashed_password,
+                        created_at,
+                        created_at,
+                        True,
+                    )
+                )
+            _bulk_insert(connection, models.User, _USER_COLUMNS, rows)
+            connection.commit()
+
+        print(f"Seeding {games} games...")
+        simulated = None
+        if policies:
+            simulated = simulator.simulate(
+                games,
+                policies,
+                processes=processes,
+                max_ticks=max_ticks,
+                random_seed=random_seed,
+            )
+        for start in range(0, games, batch_size):
+            game_rows, entry_rows = [], []
+            for game_id in range(
+                first_game + start, first_game + min(games, start + batch_size)
+            ):
+                # Skewed towards the first users: a few play most games
+                user_id = first_user + int(users * rng.random() ** 2)
+                played = next(simulated) if simulated else None
+                game, entry = _seed_game(rng, game_id, user_id, now, played)
+                if played and save_replays:
+                    replays.save(game_id, replays.pack(played.seed, played.moves))
+                game_rows.append(game)
+                if entry:
+                    entry_rows.append(entry)
+            _bulk_insert(connection, models.Game, _GAME_COLUMNS, game_rows)
+            if entry_rows:
+                _bulk_insert(
+                    connection, models.LeaderboardEntry, _ENTRY_COLUMNS, entry_rows
+                )
+            connection.commit()
+            entries += len(entry_rows)
+
+            done = min(games, start + batch_size)
+            elapsed = time.perf_counter() - started
+            print(f"  {done}/{games} games, {done / elapsed:.0f} games/s")
+
+        if connection.dialect.name == "postgresql":
+            # Ids were assigned here, so move the sequences past them
+            for table in ("users", "games"):
+                connection.exec_driver_sql(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"(SELECT MAX(id) FROM {table}))"
+                )
+            connection.commit()
+
+    print("Rebuilding rank counters and user stats...")
+    db = SessionLocal()
+    try:
+        crud.rebuild_leaderboard_score_counts(db)
+        crud.rebuild_user_stats(db)
+    finally:
+        db.close()
+
+    print(
+        f"✓ Seeded {users} users, {games} games and {entries} leaderboard entries "
+        f"in {time.perf_counter() - started:.1f}s (password: {SEED_PASSWORD})"
+    )
+
+
+def seed_command(arguments):
+    """Parse the --seed options and seed the database"""
+    parser = argparse.ArgumentParser(
+        prog="init_db.py --seed",
+        description="Bulk-load synthetic data for capacity testing",
+    )
+    parser.add_argument("--users", type=simulator._positive_int, default=1000)
+    parser.add_argument("--games", type=simulator._positive_int, default=100_000)
+    parser.add_argument(
+        "--batch-size",
+        type=simulator._positive_int,
+        default=50_000,
+        help="rows per insert and commit",
+    )
+    parser.add_argument("--random-seed", type=int, default=0)
+    parser.add_argument(
+        "--simulate",
+        metavar="POLICIES",
+        help="play the games with these simulator bots, e.g. greedy,random,wall",
+    )
+    parser.add_argument("--processes", type=int, default=0, help="0: one per CPU")
+    parser.add_argument("--max-ticks", type=int, default=simulator.MAX_TICKS)
+    parser.add_argument(
+        "--replays", action="store_true", help="store simulated move logs as replays"
+    )
+    args = parser.parse_args(arguments)
+    seed_database(
+        args.users,
+        args.games,
+        args.batch_size,
+        args.random_seed,
+        args.simulate.split(",") if args.simulate else None,
+        args.processes,
+        args.max_ticks,
+        args.replays,
+    )
+
+
 if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == "--drop":
         drop_all_tables()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--check-ranks":
+        check_ranks()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--rebuild-ranks":
+        rebuild_ranks()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--rebuild-stats":
+        rebuild_stats()
+    elif len(sys.argv) > 2 and sys.argv[1] == "--grant-admin":
+        set_admin(sys.argv[2])
+    elif len(sys.argv) > 2 and sys.argv[1] == "--revoke-admin":
+        set_admin(sys.argv[2], is_admin=False)
+    elif len(sys.argv) > 1 and sys.argv[1] == "--verify-replays":
+        verify_replays()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--seed":
+        seed_command(sys.argv[2:])
     else:
         init_database()
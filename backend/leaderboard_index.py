@@ -0,0 +1,305 @@
+"""
+Process-local sorted leaderboard index
+
+Keeps every leaderboard entry in per-mode sorted lists ordered by
+(score desc, id asc) so top-N leaderboard reads are served from memory
+instead of a join and ORDER BY on every request.
+
+The index is warmed at startup and then caught up periodically from the
+database, because entries written by other workers are not seen locally.
+Reads fall back to SQL whenever the index is cold or has not been refreshed
+recently (see ``LEADERBOARD_INDEX_STALE_SECONDS``).
+
+Listeners (see leaderboard_stream.py) are told about every entry added or
+caught up, with its position, under the index lock, so the order they see
+is the order of the index. Each change bumps ``seq``, which ``snapshot``
+returns with the rows it read.
+"""
+
+import os
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import models
+from sortedcontainers import SortedList
+from sqlalchemy.orm import Session
+
+# Seconds between catch-up refreshes from the database
+REFRESH_SECONDS = float(os.getenv("LEADERBOARD_INDEX_REFRESH_SECONDS", "5"))
+# Seconds between full rebuilds (picks up deleted users and renames)
+FULL_REFRESH_SECONDS = float(os.getenv("LEADERBOARD_INDEX_FULL_REFRESH_SECONDS", "300"))
+# Serve from SQL if the index has not been refreshed for this long
+STALE_SECONDS = float(os.getenv("LEADERBOARD_INDEX_STALE_SECONDS", "15"))
+# Ids below the highest one read that each catch-up reads again: a lower id
+# can commit after a higher one (PostgreSQL sequences hand them out before
+# the commit), and would otherwise wait for the next full rebuild
+CATCH_UP_WINDOW = int(os.getenv("LEADERBOARD_INDEX_CATCH_UP_WINDOW", "1000"))
+
+# Row layout kept per entry (plain tuples keep the index compact)
+_ID, _USER_ID, _USERNAME, _SCORE, _SNAKE_LENGTH, _GAME_MODE, _CREATED_AT = range(7)
+
+
+def _key(row: tuple) -> tuple:
+    return (-row[_SCORE], row[_ID])
+
+
+class LeaderboardIndex:
+    """Order-statistic index of leaderboard entries per game mode"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clear()
+        self._refreshed_at: Optional[float] = None
+        self._rebuilt_at: Optional[float] = None
+        self._warming = False
+        self._pending: List[tuple] = []
+        self._listeners = []
+        self.seq = 0
+        # Bumped by invalidate: loads started before it are discarded
+        self._generation = 0
+
+    def _clear(self):
+        self._rows, self._by_mode, self._best, self._all = self._build([])
+        # Highest id read from the database. Entries this worker adds itself
+        # don't move it: another worker may have committed lower ids that
+        # catch_up has not read yet
+        self._loaded_id = 0
+
+    @staticmethod
+    def _build(rows: List[tuple]) -> tuple:
+        """Rows, per-mode keys, per-user bests and all keys for rows, built
+        from scratch (shares nothing, so needs no lock)"""
+        by_mode = {mode: [] for mode in models.GameMode}
+        best = {mode: {} for mode in models.GameMode}
+        for row in rows:
+            key = _key(row)
+            by_mode[row[_GAME_MODE]].append(key)
+            mode_best = best[row[_GAME_MODE]]
+            if row[_USER_ID] not in mode_best or key < mode_best[row[_USER_ID]]:
+                mode_best[row[_USER_ID]] = key
+        return (
+            {row[_ID]: row for row in rows},
+            {mode: SortedList(keys) for mode, keys in by_mode.items()},
+            best,
+            SortedList(key for keys in by_mode.values() for key in keys),
+        )
+
+    def _insert(self, row: tuple) -> bool:
+        if row[_ID] in self._rows:
+            return False
+        self.seq += 1
+        key = _key(row)
+        self._rows[row[_ID]] = row
+        self._by_mode[row[_GAME_MODE]].add(key)
+        self._all.add(key)
+
+        best = self._best[row[_GAME_MODE]]
+        if row[_USER_ID] not in best or key < best[row[_USER_ID]]:
+            best[row[_USER_ID]] = key
+        return True
+
+    def _notify(self, row: tuple):
+        """Tell listeners about a new row: its positions in its mode and
+        across modes (0-based, in (score desc, id asc) order)"""
+        key = _key(row)
+        for listener in self._listeners:
+            listener.entry_added(
+                self.seq,
+                self._as_dict(key),
+                self._by_mode[row[_GAME_MODE]].index(key),
+                self._all.index(key),
+            )
+
+    def add_listener(self, listener):
+        """Register an object with entry_added(seq, entry, position,
+        overall_position) and rebuilt(seq) methods"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def is_warm(self) -> bool:
+        """Whether the index is loaded and was refreshed recently"""
+        return (
+            self._refreshed_at is not None
+            and time.monotonic() - self._refreshed_at < STALE_SECONDS
+        )
+
+    def invalidate(self):
+        """Drop the index; reads use SQL until the next rebuild"""
+        with self._lock:
+            self._clear()
+            self._generation += 1
+            self._refreshed_at = None
+            self._rebuilt_at = None
+
+    def add(self, entry: models.LeaderboardEntry, username: str):
+        """Add a freshly committed entry (ignored while the index is cold)"""
+        row = (
+            entry.id,
+            entry.user_id,
+            username,
+            entry.score,
+            entry.snake_length,
+            entry.game_mode,
+            entry.created_at,
+        )
+        with self._lock:
+            if self._warming:
+                self._pending.append(row)
+            if self._refreshed_at is not None and self._insert(row):
+                self._notify(row)
+
+    def _rank(self, game_mode: models.GameMode, score: int) -> int:
+        return self._by_mode[game_mode].bisect_left((-score, 0)) + 1
+
+    def rank(self, game_mode: models.GameMode, score: int) -> int:
+        """Competition rank of a score within a mode (1 + entries scoring higher)"""
+        with self._lock:
+            return self._rank(game_mode, score)
+
+    def _as_dict(self, key: tuple) -> dict:
+        row = self._rows[key[1]]
+        return {
+            "id": row[_ID],
+            "user_id": row[_USER_ID],
+            "username": row[_USERNAME],
+            "score": row[_SCORE],
+            "snake_length": row[_SNAKE_LENGTH],
+            "game_mode": row[_GAME_MODE],
+            "rank": self._rank(row[_GAME_MODE], row[_SCORE]),
+            "created_at": row[_CREATED_AT],
+        }
+
+    def top(
+        self, game_mode: Optional[models.GameMode] = None, limit: int = 10
+    ) -> Optional[List[dict]]:
+        """Top entries with live ranks, or None if the index cannot serve them"""
+        snapshot = self.snapshot(game_mode, limit)
+        return None if snapshot is None else snapshot[1]
+
+    def snapshot(
+        self, game_mode: Optional[models.GameMode] = None, limit: int = 10
+    ) -> Optional[Tuple[int, List[dict]]]:
+        """top() with the seq it was read at, or None if the index cannot
+        serve it"""
+        if not self.is_warm():
+            return None
+
+        with self._lock:
+            keys = (self._by_mode[game_mode] if game_mode else self._all)[:limit]
+            return self.seq, [self._as_dict(key) for key in keys]
+
+    def around(
+        self, game_mode: models.GameMode, user_id: int, radius: int = 10
+    ) -> Optional[dict]:
+        """A user's best entry with up to radius neighbours on each side.
+
+        Returns None if the index cannot serve the request, and a result
+        without entries if the user has no entry in the mode.
+        """
+        if not self.is_warm():
+            return None
+
+        with self._lock:
+            key = self._best[game_mode].get(user_id)
+            if key is None:
+                return {"rank": None, "entries": []}
+
+            entries = self._by_mode[game_mode]
+            position = entries.index(key)
+            window = entries[max(0, position - radius) : position + radius + 1]
+            return {
+                "rank": self._rank(game_mode, -key[0]),
+                "entries": [self._as_dict(neighbour) for neighbour in window],
+            }
+
+    def _load(self, db: Session, after_id: int = 0) -> List[tuple]:
+        return [
+            tuple(row)
+            for row in db.query(
+                models.LeaderboardEntry.id,
+                models.LeaderboardEntry.user_id,
+                models.User.username,
+                models.LeaderboardEntry.score,
+                models.LeaderboardEntry.snake_length,
+                models.LeaderboardEntry.game_mode,
+                models.LeaderboardEntry.created_at,
+            )
+            .join(models.User)
+            .filter(models.LeaderboardEntry.id > after_id)
+            .order_by(models.LeaderboardEntry.id)
+        ]
+
+    def rebuild(self, db: Session):
+        """Reload every entry from the database"""
+        with self._lock:
+            self._warming = True
+            self._pending = []
+            generation = self._generation
+        try:
+            rows = self._load(db)
+            # Built outside the lock, so adds and reads (from the event loop
+            # too) only wait for the swap
+            built = self._build(rows)
+        except Exception:
+            with self._lock:
+                self._warming = False
+            raise
+
+        with self._lock:
+            if generation != self._generation:
+                # Invalidated while loading: the rows may predate a delete
+                # or rename, so leave the index cold for the next rebuild
+                self._warming = False
+                self._pending = []
+                return
+            self._rows, self._by_mode, self._best, self._all = built
+            self._loaded_id = rows[-1][_ID] if rows else 0
+            # Entries committed while the snapshot was being read
+            for row in self._pending:
+                self._insert(row)
+            self._warming = False
+            self._pending = []
+            self._refreshed_at = self._rebuilt_at = time.monotonic()
+            # Entries may have gone (deleted users) or been renamed
+            self.seq += 1
+            for listener in self._listeners:
+                listener.rebuilt(self.seq)
+
+    def catch_up(self, db: Session):
+        """Load entries committed by other workers since the last refresh.
+
+        The last CATCH_UP_WINDOW ids already read are read again, for entries
+        that committed late; those already indexed are skipped.
+        """
+        with self._lock:
+            generation = self._generation
+            after_id = max(0, self._loaded_id - CATCH_UP_WINDOW)
+        rows = self._load(db, after_id=after_id)
+        with self._lock:
+            if generation != self._generation or self._rebuilt_at is None:
+                return
+            for row in rows:
+                if self._insert(row):
+                    self._notify(row)
+            if rows:
+                self._loaded_id = max(self._loaded_id, rows[-1][_ID])
+            self._refreshed_at = time.monotonic()
+
+    def refresh(self, db: Session):
+        """Rebuild when cold or due, otherwise catch up incrementally"""
+        if (
+            self._rebuilt_at is None
+            or time.monotonic() - self._rebuilt_at >= FULL_REFRESH_SECONDS
+        ):
+            self.rebuild(db)
+        else:
+            self.catch_up(db)
+
+
+index = LeaderboardIndex()
@@ -0,0 +1,284 @@
+"""
+Cross-worker leaderboard snapshot in a memory-mapped file
+
+uvicorn runs several worker processes, and each keeps its own caches. The
+top-K leaderboard of every game mode (and of all modes) is instead published
+once, as ready-to-send JSON, into a file under /dev/shm that every worker
+maps. A worker answers ``GET /api/leaderboard`` by slicing the rows it needs
+out of the mapping, without a query or any encoding, so memory stays
+constant as workers are added and every worker serves the same ranking.
+
+One writer: the worker holding an exclusive ``flock`` on ``<path>.lock``
+publishes; the others keep trying the lock so a replacement takes over if
+that worker exits. Readers never lock. The writer brackets each publish
+with a sequence counter (odd while writing) and readers retry if the
+counter moved while they copied, a seqlock.
+
+Freshness: any worker that changes the leaderboard stores a fresh random
+token in the header (``mark_dirty``). The writer records the token a
+publish started from; while the two differ, readers treat the snapshot as
+dirty and fall back to their local path, so a finished game is never
+missing from the leaderboard its player loads next.
+
+File layout (little endian)::
+
+    header  magic "SLB1", seq u64, requested u64, published u64,
+            published_at f64, data_length u32
+    data    per section: key u8, rows u16, rows x end offset u32,
+            body length u32, body
+
+A section body is ``[row,row,...`` without the closing bracket; the first
+n rows are ``body[:end[n - 1]] + "]"``.
+"""
+
+import logging
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+from typing import Callable, List, Optional
+
+import models
+import schemas
+from database import shared_memory_path
+from pydantic import TypeAdapter
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+# Snapshot file; an empty value disables the snapshot
+PATH = os.getenv(
+    "LEADERBOARD_SNAPSHOT_PATH", shared_memory_path("leaderboard.snapshot")
+)
+# Size of the mapping; a snapshot that does not fit is not published
+SIZE_BYTES = int(os.getenv("LEADERBOARD_SNAPSHOT_BYTES", str(1024 * 1024)))
+# Rows published per section (the leaderboard endpoint's maximum limit)
+TOP_K = int(os.getenv("LEADERBOARD_SNAPSHOT_TOP_K", "100"))
+# Seconds between the writer's checks for a dirty snapshot
+POLL_SECONDS = float(os.getenv("LEADERBOARD_SNAPSHOT_POLL_SECONDS", "0.1"))
+# Seconds between unconditional republishes (picks up renames and deletes)
+REFRESH_SECONDS = float(os.getenv("LEADERBOARD_SNAPSHOT_REFRESH_SECONDS", "30"))
+# Readers ignore a snapshot that has not been published for this long
+STALE_SECONDS = float(os.getenv("LEADERBOARD_SNAPSHOT_STALE_SECONDS", "90"))
+
+_MAGIC = b"SLB1"
+_HEADER = struct.Struct("<4s4xQQQdI")
+_SEQ_OFFSET = 8
+_REQUESTED_OFFSET = 16
+_PUBLISHED_OFFSET = 24
+_U64 = struct.Struct("<Q")
+_PUBLISHED = struct.Struct("<QdI")
+_SECTION = struct.Struct("<BH")
+_U32 = struct.Struct("<I")
+
+_row_json = TypeAdapter(schemas.LeaderboardRow)
+
+# Section keys: 0 is every mode, then one per GameMode
+_SECTIONS: List[Optional[models.GameMode]] = [None, *models.GameMode]
+
+
+class LeaderboardSnapshot:
+    """Seqlock-protected top-K leaderboard JSON shared by all workers"""
+
+    def __init__(self, path: str = PATH, size: int = SIZE_BYTES, top_k: int = TOP_K):
+        self.path = path
+        self.size = size
+        self.top_k = top_k
+        self.hits = 0
+        self.misses = 0
+        self.publishes = 0
+        self._map = None
+        self._lock_fd: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path) and fcntl is not None
+
+    def _mapping(self):
+        if self._map is None:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                # Only ever grow the file: shrinking it under another
+                # worker's mapping would crash that worker on access
+                if os.fstat(fd).st_size < self.size:
+                    os.ftruncate(fd, self.size)
+                self._map = mmap.mmap(fd, self.size)
+            finally:
+                os.close(fd)
+        return self._map
+
+    def is_writer(self) -> bool:
+        return self._lock_fd is not None
+
+    def acquire_writer(self) -> bool:
+        """Become the writer if no other worker is; returns whether we are"""
+        if not self.enabled:
+            return False
+        if self._lock_fd is None:
+            fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+            self._lock_fd = fd
+        return True
+
+    def release_writer(self):
+        """Withdraw the snapshot and let another worker take over"""
+        if self._lock_fd is None:
+            return
+        self._write(0, b"")
+        fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        os.close(self._lock_fd)
+        self._lock_fd = None
+
+    def mark_dirty(self):
+        """Record that the leaderboard changed since the last publish"""
+        if self.enabled:
+            _U64.pack_into(
+                self._mapping(), _REQUESTED_OFFSET, random.getrandbits(64) | 1
+            )
+
+    def needs_publish(self) -> bool:
+        """Whether the writer should publish (dirty, old or never published)"""
+        _, _, requested, published, published_at, _ = _HEADER.unpack_from(
+            self._mapping()
+        )
+        return requested != published or time.time() - published_at > REFRESH_SECONDS
+
+    def publish(self, load: Callable[[Optional[models.GameMode], int], List[dict]]):
+        """Write the top-K rows of every section, as returned by load(mode, k)"""
+        mapping = self._mapping()
+        # Read the token before querying: a change committed after this
+        # point leaves the snapshot dirty until the next publish
+        (requested,) = _U64.unpack_from(mapping, _REQUESTED_OFFSET)
+
+        data = bytearray()
+        for key, game_mode in enumerate(_SECTIONS):
+            rows = [
+                _row_json.dump_json(_row_json.validate_python(row))
+                for row in load(game_mode, self.top_k)
+            ]
+            ends, body = [], bytearray(b"[")
+            for row in rows:
+                if len(body) > 1:
+                    body += b","
+                body += row
+                ends.append(len(body))
+            data += _SECTION.pack(key, len(rows))
+            data += b"".join(_U32.pack(end) for end in ends)
+            data += _U32.pack(len(body)) + body
+
+        if _HEADER.size + len(data) > self.size:
+            logger.warning(
+                "Leaderboard snapshot needs %d bytes, more than the %d mapped",
+                _HEADER.size + len(data),
+                self.size,
+            )
+            self._write(0, b"")
+            return
+        self._write(requested, bytes(data))
+        self.publishes += 1
+
+    def _write(self, published: int, data: bytes):
+        mapping = self._mapping()
+        with self._lock:
+            (seq,) = _U64.unpack_from(mapping, _SEQ_OFFSET)
+            writing = (seq + 1) | 1
+            _U64.pack_into(mapping, _SEQ_OFFSET, writing)
+            mapping[0:4] = _MAGIC
+            mapping[_HEADER.size : _HEADER.size + len(data)] = data
+            # Leave "requested" alone: other workers may be marking it
+            _PUBLISHED.pack_into(
+                mapping,
+                _PUBLISHED_OFFSET,
+                published,
+                time.time() if data else 0.0,
+                len(data),
+            )
+            _U64.pack_into(mapping, _SEQ_OFFSET, writing + 1)
+
+    def read(self, game_mode: Optional[models.GameMode], limit: int) -> Optional[bytes]:
+        """JSON of the top limit entries, or None if the snapshot can't serve it"""
+        body = self._read(game_mode, limit) if self.enabled else None
+        if body is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return body
+
+    def _read(self, game_mode: Optional[models.GameMode], limit: int):
+        if limit > self.top_k:
+            return None
+        mapping = self._mapping()
+        for _ in range(8):
+            magic, seq, requested, published, published_at, length = (
+                _HEADER.unpack_from(mapping)
+            )
+            if magic != _MAGIC or not published_at:
+                return None
+            if seq & 1:
+                continue
+            if requested != published or time.time() - published_at > STALE_SECONDS:
+                return None
+
+            body = self._section(mapping, _SECTIONS.index(game_mode), limit, length)
+            if _U64.unpack_from(mapping, _SEQ_OFFSET)[0] == seq:
+                return body
+        return None
+
+    def _section(self, mapping, key: int, limit: int, length: int) -> Optional[bytes]:
+        # Offsets come from a possibly torn read, so bound every access;
+        # the caller discards the result unless the sequence is unchanged
+        offset, end = _HEADER.size, _HEADER.size + min(length, self.size)
+        while offset + _SECTION.size <= end:
+            section, rows = _SECTION.unpack_from(mapping, offset)
+            offset += _SECTION.size
+            ends_at = offset
+            offset += rows * _U32.size
+            if offset + _U32.size > end:
+                return None
+            (body_length,) = _U32.unpack_from(mapping, offset)
+            offset += _U32.size
+            if section == key:
+                if rows == 0:
+                    return b"[]"
+                (row_end,) = _U32.unpack_from(
+                    mapping, ends_at + (min(limit, rows) - 1) * _U32.size
+                )
+                if row_end > body_length or offset + row_end > end:
+                    return None
+                return bytes(mapping[offset : offset + row_end]) + b"]"
+            offset += body_length
+        return None
+
+    def stats(self) -> dict:
+        """Hit/miss and publish counters"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "writer": self.is_writer(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "publishes": self.publishes,
+        }
+
+
+snapshot = LeaderboardSnapshot()
+
+
+def publish_if_needed(load: Callable[[Optional[models.GameMode], int], List[dict]]):
+    """Publish from this worker if it is (or can become) the writer and the
+    snapshot is dirty or due a refresh"""
+    if snapshot.acquire_writer() and snapshot.needs_publish():
+        snapshot.publish(load)
@@ -0,0 +1,295 @@
+"""
+Live leaderboard over Server-Sent Events
+
+``GET /api/leaderboard/stream?game_mode=&limit=`` sends the top ``limit``
+entries once (``event: snapshot``) and then only what changes them
+(``event: diff``), instead of viewers polling ``GET /api/leaderboard``::
+
+    event: diff
+    data: {"seq": 42, "inserted": [{"position": 3, "entry": {...}}]}
+
+An inserted entry goes in at ``position`` (0-based); the entries from there
+down move one place, those scoring less than it gain one rank, and the list
+is cut back to ``limit``. Inserts are listed in the order to apply them.
+A snapshot carries the ``seq`` it was read at; diffs only hold later
+inserts.
+
+Changes come from the in-memory ``leaderboard_index``: entries committed by
+this worker as they are published, and other workers' entries when the
+index catches up (``LEADERBOARD_INDEX_REFRESH_SECONDS``). One task per
+worker gathers them for ``LEADERBOARD_STREAM_BATCH_MS`` and encodes each
+batch once per (game mode, limit) for all the viewers sharing it, so an
+idle viewer costs a parked generator and the keep-alive comment sent every
+``LEADERBOARD_STREAM_KEEPALIVE_SECONDS``.
+
+Backpressure: each viewer queues at most ``LEADERBOARD_STREAM_QUEUE``
+messages. A viewer that falls further behind has its backlog dropped and
+gets a fresh snapshot once it reads again; a full index rebuild resyncs
+every viewer the same way.
+"""
+
+import asyncio
+import os
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+
+import crud
+import leaderboard_index
+import models
+import orjson
+from database import SessionLocal
+
+# Milliseconds to gather entries before sending them
+BATCH_MS = float(os.getenv("LEADERBOARD_STREAM_BATCH_MS", "250"))
+# Messages queued per viewer before it is resynced with a snapshot
+QUEUE = int(os.getenv("LEADERBOARD_STREAM_QUEUE", "32"))
+# Seconds between keep-alive comments (proxies drop silent connections)
+KEEPALIVE_SECONDS = float(os.getenv("LEADERBOARD_STREAM_KEEPALIVE_SECONDS", "15"))
+
+_KEEPALIVE = b": keep-alive\n\n"
+
+# A queued message: the seqs of its first and last insert (None for a
+# keep-alive), those inserts, and the encoded frame
+Message = Tuple[Optional[int], Optional[int], list, bytes]
+
+
+def frame(event: str, data) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+class Viewer:
+    """One stream's bounded message queue"""
+
+    def __init__(self, game_mode: Optional[models.GameMode], limit: int):
+        self.game_mode = game_mode
+        self.limit = limit
+        self.messages = deque()
+        # Seq of the last snapshot sent; None until one is
+        self.since: Optional[int] = None
+        self.stale = True
+        self.resyncs = 0
+        self._ready = asyncio.Event()
+
+    def push(self, message: Message):
+        if self.stale:
+            return
+        if len(self.messages) >= QUEUE:
+            # Too far behind for diffs to be worth sending: start over
+            self.messages.clear()
+            self.stale = True
+            self.resyncs += 1
+        else:
+            self.messages.append(message)
+        self._ready.set()
+
+    def resync(self):
+        self.messages.clear()
+        self.stale = True
+        self._ready.set()
+
+    async def get(self) -> Optional[Message]:
+        """Next message, or None when a snapshot is due"""
+        while not self.messages and not self.stale:
+            self._ready.clear()
+            await self._ready.wait()
+        return None if self.stale else self.messages.popleft()
+
+
+class LeaderboardStream:
+    """Fans leaderboard index inserts out to stream viewers"""
+
+    def __init__(
+        self,
+        index: leaderboard_index.LeaderboardIndex = leaderboard_index.index,
+        batch: float = BATCH_MS / 1000,
+        keepalive: float = KEEPALIVE_SECONDS,
+    ):
+        self.index = index
+        self.batch = batch
+        self.keepalive = keepalive
+        self.batches = 0
+        self.inserts = 0
+        self.frames = 0
+        self._viewers: Dict[Tuple[Optional[models.GameMode], int], Set[Viewer]] = {}
+        # Last snapshot frame per (game mode, limit), with its seq
+        self._snapshots: Dict[Tuple[Optional[models.GameMode], int], tuple] = {}
+        # Appended to under the index lock, from any thread
+        self._inserts = deque()
+        self._resync = False
+        self._signalled = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # Index listener; called with the index lock held
+
+    def entry_added(self, seq: int, entry: dict, position: int, overall: int):
+        if self._viewers:
+            self._inserts.append((seq, entry, position, overall))
+            self._signal()
+
+    def rebuilt(self, seq: int):
+        if self._viewers:
+            self._resync = True
+            self._signal()
+
+    def _signal(self):
+        if not self._signalled and self._loop is not None:
+            self._signalled = True
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    # Viewers
+
+    def subscribe(self, game_mode: Optional[models.GameMode], limit: int) -> Viewer:
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self.index.add_listener(self)
+            self._task = asyncio.create_task(self._run())
+        viewer = Viewer(game_mode, limit)
+        self._viewers.setdefault((game_mode, limit), set()).add(viewer)
+        return viewer
+
+    def unsubscribe(self, viewer: Viewer):
+        viewers = self._viewers.get((viewer.game_mode, viewer.limit))
+        if viewers is not None:
+            viewers.discard(viewer)
+            if not viewers:
+                del self._viewers[(viewer.game_mode, viewer.limit)]
+
+    async def _snapshot(self, viewer: Viewer) -> bytes:
+        # Viewers connecting together share one snapshot until the next change
+        key = (viewer.game_mode, viewer.limit)
+        cached = self._snapshots.get(key)
+        if cached is None or cached[0] != self.index.seq:
+            snapshot = self.index.snapshot(viewer.game_mode, viewer.limit)
+            if snapshot is None:
+                # Cold index: read the database, and don't keep the result,
+                # since seq doesn't follow the database
+                self._snapshots.pop(key, None)
+                seq = self.index.seq
+                entries = await asyncio.to_thread(
+                    _read_leaderboard, viewer.game_mode, viewer.limit
+                )
+                cached = (seq, frame("snapshot", {"seq": seq, "entries": entries}))
+            else:
+                seq, entries = snapshot
+                cached = self._snapshots[key] = (
+                    seq,
+                    frame("snapshot", {"seq": seq, "entries": entries}),
+                )
+            self.frames += 1
+        viewer.since, viewer.stale = cached[0], False
+        return cached[1]
+
+    async def events(self, game_mode: Optional[models.GameMode], limit: int):
+        """A stream body: subscribes when the response starts and unsubscribes
+        when the client goes away"""
+        viewer = self.subscribe(game_mode, limit)
+        try:
+            while True:
+                message = await viewer.get()
+                if message is None:
+                    yield await self._snapshot(viewer)
+                    continue
+                first, last, inserted, data = message
+                if first is None or first > viewer.since:
+                    yield data
+                elif last > viewer.since:
+                    # Straddles the snapshot: only its later inserts
+                    later = [item for item in inserted if item[0] > viewer.since]
+                    self.frames += 1
+                    yield self._diff(later)
+        finally:
+            self.unsubscribe(viewer)
+
+    # Fan-out
+
+    def _diff(self, inserted: list) -> bytes:
+        return frame(
+            "diff",
+            {
+                "seq": inserted[-1][0],
+                "inserted": [
+                    {"position": position, "entry": entry}
+                    for _, entry, position in inserted
+                ],
+            },
+        )
+
+    def _broadcast(self):
+        inserts = []
+        while self._inserts:
+            inserts.append(self._inserts.popleft())
+        resync, self._resync = self._resync, False
+        self.batches += 1
+        self.inserts += len(inserts)
+
+        for (game_mode, limit), viewers in list(self._viewers.items()):
+            if resync:
+                for viewer in list(viewers):
+                    viewer.resync()
+                continue
+            inserted = [
+                (seq, entry, position if game_mode else overall)
+                for seq, entry, position, overall in inserts
+                if game_mode is None or entry["game_mode"] == game_mode
+            ]
+            inserted = [item for item in inserted if item[2] < limit]
+            if not inserted:
+                continue
+            message = (inserted[0][0], inserted[-1][0], inserted, self._diff(inserted))
+            self.frames += 1
+            for viewer in list(viewers):
+                viewer.push(message)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.keepalive)
+            except asyncio.TimeoutError:
+                for viewers in list(self._viewers.values()):
+                    for viewer in list(viewers):
+                        viewer.push((None, None, [], _KEEPALIVE))
+                continue
+            # Let the batch fill up
+            await asyncio.sleep(self.batch)
+            self._wake.clear()
+            self._signalled = False
+            self._broadcast()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self.index.remove_listener(self)
+            self._task = self._loop = self._wake = None
+            self._signalled = False
+        self._inserts.clear()
+        self._snapshots.clear()
+
+    def stats(self) -> dict:
+        """Viewer and fan-out counters"""
+        viewers = [viewer for group in self._viewers.values() for viewer in group]
+        return {
+            "viewers": len(viewers),
+            "groups": len(self._viewers),
+            "batches": self.batches,
+            "inserts": self.inserts,
+            "frames_encoded": self.frames,
+            "resyncs": sum(viewer.resyncs for viewer in viewers),
+        }
+
+
+def _read_leaderboard(game_mode: Optional[models.GameMode], limit: int) -> List[dict]:
+    db = SessionLocal()
+    try:
+        return crud.get_leaderboard(db, game_mode=game_mode, limit=limit)
+    finally:
+        db.close()
+
+
+stream = LeaderboardStream()
@@ -1,21 +1,83 @@
-from typing import List
+import asyncio
+from contextlib import asynccontextmanager
+from typing import List, Optional
 
+import arena as arena_rooms
+import auth as auth_utils
+import cache
+import crud
+import group_commit
+import leaderboard_index
+import leaderboard_snapshot
+import leaderboard_stream
 import models
 import schemas
-from database import engine, get_db
-from fastapi import Depends, FastAPI, HTTPException
+import score_sketch
+import singleflight
+import write_behind
+from database import engine, get_db, refresh_periodically, run_with_session
+from fastapi import Depends, FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
-from routers import auth, games, leaderboard
+from pagination import NEXT_CURSOR_HEADER, decode_cursor, set_next_cursor
+from routers import arena, auth, export, games, leaderboard
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
 
 models.Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Snake Game API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the in-memory leaderboard structures and keep them caught up
+    refreshers = [
+        asyncio.create_task(
+            refresh_periodically(
+                leaderboard_index.index.refresh, leaderboard_index.REFRESH_SECONDS
+            )
+        ),
+        asyncio.create_task(
+            refresh_periodically(
+                score_sketch.sketch.rebuild, score_sketch.REFRESH_SECONDS
+            )
+        ),
+        # Publish the cross-worker snapshot (only the writer worker does)
+        asyncio.create_task(
+            refresh_periodically(
+                crud.publish_leaderboard_snapshot, leaderboard_snapshot.POLL_SECONDS
+            )
+        ),
+    ]
+    if write_behind.buffer.enabled:
+        refreshers.append(
+            asyncio.create_task(
+                refresh_periodically(
+                    write_behind.buffer.flush, write_behind.FLUSH_SECONDS
+                )
+            )
+        )
+    yield
+    for refresher in refreshers:
+        refresher.cancel()
+    await group_commit.queue.stop()
+    await arena_rooms.scheduler.stop()
+    await leaderboard_stream.stream.stop()
+    # Don't lose buffered progress on a clean shutdown
+    if write_behind.buffer.enabled:
+        await asyncio.to_thread(run_with_session, write_behind.buffer.flush)
+    leaderboard_snapshot.snapshot.release_writer()
+    leaderboard_index.index.invalidate()
+    score_sketch.sketch.invalidate()
+    await asyncio.to_thread(auth_utils.password_pool.shutdown)
+
+
+app = FastAPI(title="Snake Game API", lifespan=lifespan)
 
 # Include routers
 app.include_router(auth.router)
 app.include_router(games.router)
 app.include_router(leaderboard.router)
+app.include_router(export.router)
+app.include_router(arena.router)
 
 # Configure CORS
 app.add_middleware(
@@ -24,6 +86,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
 
 
@@ -32,6 +95,21 @@ def read_root():
     return {"message": "Snake Game API"}
 
 
+@app.get("/api/metrics")
+def read_metrics():
+    """Internal counters for capacity monitoring"""
+    return {
+        "arena": arena_rooms.scheduler.stats(),
+        "password_hashing": auth_utils.password_pool.stats(),
+        "caches": cache.stats(),
+        "group_commit": group_commit.queue.stats(),
+        "leaderboard_snapshot": leaderboard_snapshot.snapshot.stats(),
+        "leaderboard_stream": leaderboard_stream.stream.stats(),
+        "singleflight": singleflight.stats(),
+        "write_behind": write_behind.buffer.stats(),
+    }
+
+
 @app.post("/api/scores", response_model=schemas.Score)
 def create_score(score: schemas.ScoreCreate, db: Session = Depends(get_db)):
     db_score = models.Score(player_name=score.player_name, score=score.score)
@@ -42,14 +120,28 @@ def create_score(score: schemas.ScoreCreate, db: Session = Depends(get_db)):
 
 
 @app.get("/api/scores", response_model=List[schemas.Score])
-def get_scores(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    scores = (
+def get_scores(
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    # Scores without a value can't be paged by (score, id), nor returned as
+    # schemas.Score, so they are left out
+    query = (
         db.query(models.Score)
-        .order_by(models.Score.score.desc())
-        .offset(skip)
-        .limit(limit)
-        .all()
+        .filter(models.Score.score.isnot(None))
+        .order_by(models.Score.score.desc(), models.Score.id.desc())
     )
+    if cursor:
+        after = decode_cursor(cursor, int, int)
+        query = query.filter(tuple_(models.Score.score, models.Score.id) < after)
+    elif skip:
+        query = query.offset(skip)
+
+    scores = query.limit(limit).all()
+    set_next_cursor(response, scores, limit, lambda score: (score.score, score.id))
     return scores
 
 
@@ -2,7 +2,17 @@ import enum
 from datetime import datetime
 
 from database import Base
-from sqlalchemy import Boolean, Column, DateTime, Enum, ForeignKey, Integer, String
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    Enum,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    false,
+)
 from sqlalchemy.orm import relationship
 
 
@@ -23,12 +33,17 @@ class User(Base):
         DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False
     )
     is_active = Column(Boolean, default=True, nullable=False)
+    # May call the admin endpoints; granted with init_db.py --grant-admin
+    is_admin = Column(Boolean, default=False, server_default=false(), nullable=False)
 
     # Relationships
     games = relationship("Game", back_populates="user", cascade="all, delete-orphan")
     leaderboard_entries = relationship(
         "LeaderboardEntry", back_populates="user", cascade="all, delete-orphan"
     )
+    stats = relationship(
+        "UserStats", back_populates="user", cascade="all, delete-orphan"
+    )
 
 
 class Game(Base):
@@ -47,10 +62,16 @@ class Game(Base):
     started_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     ended_at = Column(DateTime, nullable=True)
     is_completed = Column(Boolean, default=False, nullable=False)
+    # Whether an uploaded replay reproduces the score and snake length
+    replay_verified = Column(
+        Boolean, default=False, server_default=false(), nullable=False
+    )
 
     # Relationships
     user = relationship("User", back_populates="games")
 
+    __table_args__ = (Index("ix_games_user_started_id", "user_id", "started_at", "id"),)
+
 
 class LeaderboardEntry(Base):
     __tablename__ = "leaderboard_entries"
@@ -63,13 +84,51 @@ class LeaderboardEntry(Base):
     score = Column(Integer, nullable=False, index=True)
     snake_length = Column(Integer, nullable=False)
     game_mode = Column(Enum(GameMode), nullable=False, index=True)
-    rank = Column(Integer, nullable=True)  # Overall rank
+    rank = Column(Integer, nullable=True)  # Rank at submission time
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
     # Relationships
     user = relationship("User", back_populates="leaderboard_entries")
     game = relationship("Game")
 
+    __table_args__ = (
+        Index("ix_leaderboard_entries_mode_score_id", "game_mode", "score", "id"),
+    )
+
+
+class LeaderboardScoreCount(Base):
+    """Number of leaderboard entries per (game_mode, score).
+
+    Ranks are derived from this table instead of being stored on every entry:
+    the rank of a score is one plus the number of entries with a strictly
+    higher score, which only touches the distinct scores above it.
+    """
+
+    __tablename__ = "leaderboard_score_counts"
+
+    game_mode = Column(Enum(GameMode), primary_key=True)
+    score = Column(Integer, primary_key=True)
+    entry_count = Column(Integer, default=0, nullable=False)
+
+
+class UserStats(Base):
+    """Completed-game totals per user and game mode, kept up to date by
+    complete_game so profile stats never aggregate over the games table."""
+
+    __tablename__ = "user_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    game_mode = Column(Enum(GameMode), primary_key=True)
+    games_played = Column(Integer, default=0, nullable=False)
+    total_score = Column(Integer, default=0, nullable=False)
+    best_score = Column(Integer, default=0, nullable=False)
+    updated_at = Column(
+        DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False
+    )
+
+    # Relationships
+    user = relationship("User", back_populates="stats")
+
 
 # Keep Score model for backward compatibility
 class Score(Base):
@@ -79,3 +138,5 @@ class Score(Base):
     player_name = Column(String, index=True)
     score = Column(Integer)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (Index("ix_scores_score_id", "score", "id"),)
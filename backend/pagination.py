@@ -0,0 +1,53 @@
+"""
+Opaque cursors for keyset pagination
+
+A cursor encodes the sort key of the last row of a page (for example
+``(started_at, id)``); the next page continues strictly after it, so deep
+pages cost the same as the first and rows don't shift between pages when
+new ones are inserted.
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Callable, List, Sequence
+
+from fastapi import HTTPException, Response, status
+
+# Response header carrying the cursor of the next page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values) -> str:
+    """Encode sort key values as an opaque URL-safe cursor"""
+    payload = json.dumps(
+        [
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in values
+        ],
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *types: Callable) -> tuple:
+    """Decode a cursor, converting each value with the matching type"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError("wrong number of cursor values")
+        return tuple(convert(value) for convert, value in zip(types, values))
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+
+
+def set_next_cursor(
+    response: Response, rows: List, limit: int, key: Callable[..., Sequence]
+):
+    """Advertise the next page's cursor when this page came back full"""
+    if rows and len(rows) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*key(rows[-1]))
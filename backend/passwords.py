@@ -0,0 +1,21 @@
+"""
+Password hashing primitives
+
+Kept free of app imports so the password hashing worker processes (see
+auth.password_pool) only need passlib to start.
+"""
+
+from passlib.context import CryptContext
+
+# Password hashing
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password against its hash"""
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def get_password_hash(password: str) -> str:
+    """Hash a password"""
+    return pwd_context.hash(password)
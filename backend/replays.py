@@ -0,0 +1,187 @@
+"""
+Packed game replays stored as sidecar files
+
+A replay is the move log of a game (``snake_engine.Direction`` per tick)
+and the seed its food was placed from. It is stored run-length encoded:
+
+    header  magic "SRP1", seed u32, ticks u32 (little endian)
+    runs    one byte per run: direction << 6 | (ticks - 1), 1 to 64 ticks;
+            longer runs take several bytes
+
+Snakes turn every few ticks, so a 10,000-move game packs into a few KB.
+Each replay is a file ``<REPLAY_DIR>/<game_id>.replay``, written
+atomically. ``REPLAY_DIR`` defaults to ``replays`` next to a SQLite
+database, or in the backend directory for other databases; in Docker it is
+a persisted volume. ``GET /api/games/{game_id}/replay`` serves a replay
+straight from disk with ``Range`` support (``FileRangeResponse``), reading
+only the requested bytes, in chunks.
+"""
+
+import itertools
+import os
+import re
+import struct
+from typing import Optional, Tuple
+
+import anyio
+from database import SQLALCHEMY_DATABASE_URL
+from sqlalchemy.engine import make_url
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+
+def _default_dir() -> str:
+    url = make_url(SQLALCHEMY_DATABASE_URL)
+    if url.get_backend_name() == "sqlite" and url.database not in (
+        None,
+        "",
+        ":memory:",
+    ):
+        return os.path.join(os.path.dirname(os.path.abspath(url.database)), "replays")
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "replays")
+
+
+# Directory holding the replay files (absolute: workers may not share a cwd)
+REPLAY_DIR = os.path.abspath(os.getenv("REPLAY_DIR") or _default_dir())
+
+MAGIC = b"SRP1"
+_HEADER = struct.Struct("<4sII")
+_MAX_RUN = 64
+# Move log characters in uploads, by Direction value
+DIRECTION_CHARS = "URDL"
+MEDIA_TYPE = "application/x-snake-replay"
+# Bytes read and sent at a time
+CHUNK_SIZE = 64 * 1024
+
+
+def pack(seed: int, moves: bytes) -> bytes:
+    """Encode a seed and a move log of Direction values"""
+    runs = bytearray()
+    for direction, group in itertools.groupby(moves):
+        length = sum(1 for _ in group)
+        while length:
+            run = min(length, _MAX_RUN)
+            runs.append(direction << 6 | (run - 1))
+            length -= run
+    return _HEADER.pack(MAGIC, seed, len(moves)) + bytes(runs)
+
+
+def unpack(data: bytes) -> Tuple[int, bytes]:
+    """Decode a packed replay into its seed and move log"""
+    magic, seed, ticks = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a packed replay")
+    moves = b"".join(
+        bytes([run >> 6]) * ((run & 0x3F) + 1) for run in data[_HEADER.size :]
+    )
+    if len(moves) != ticks:
+        raise ValueError("Truncated replay")
+    return seed, moves
+
+
+def parse_moves(text: str) -> bytes:
+    """Move log from its "URDL" text form"""
+    return text.translate(_TO_DIRECTION).encode("latin-1")
+
+
+def format_moves(moves: bytes) -> str:
+    """ "URDL" text form of a move log"""
+    return moves.decode("latin-1").translate(_TO_CHAR)
+
+
+_TO_DIRECTION = {ord(char): chr(value) for value, char in enumerate(DIRECTION_CHARS)}
+_TO_CHAR = {value: char for value, char in enumerate(DIRECTION_CHARS)}
+
+
+def path(game_id: int) -> str:
+    return os.path.join(REPLAY_DIR, f"{game_id}.replay")
+
+
+def save(game_id: int, data: bytes):
+    """Store a game's packed replay, replacing any previous one"""
+    os.makedirs(REPLAY_DIR, exist_ok=True)
+    temporary = f"{path(game_id)}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(data)
+    os.replace(temporary, path(game_id))
+
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) of a single "bytes=" range, or None for the
+    whole file (no header, or one this doesn't handle, like multiple ranges)"""
+    match = _RANGE.fullmatch(header.strip()) if header else None
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable(header)
+    return start, end
+
+
+class FileRangeResponse(Response):
+    """Bytes start..end (inclusive) of an open file, read with pread a chunk
+    at a time; closes the file when done"""
+
+    def __init__(
+        self,
+        fd: int,
+        start: int,
+        end: int,
+        status_code: int = 200,
+        headers: Optional[dict] = None,
+        media_type: Optional[str] = None,
+    ):
+        self.fd = fd
+        self.start = start
+        self.count = end - start + 1
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+        self.headers["content-length"] = str(self.count)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        try:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": self.status_code,
+                    "headers": self.raw_headers,
+                }
+            )
+            if scope["method"] == "HEAD":
+                await send({"type": "http.response.body", "body": b""})
+                return
+            offset, remaining = self.start, self.count
+            while remaining:
+                # pread may return fewer bytes than asked for
+                chunk = await anyio.to_thread.run_sync(
+                    os.pread, self.fd, min(remaining, CHUNK_SIZE), offset
+                )
+                if not chunk:
+                    raise RuntimeError("Replay file shrank while being sent")
+                offset += len(chunk)
+                remaining -= len(chunk)
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": remaining > 0,
+                    }
+                )
+            if not self.count:
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            os.close(self.fd)
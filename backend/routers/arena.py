@@ -0,0 +1,85 @@
+"""
+Multiplayer arena WebSocket
+
+``/api/arena/{room_id}?token=<access token>`` joins (or opens) a room. The
+server sends ``{"player": id}``, a keyframe and then one delta per tick
+(see arena.py); the client sends ``{"turn": "U" | "R" | "D" | "L"}``.
+Browsers can't set headers on a WebSocket, hence the token in the query.
+"""
+
+import asyncio
+import json
+
+import arena
+from auth import get_current_active_user, get_current_user
+from database import AsyncSessionLocal
+from fastapi import APIRouter, HTTPException, Query, WebSocket
+from models import GameMode
+from replays import DIRECTION_CHARS
+
+router = APIRouter(prefix="/api/arena", tags=["arena"])
+
+# Close codes: policy violation, try again later
+_UNAUTHORIZED = 1008
+_ROOM_FULL = 1013
+
+
+async def _send(websocket: WebSocket, subscriber: arena.Subscriber):
+    while True:
+        await websocket.send_text(await subscriber.get())
+
+
+@router.websocket("/{room_id}")
+async def play(
+    websocket: WebSocket,
+    room_id: str,
+    token: str = Query(...),
+    game_mode: GameMode = GameMode.WALLS,
+):
+    """Play in a room; game_mode only applies when the room is opened"""
+    # A short session: a connection held for the whole game would pin a
+    # pool connection per player
+    try:
+        async with AsyncSessionLocal() as db:
+            user = await get_current_active_user(
+                await get_current_user(token=token, db=db)
+            )
+    except HTTPException:
+        await websocket.close(code=_UNAUTHORIZED)
+        return
+
+    room = arena.scheduler.room(room_id, game_mode)
+    try:
+        player = room.join(user.username)
+    except arena.RoomFull:
+        arena.scheduler.release(room)
+        await websocket.close(code=_ROOM_FULL)
+        return
+
+    await websocket.accept()
+    await websocket.send_json({"player": player.id})
+    subscriber = room.subscribe()
+    sender = asyncio.create_task(_send(websocket, subscriber))
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            # JSON in a text or a binary frame; anything else is ignored,
+            # like any other unknown message
+            data = message.get("text")
+            if data is None:
+                data = message.get("bytes")
+            try:
+                payload = json.loads(data) if data is not None else None
+            except ValueError:
+                continue
+            turn = payload.get("turn") if isinstance(payload, dict) else None
+            if isinstance(turn, str) and len(turn) == 1 and turn in DIRECTION_CHARS:
+                room.turn(player.id, DIRECTION_CHARS.index(turn))
+    finally:
+        sender.cancel()
+        await asyncio.gather(sender, return_exceptions=True)
+        room.unsubscribe(subscriber)
+        room.leave(player.id)
+        arena.scheduler.release(room)
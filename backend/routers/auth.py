@@ -4,17 +4,17 @@ Authentication endpoints for signup, login, and user management
 
 from datetime import timedelta
 
-import crud
+import async_crud
 import schemas
 from auth import (
     ACCESS_TOKEN_EXPIRE_MINUTES,
     create_access_token,
     get_current_active_user,
 )
-from database import get_db
+from database import get_async_db
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
@@ -22,10 +22,10 @@ router = APIRouter(prefix="/api/auth", tags=["auth"])
 @router.post(
     "/signup", response_model=schemas.User, status_code=status.HTTP_201_CREATED
 )
-def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def signup(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Register a new user"""
     # Check if username already exists
-    db_user = crud.get_user_by_username(db, username=user.username)
+    db_user = await async_crud.get_user_by_username(db, username=user.username)
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -34,7 +34,7 @@ def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
 
     # Check if email already exists
     if user.email:
-        db_user = crud.get_user_by_email(db, email=user.email)
+        db_user = await async_crud.get_user_by_email(db, email=user.email)
         if db_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -42,15 +42,18 @@ def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
             )
 
     # Create new user
-    return crud.create_user(db=db, user=user)
+    return await async_crud.create_user(db=db, user=user)
 
 
 @router.post("/login", response_model=schemas.Token)
-def login(
-    form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
+async def login(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Login with username and password to get access token"""
-    user = crud.authenticate_user(db, form_data.username, form_data.password)
+    user = await async_crud.authenticate_user(
+        db, form_data.username, form_data.password
+    )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -73,9 +76,13 @@ def login(
 
 
 @router.post("/login/json", response_model=schemas.Token)
-def login_json(credentials: schemas.UserLogin, db: Session = Depends(get_db)):
+async def login_json(
+    credentials: schemas.UserLogin, db: AsyncSession = Depends(get_async_db)
+):
     """Login with JSON body (alternative to form-based login)"""
-    user = crud.authenticate_user(db, credentials.username, credentials.password)
+    user = await async_crud.authenticate_user(
+        db, credentials.username, credentials.password
+    )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -0,0 +1,115 @@
+"""
+Admin data export endpoints
+
+Stream every game or leaderboard entry matching the filters as NDJSON (one
+JSON object per line) or CSV. Rows are read through a server-side cursor in
+batches and encoded batch by batch into the response, so memory stays flat
+however many rows are exported. Restricted to admins (users.is_admin).
+"""
+
+import csv
+import enum
+import io
+from datetime import datetime
+from typing import Callable, Iterator, Optional
+
+import crud
+import models
+import orjson
+from auth import get_current_admin_user
+from database import get_session_factory
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.engine import Result
+from sqlalchemy.orm import Session
+
+router = APIRouter(
+    prefix="/api/export",
+    tags=["export"],
+    dependencies=[Depends(get_current_admin_user)],
+)
+
+_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _csv_value(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _csv_lines(rows) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def _encode(
+    session_factory: Callable[[], Session],
+    export: Callable[[Session], Result],
+    format: str,
+) -> Iterator[bytes]:
+    # The export opens its own session when the body is streamed: the
+    # request's dependencies are closed by then
+    db = session_factory()
+    try:
+        result = export(db)
+        if format == "csv":
+            # Even with no rows
+            yield _csv_lines([list(result.keys())])
+        for rows in result.partitions():
+            if format == "ndjson":
+                yield b"".join(orjson.dumps(dict(row._mapping)) + b"\n" for row in rows)
+            else:
+                yield _csv_lines([_csv_value(value) for value in row] for row in rows)
+    finally:
+        db.close()
+
+
+def _stream(
+    session_factory: Callable[[], Session],
+    name: str,
+    export: Callable[[Session], Result],
+    format: str,
+) -> StreamingResponse:
+    return StreamingResponse(
+        _encode(session_factory, export, format),
+        media_type=_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{format}"'},
+    )
+
+
+@router.get("/games")
+def export_games(
+    session_factory: Callable[[], Session] = Depends(get_session_factory),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    game_mode: Optional[models.GameMode] = None,
+    since: Optional[datetime] = Query(None, description="Started at or after"),
+    until: Optional[datetime] = Query(None, description="Started before"),
+):
+    """Stream games as NDJSON or CSV"""
+    return _stream(
+        session_factory,
+        "games",
+        lambda db: crud.export_games(db, game_mode, since, until),
+        format,
+    )
+
+
+@router.get("/leaderboard")
+def export_leaderboard(
+    session_factory: Callable[[], Session] = Depends(get_session_factory),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    game_mode: Optional[models.GameMode] = None,
+    since: Optional[datetime] = Query(None, description="Created at or after"),
+    until: Optional[datetime] = Query(None, description="Created before"),
+):
+    """Stream leaderboard entries, with usernames, as NDJSON or CSV"""
+    return _stream(
+        session_factory,
+        "leaderboard",
+        lambda db: crud.export_leaderboard_entries(db, game_mode, since, until),
+        format,
+    )
@@ -2,15 +2,24 @@
 Game session management endpoints
 """
 
-from typing import List
+import asyncio
+import os
+from datetime import datetime
+from typing import List, Optional
 
-import crud
+import async_crud
+import group_commit
 import models
+import replays
 import schemas
+import snake_engine
+import versions
+import write_behind
 from auth import get_current_active_user
-from database import get_db
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from database import get_async_db
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from pagination import decode_cursor, set_next_cursor
+from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter(prefix="/api/games", tags=["games"])
 
@@ -19,7 +28,7 @@ router = APIRouter(prefix="/api/games", tags=["games"])
 async def start_game(
     game_create: schemas.GameCreate,
     current_user: models.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Start a new game session"""
     # Ensure the user is creating a game for themselves
@@ -29,19 +38,40 @@ async def start_game(
             detail="Cannot create game for another user",
         )
 
-    game = crud.create_game(db=db, game=game_create)
+    game = await async_crud.create_game(db=db, game=game_create)
     return game
 
 
+@router.post(
+    "/batch",
+    response_model=List[schemas.SubmittedGame],
+    status_code=status.HTTP_201_CREATED,
+)
+async def submit_games(
+    batch: schemas.GameBatch,
+    current_user: models.User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Submit completed games played offline, auto-submitting positive scores
+    to the leaderboard; everything is stored in one transaction"""
+    submitted = await async_crud.create_completed_games(
+        db, current_user.id, current_user.username, batch.games
+    )
+    return [
+        schemas.SubmittedGame(game=game, leaderboard_entry=entry)
+        for game, entry in submitted
+    ]
+
+
 @router.patch("/{game_id}", response_model=schemas.Game)
 async def update_game_state(
     game_id: int,
     game_update: schemas.GameUpdate,
     current_user: models.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Update game state (score, length, etc.)"""
-    game = crud.get_game(db, game_id)
+    game = await async_crud.get_game(db, game_id)
     if not game:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Game not found"
@@ -54,7 +84,21 @@ async def update_game_state(
             detail="Cannot update another user's game",
         )
 
-    updated_game = crud.update_game(db, game_id, game_update)
+    # Opt-in write-behind: buffer progress of a running game in memory
+    fields = game_update.model_dump(exclude_unset=True)
+    if not game.is_completed and write_behind.buffer.accepts(fields):
+        pending = write_behind.buffer.put(game_id, game.user_id, fields)
+        return write_behind.overlay(game, pending)
+
+    # Written through, after anything still buffered for the game
+    pending = write_behind.buffer.take(game_id)
+    if pending:
+        game_update = schemas.GameUpdate(**{**pending, **fields})
+
+    try:
+        updated_game = await async_crud.update_game(db, game_id, game_update)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     return updated_game
 
 
@@ -63,10 +107,10 @@ async def end_game(
     game_id: int,
     final_data: schemas.GameUpdate,
     current_user: models.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """End a game and auto-submit to leaderboard"""
-    game = crud.get_game(db, game_id)
+    game = await async_crud.get_game(db, game_id)
     if not game:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Game not found"
@@ -79,27 +123,44 @@ async def end_game(
             detail="Cannot end another user's game",
         )
 
-    # Mark game as completed
-    completed_game = crud.complete_game(
-        db,
-        game_id,
-        final_score=final_data.score or game.score,
-        snake_length=final_data.snake_length or game.snake_length,
-    )
+    # Buffered progress is committed together with the final result
+    progress = write_behind.buffer.take(game_id)
 
-    # Auto-submit to leaderboard if score > 0
-    leaderboard_entry = None
-    if completed_game.score > 0:
-        leaderboard_entry = crud.create_leaderboard_entry(
+    # Complete the game and auto-submit to leaderboard if score > 0,
+    # committed together (and with other games', if group commit is on).
+    # The game is loaded afresh for this, not from the cache
+    if group_commit.queue.enabled:
+        finished = await group_commit.queue.submit(
+            group_commit.Finish(
+                game_id,
+                final_data.score,
+                final_data.snake_length,
+                current_user.username,
+                progress,
+            )
+        )
+    else:
+        finished = await async_crud.finish_game(
             db,
-            schemas.LeaderboardEntryCreate(
-                user_id=current_user.id,
-                game_id=game_id,
-                score=completed_game.score,
-                snake_length=completed_game.snake_length,
-                game_mode=completed_game.game_mode,
-            ),
+            game_id,
+            final_score=final_data.score,
+            snake_length=final_data.snake_length,
+            username=current_user.username,
+            progress=progress,
+        )
+    if finished is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Game not found"
         )
+    completed_game, leaderboard_entry = finished
+
+    percentile = None
+    if leaderboard_entry:
+        percentile = (
+            await async_crud.get_score_percentile(
+                db, leaderboard_entry.game_mode, leaderboard_entry.score
+            )
+        )["percentile"]
 
     # Convert to Pydantic models for serialization
     game_response = schemas.Game.model_validate(completed_game)
@@ -112,6 +173,7 @@ async def end_game(
     return {
         "game": game_response,
         "leaderboard_entry": leaderboard_response,
+        "percentile": round(percentile, 2) if percentile is not None else None,
         "message": "Game completed and submitted to leaderboard"
         if leaderboard_entry
         else "Game completed",
@@ -120,13 +182,29 @@ async def end_game(
 
 @router.get("/my-games", response_model=List[schemas.Game])
 async def get_my_games(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 20,
+    cursor: Optional[str] = None,
     current_user: models.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    """Get current user's game history"""
-    games = crud.get_games_by_user(db, current_user.id, skip, limit)
+    """Get current user's game history, newest first.
+
+    Pass the X-Next-Cursor header of a page as cursor to get the next one.
+    """
+    etag = versions.counters.etag(
+        [versions.user_scope(current_user.id)], "my-games", skip, limit, cursor
+    )
+    unchanged = versions.not_modified(request, etag)
+    if unchanged:
+        return unchanged
+
+    before = decode_cursor(cursor, datetime.fromisoformat, int) if cursor else None
+    games = await async_crud.get_games_by_user(db, current_user.id, skip, limit, before)
+    set_next_cursor(response, games, limit, lambda game: (game.started_at, game.id))
+    versions.set_etag(response, etag)
     return games
 
 
@@ -134,10 +212,10 @@ async def get_my_games(
 async def get_game(
     game_id: int,
     current_user: models.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Get a specific game by ID"""
-    game = crud.get_game(db, game_id)
+    game = await async_crud.get_game(db, game_id)
     if not game:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Game not found"
@@ -150,4 +228,112 @@ async def get_game(
             detail="Cannot view another user's game",
         )
 
-    return game
+    return write_behind.overlay(game, write_behind.buffer.pending(game_id))
+
+
+@router.put("/{game_id}/replay", response_model=schemas.ReplayInfo)
+async def upload_replay(
+    game_id: int,
+    upload: schemas.ReplayUpload,
+    current_user: models.User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Store the move log of a finished game, replacing any previous one.
+
+    The log must replay to the game's stored score and snake length.
+    """
+    game = await async_crud.get_game(db, game_id)
+    if not game:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Game not found"
+        )
+
+    # Verify the game belongs to the current user
+    if game.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Cannot upload a replay of another user's game",
+        )
+
+    if not game.is_completed:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Game is not finished"
+        )
+
+    moves = replays.parse_moves(upload.moves)
+    claim = snake_engine.Claim(
+        game.game_mode, upload.seed, moves, game.score, game.snake_length
+    )
+    if not await asyncio.to_thread(snake_engine.verify, claim):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Replay does not reproduce the game's score and length",
+        )
+    data = replays.pack(upload.seed, moves)
+    await asyncio.to_thread(replays.save, game_id, data)
+    if not await async_crud.mark_replay_verified(
+        db, game_id, game.user_id, game.score, game.snake_length
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Game result changed while the replay was checked",
+        )
+    return schemas.ReplayInfo(game_id=game_id, ticks=len(moves), size_bytes=len(data))
+
+
+@router.get("/{game_id}/replay")
+async def download_replay(
+    game_id: int,
+    request: Request,
+    current_user: models.User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Download the packed replay of one of the user's games, or of any game
+    on the leaderboard (supports Range requests)"""
+    game = await async_crud.get_game(db, game_id)
+    if not game:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Game not found"
+        )
+
+    # Other users' replays are public once the game is on the leaderboard
+    if game.user_id != current_user.id and not (
+        await async_crud.game_has_leaderboard_entry(db, game_id)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Cannot view another user's replay",
+        )
+
+    try:
+        fd = os.open(replays.path(game_id), os.O_RDONLY)
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Replay not found"
+        )
+
+    size = os.fstat(fd).st_size
+    headers = {"Accept-Ranges": "bytes"}
+    try:
+        byte_range = replays.parse_range(request.headers.get("range"), size)
+    except replays.RangeNotSatisfiable:
+        os.close(fd)
+        return Response(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={**headers, "Content-Range": f"bytes */{size}"},
+        )
+
+    if byte_range is None:
+        return replays.FileRangeResponse(
+            fd, 0, size - 1, headers=headers, media_type=replays.MEDIA_TYPE
+        )
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return replays.FileRangeResponse(
+        fd,
+        start,
+        end,
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        headers=headers,
+        media_type=replays.MEDIA_TYPE,
+    )
@@ -1,20 +1,63 @@
 """
 Leaderboard endpoints
+
+The leaderboard and stats responses are encoded once from their typed
+schemas and the JSON bytes are kept in the query cache, tagged with the
+tables they were built from, so a repeated request neither queries nor
+serializes until a write invalidates it. Responses carry ETags from the
+shared version counters (see versions.py), and a matching If-None-Match is
+answered with 304 before any of that.
 """
 
 from typing import List, Optional
 
+import auth
+import cache
 import crud
+import leaderboard_snapshot
+import leaderboard_stream
 import models
+import schemas
+import singleflight
+import versions
 from database import get_db
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
 
-router = APIRouter(prefix="/api/leaderboard", tags=["leaderboard"])
+router = APIRouter(
+    prefix="/api/leaderboard",
+    tags=["leaderboard"],
+    default_response_class=ORJSONResponse,
+)
+
+_leaderboard_json = TypeAdapter(List[schemas.LeaderboardRow])
+_stats_json = TypeAdapter(schemas.UserStats)
+
+
+def _encode(adapter: TypeAdapter, value) -> bytes:
+    """Validate value against a response schema and dump it as JSON bytes"""
+    return adapter.dump_json(adapter.validate_python(value), exclude_unset=True)
+
 
+def _cached_json(key: tuple, tables: tuple, build) -> Response:
+    """Respond with the JSON bytes from build(), cached under key.
 
-@router.get("", response_model=List[dict])
+    Concurrent misses for the same key share one build (see singleflight),
+    unless one of the tables was invalidated in between.
+    """
+    body = cache.queries.get(key)
+    if body is None:
+        table_versions = cache.queries.versions(tables)
+        body = singleflight.leaderboard_reads.do((key, table_versions), build)
+        cache.queries.set(key, body, tables, table_versions)
+    return Response(content=body, media_type="application/json")
+
+
+@router.get("", response_model=List[schemas.LeaderboardRow])
 def get_leaderboard(
+    request: Request,
     game_mode: Optional[models.GameMode] = Query(
         None, description="Filter by game mode"
     ),
@@ -22,24 +65,146 @@ def get_leaderboard(
     db: Session = Depends(get_db),
 ):
     """Get leaderboard entries, optionally filtered by game mode"""
-    leaderboard = crud.get_leaderboard(db, game_mode=game_mode, limit=limit)
-    return leaderboard
+    etag = versions.counters.etag(
+        [versions.leaderboard_scope(game_mode)], "leaderboard", limit
+    )
+    unchanged = versions.not_modified(request, etag)
+    if unchanged:
+        return unchanged
 
+    # Only the shared snapshot is known to include every write up to the
+    # version read above; the local fallbacks may lag other workers, so
+    # their responses are not tagged
+    shared = leaderboard_snapshot.snapshot.read(game_mode, limit)
+    if shared is not None:
+        response = Response(content=shared, media_type="application/json")
+        versions.set_etag(response, etag)
+        return response
 
-@router.get("/stats/{username}", response_model=dict)
-def get_user_stats(username: str, db: Session = Depends(get_db)):
-    """Get statistics for a specific user"""
+    return _cached_json(
+        ("leaderboard_json", game_mode, limit),
+        ("leaderboard_entries", "users"),
+        lambda: _encode(
+            _leaderboard_json,
+            crud.get_leaderboard(db, game_mode=game_mode, limit=limit),
+        ),
+    )
+
+
+@router.get("/around/{username}", response_model=schemas.LeaderboardAround)
+def get_leaderboard_around(
+    username: str,
+    game_mode: models.GameMode = Query(..., description="Game mode to rank in"),
+    radius: int = Query(
+        10, ge=0, le=50, description="Number of neighbours above and below"
+    ),
+    db: Session = Depends(get_db),
+):
+    """Get a user's rank with the players directly above and below them"""
     user = crud.get_user_by_username(db, username)
     if not user:
-        return {
-            "error": "User not found",
-            "user_id": None,
-            "games_played": 0,
-            "total_score": 0,
-            "best_score": 0,
-            "average_score": 0,
-        }
-
-    stats = crud.get_user_stats(db, user.id)
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
+
+    around = crud.get_leaderboard_around(db, user.id, game_mode, radius)
+    if not around:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No leaderboard entries for this game mode",
+        )
+
+    return {
+        "username": username,
+        "user_id": user.id,
+        "game_mode": game_mode,
+        "rank": around["rank"],
+        "entries": around["entries"],
+    }
+
+
+@router.get("/percentile", response_model=schemas.ScorePercentile)
+def get_score_percentile(
+    game_mode: models.GameMode = Query(..., description="Game mode to compare in"),
+    score: int = Query(..., ge=0, description="Score to look up"),
+    db: Session = Depends(get_db),
+):
+    """Get the percentage of leaderboard entries a score beats"""
+    percentile = crud.get_score_percentile(db, game_mode, score)
+    return {
+        "game_mode": game_mode,
+        "score": score,
+        "percentile": round(percentile["percentile"], 2),
+        "error_bound": round(percentile["error_bound"], 2),
+    }
+
+
+@router.get("/stream", response_class=StreamingResponse)
+async def stream_leaderboard(
+    game_mode: Optional[models.GameMode] = Query(
+        None, description="Filter by game mode"
+    ),
+    limit: int = Query(10, ge=1, le=100, description="Number of entries to watch"),
+):
+    """Stream the top entries, then their changes, as Server-Sent Events"""
+    return StreamingResponse(
+        leaderboard_stream.stream.events(game_mode, limit),
+        media_type="text/event-stream",
+        # Tell nginx not to buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/stats/{username}", response_model=schemas.UserStats)
+def get_user_stats(username: str, request: Request, db: Session = Depends(get_db)):
+    """Get statistics for a specific user"""
+    user_id = _user_id(db, username)
+    if user_id is None:
+        return _cached_json(
+            ("stats_json", username),
+            ("users",),
+            lambda: _encode(_stats_json, _user_not_found()),
+        )
+
+    etag = versions.counters.etag([versions.user_scope(user_id)], "stats", username)
+    unchanged = versions.not_modified(request, etag)
+    if unchanged:
+        return unchanged
+
+    response = _cached_json(
+        ("stats_json", username, etag),
+        ("users", "user_stats"),
+        lambda: _encode(_stats_json, _user_stats(db, user_id, username)),
+    )
+    versions.set_etag(response, etag)
+    return response
+
+
+def _user_id(db: Session, username: str) -> Optional[int]:
+    """Resolve a username from the user snapshots cache, else the database"""
+    version, user = auth.cached_user(username)
+    if user is None:
+        db_user = crud.get_user_by_username(db, username)
+        if db_user is None:
+            return None
+        user = schemas.User.model_validate(db_user)
+        auth.cache_user(username, version, user)
+    return user.id
+
+
+def _user_not_found() -> dict:
+    return {
+        "error": "User not found",
+        "user_id": None,
+        "games_played": 0,
+        "total_score": 0,
+        "best_score": 0,
+        "average_score": 0,
+        "modes": {},
+    }
+
+
+def _user_stats(db: Session, user_id: int, username: str) -> dict:
+    stats = crud.get_user_stats(db, user_id)
     stats["username"] = username
     return stats
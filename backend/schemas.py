@@ -1,8 +1,8 @@
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
 
 from models import GameMode
-from pydantic import BaseModel, EmailStr, field_validator
+from pydantic import BaseModel, EmailStr, Field, ValidationInfo, field_validator
 
 
 # Auth Schemas
@@ -41,6 +41,7 @@ class User(UserBase):
     created_at: datetime
     updated_at: datetime
     is_active: bool
+    is_admin: bool = False
 
     class Config:
         from_attributes = True
@@ -60,8 +61,12 @@ class GameCreate(BaseModel):
     game_mode: GameMode
 
 
+# Highest score a game may report; a 20x20 board tops out far below this
+MAX_SCORE = 100_000
+
+
 class GameUpdate(BaseModel):
-    score: Optional[int] = None
+    score: Optional[int] = Field(None, le=MAX_SCORE)
     snake_length: Optional[int] = None
     duration_seconds: Optional[int] = None
     moves_count: Optional[int] = None
@@ -77,11 +82,56 @@ class Game(GameBase):
     started_at: datetime
     ended_at: Optional[datetime] = None
     is_completed: bool
+    replay_verified: bool = False
 
     class Config:
         from_attributes = True
 
 
+# Most games accepted by POST /api/games/batch
+MAX_GAME_BATCH = 1000
+
+
+class CompletedGame(BaseModel):
+    """A game played offline, submitted once it is over"""
+
+    game_mode: GameMode
+    score: int = Field(0, ge=0, le=MAX_SCORE)
+    snake_length: int = Field(1, ge=1)
+    moves_count: int = Field(0, ge=0)
+    food_eaten: int = Field(0, ge=0)
+    started_at: datetime
+    ended_at: datetime
+
+    @field_validator("started_at", "ended_at")
+    @classmethod
+    def to_naive_utc(cls, value: datetime, info: ValidationInfo) -> datetime:
+        # Stored like datetime.utcnow()
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        started_at = info.data.get("started_at")
+        if info.field_name == "ended_at" and started_at and value < started_at:
+            raise ValueError("ended_at is before started_at")
+        return value
+
+
+class GameBatch(BaseModel):
+    games: List[CompletedGame] = Field(..., min_length=1, max_length=MAX_GAME_BATCH)
+
+
+class ReplayUpload(BaseModel):
+    # Seed the game's food was placed from (see snake_engine)
+    seed: int = Field(..., ge=0, le=0xFFFFFFFF)
+    # Direction of every tick: U, R, D or L
+    moves: str = Field(..., pattern="^[URDL]*$", max_length=1_000_000)
+
+
+class ReplayInfo(BaseModel):
+    game_id: int
+    ticks: int
+    size_bytes: int
+
+
 # LeaderboardEntry Schemas
 class LeaderboardEntryBase(BaseModel):
     score: int
@@ -105,6 +155,11 @@ class LeaderboardEntry(LeaderboardEntryBase):
         from_attributes = True
 
 
+class SubmittedGame(BaseModel):
+    game: Game
+    leaderboard_entry: Optional[LeaderboardEntry] = None
+
+
 class LeaderboardEntryWithUser(LeaderboardEntry):
     username: str
 
@@ -112,6 +167,53 @@ class LeaderboardEntryWithUser(LeaderboardEntry):
         from_attributes = True
 
 
+class LeaderboardRow(BaseModel):
+    """A leaderboard listing row, ranked on read"""
+
+    id: int
+    user_id: int
+    username: str
+    score: int
+    snake_length: int
+    game_mode: GameMode
+    rank: int
+    created_at: datetime
+
+
+class LeaderboardAround(BaseModel):
+    username: str
+    user_id: int
+    game_mode: GameMode
+    rank: int
+    entries: List[LeaderboardRow]
+
+
+class ScorePercentile(BaseModel):
+    game_mode: GameMode
+    score: int
+    percentile: float
+    error_bound: float
+
+
+# Stats Schemas
+class ModeStats(BaseModel):
+    games_played: int
+    total_score: int
+    best_score: int
+    average_score: float
+
+
+class UserStats(BaseModel):
+    user_id: Optional[int] = None
+    games_played: int
+    total_score: int
+    best_score: int
+    average_score: float
+    modes: Dict[GameMode, ModeStats]
+    username: Optional[str] = None
+    error: Optional[str] = None
+
+
 # Score Schemas (backward compatibility)
 class ScoreBase(BaseModel):
     player_name: str
@@ -0,0 +1,156 @@
+"""
+Incremental score histogram for percentile lookups
+
+Keeps a per-mode histogram of leaderboard scores in fixed-width buckets,
+backed by a Fenwick tree so "you beat X% of entries" is answered in
+O(log buckets) without counting rows.
+
+Error bound: the entries in buckets below the score's bucket are counted
+exactly; entries sharing the score's bucket are never counted as beaten.
+The reported percentile therefore underestimates by at most
+``100 * bucket_count / total`` percentage points, and is exact whenever the
+score is a multiple of the bucket width. Food is worth 10 or 15 points, so
+the default width of 5 gives exact answers for real game scores.
+
+The number of buckets is capped: scores from ``(max_buckets - 1) * width``
+up share a single top bucket, so an absurd score cannot grow the histogram,
+and percentiles in that range carry the whole top bucket as their error.
+
+Like the leaderboard index, the sketch is process-local; it is rebuilt
+from ``leaderboard_score_counts`` periodically so other workers' entries
+are included, and reads fall back to SQL while it is cold or stale.
+"""
+
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import models
+from sqlalchemy.orm import Session
+
+# Width of a histogram bucket, in points
+BUCKET_WIDTH = int(os.getenv("SCORE_SKETCH_BUCKET_WIDTH", "5"))
+# Seconds between rebuilds from the database
+REFRESH_SECONDS = float(os.getenv("SCORE_SKETCH_REFRESH_SECONDS", "5"))
+# Serve from SQL if the sketch has not been rebuilt for this long
+STALE_SECONDS = float(os.getenv("SCORE_SKETCH_STALE_SECONDS", "15"))
+# Most buckets per mode; the last one also holds every higher score
+MAX_BUCKETS = int(os.getenv("SCORE_SKETCH_MAX_BUCKETS", "32768"))
+
+
+class _Histogram:
+    """Bucket counts with a Fenwick tree for prefix sums"""
+
+    def __init__(self, size: int = 64):
+        self.counts: List[int] = [0] * size
+        self.tree: List[int] = [0] * (size + 1)
+        self.total = 0
+
+    def _grow(self, bucket: int):
+        size = len(self.counts)
+        while size <= bucket:
+            size *= 2
+        self.counts.extend([0] * (size - len(self.counts)))
+
+        # Linear-time Fenwick construction from the bucket counts
+        self.tree = [0] + self.counts[:]
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                self.tree[parent] += self.tree[i]
+
+    def add(self, bucket: int, count: int):
+        if bucket >= len(self.counts):
+            self._grow(bucket)
+        self.counts[bucket] += count
+        self.total += count
+        i = bucket + 1
+        while i < len(self.tree):
+            self.tree[i] += count
+            i += i & -i
+
+    def below(self, bucket: int) -> int:
+        """Number of entries in buckets strictly below bucket"""
+        i = min(bucket, len(self.counts))
+        result = 0
+        while i > 0:
+            result += self.tree[i]
+            i -= i & -i
+        return result
+
+    def bucket_count(self, bucket: int) -> int:
+        return self.counts[bucket] if bucket < len(self.counts) else 0
+
+
+class ScoreSketch:
+    """Per-mode score histograms answering percentile queries"""
+
+    def __init__(
+        self, bucket_width: int = BUCKET_WIDTH, max_buckets: int = MAX_BUCKETS
+    ):
+        self.bucket_width = bucket_width
+        self.max_buckets = max_buckets
+        self._lock = threading.Lock()
+        self._histograms: Dict[models.GameMode, _Histogram] = {}
+        self._refreshed_at: Optional[float] = None
+
+    def _bucket(self, score: int) -> int:
+        return min(max(score, 0) // self.bucket_width, self.max_buckets - 1)
+
+    def is_warm(self) -> bool:
+        """Whether the sketch is loaded and was rebuilt recently"""
+        return (
+            self._refreshed_at is not None
+            and time.monotonic() - self._refreshed_at < STALE_SECONDS
+        )
+
+    def invalidate(self):
+        """Drop the sketch; reads use SQL until the next rebuild"""
+        with self._lock:
+            self._histograms = {}
+            self._refreshed_at = None
+
+    def add(self, game_mode: models.GameMode, score: int, count: int = 1):
+        """Record count entries with this score (ignored while cold)"""
+        with self._lock:
+            if self._refreshed_at is None:
+                return
+            histogram = self._histograms.setdefault(game_mode, _Histogram())
+            histogram.add(self._bucket(score), count)
+
+    def rebuild(self, db: Session):
+        """Reload the histograms from the per-score counters"""
+        histograms = {mode: _Histogram() for mode in models.GameMode}
+        for row in db.query(models.LeaderboardScoreCount):
+            histograms[row.game_mode].add(self._bucket(row.score), row.entry_count)
+
+        with self._lock:
+            self._histograms = histograms
+            self._refreshed_at = time.monotonic()
+
+    def percentile(self, game_mode: models.GameMode, score: int) -> Optional[dict]:
+        """Share of entries scoring below score, with its error bound.
+
+        Returns None if the sketch cannot serve the query, and a zero
+        percentile if the mode has no entries.
+        """
+        if not self.is_warm():
+            return None
+
+        with self._lock:
+            histogram = self._histograms.get(game_mode)
+            if histogram is None or histogram.total == 0:
+                return {"percentile": 0.0, "error_bound": 0.0}
+
+            bucket = self._bucket(score)
+            below = histogram.below(bucket)
+            exact = score % self.bucket_width == 0 and bucket < self.max_buckets - 1
+            uncertain = 0 if exact else histogram.bucket_count(bucket)
+            return {
+                "percentile": 100 * below / histogram.total,
+                "error_bound": 100 * uncertain / histogram.total,
+            }
+
+
+sketch = ScoreSketch()
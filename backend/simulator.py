@@ -0,0 +1,304 @@
+"""
+Headless self-play simulator
+
+Bots play complete games on ``snake_engine.SnakeGame``, the server-side
+port of the frontend rules, so every game comes with a move log that
+replays to exactly its result. Policies:
+
+- ``greedy``: heads for the food along the shortest safe move
+- ``random``: keeps going, turning at random one tick in four
+- ``wall``: goes straight until blocked, then turns clockwise if it can
+  (on pass-through boards nothing blocks it, so it mostly cruises)
+
+Games stop when the bot dies or after ``max_ticks`` moves. Work is split
+into chunks of games, each seeded from the run's seed and its index, and
+spread over a process pool, so a run is reproducible whatever the number
+of processes. Results are ``SimulatedGame`` tuples, which convert to
+``POST /api/games/batch`` and ``PUT /api/games/{game_id}/replay`` bodies
+(``completed_game``, ``replay_upload``); ``init_db.py --seed --simulate``
+bulk-loads them straight into the database instead.
+
+Usage:
+    cd backend
+    uv run python simulator.py --games 100000
+    uv run python simulator.py --games 1000 --out games.ndjson
+    uv run python simulator.py --games 5000 --post http://localhost:3000 --replays
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Iterator, List, NamedTuple, Sequence
+
+import orjson
+import replays
+from models import GameMode
+from snake_engine import GRID_SIZE, SnakeGame, position
+
+# Moves after which a game is ended, alive or not
+MAX_TICKS = 10_000
+# Games per pool task
+CHUNK_SIZE = 500
+# Milliseconds per move, as in the frontend
+MOVE_MS = 150
+
+
+class SimulatedGame(NamedTuple):
+    policy: str
+    game_mode: GameMode
+    seed: int
+    # Direction of every tick, as snake_engine.replay takes them
+    moves: bytes
+    score: int
+    snake_length: int
+    food_eaten: int
+
+
+def greedy(game: SnakeGame, rng: random.Random) -> int:
+    fx, fy = position(game.food)
+    best, best_distance = game.direction, None
+    for direction in range(4):
+        if direction == (game.direction + 2) % 4:
+            continue
+        cell = game.next_cell(direction)
+        if not game.is_free(cell):
+            continue
+        x, y = position(cell)
+        dx, dy = abs(x - fx), abs(y - fy)
+        if game.wraps:
+            dx, dy = min(dx, GRID_SIZE - dx), min(dy, GRID_SIZE - dy)
+        if best_distance is None or dx + dy < best_distance:
+            best, best_distance = direction, dx + dy
+    return best
+
+
+def random_walk(game: SnakeGame, rng: random.Random) -> int:
+    if rng.random() < 0.25:
+        return rng.randrange(4)
+    return game.direction
+
+
+def wall_hugging(game: SnakeGame, rng: random.Random) -> int:
+    for turn in (0, 1, 3):
+        direction = (game.direction + turn) % 4
+        if game.is_free(game.next_cell(direction)):
+            return direction
+    return game.direction
+
+
+POLICIES = {"greedy": greedy, "random": random_walk, "wall": wall_hugging}
+
+
+def play(
+    policy: str,
+    game_mode: GameMode,
+    seed: int,
+    rng: random.Random,
+    max_ticks: int = MAX_TICKS,
+) -> SimulatedGame:
+    """Play one game to the end with a policy"""
+    choose = POLICIES[policy]
+    game = SnakeGame(game_mode, seed)
+    moves = bytearray()
+    while game.alive and game.ticks < max_ticks:
+        game.step(choose(game, rng))
+        # Log the direction taken, not asked for: the same replay, and
+        # longer runs when packed
+        moves.append(game.direction)
+    return SimulatedGame(
+        policy,
+        game.game_mode,
+        seed,
+        bytes(moves),
+        game.score,
+        game.snake_length,
+        game.food_eaten,
+    )
+
+
+def _simulate_chunk(task) -> List[SimulatedGame]:
+    chunk, count, policies, game_modes, max_ticks, random_seed = task
+    rng = random.Random(f"{random_seed}:{chunk}")
+    return [
+        play(
+            rng.choice(policies),
+            rng.choice(game_modes),
+            rng.getrandbits(32),
+            rng,
+            max_ticks,
+        )
+        for _ in range(count)
+    ]
+
+
+def simulate(
+    games: int,
+    policies: Sequence[str] = tuple(POLICIES),
+    game_modes: Sequence[GameMode] = tuple(GameMode),
+    processes: int = 0,
+    max_ticks: int = MAX_TICKS,
+    random_seed: int = 0,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[SimulatedGame]:
+    """Play games with bots picked from policies, in order, over a pool of
+    processes (0 for one per CPU; 1 plays them in this process)"""
+    unknown = set(policies) - set(POLICIES)
+    if unknown:
+        raise ValueError(f"Unknown policies: {', '.join(sorted(unknown))}")
+    tasks = [
+        (
+            chunk,
+            min(chunk_size, games - start),
+            tuple(policies),
+            tuple(GameMode(mode) for mode in game_modes),
+            max_ticks,
+            random_seed,
+        )
+        for chunk, start in enumerate(range(0, games, chunk_size))
+    ]
+    processes = processes or os.cpu_count() or 1
+    if processes == 1:
+        for task in tasks:
+            yield from _simulate_chunk(task)
+        return
+
+    with ProcessPoolExecutor(processes) as pool:
+        # A few chunks in flight per process: results come back in order
+        # without holding the whole run in memory
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.submit(_simulate_chunk, task))
+            if len(pending) >= 2 * processes:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def completed_game(game: SimulatedGame, started_at: datetime) -> dict:
+    """The game as an item of a POST /api/games/batch body"""
+    ended_at = started_at + timedelta(milliseconds=MOVE_MS * len(game.moves))
+    return {
+        "game_mode": game.game_mode.value,
+        "score": game.score,
+        "snake_length": game.snake_length,
+        "moves_count": len(game.moves),
+        "food_eaten": game.food_eaten,
+        "started_at": started_at.isoformat(),
+        "ended_at": ended_at.isoformat(),
+    }
+
+
+def replay_upload(game: SimulatedGame) -> dict:
+    """The game's PUT /api/games/{game_id}/replay body"""
+    return {"seed": game.seed, "moves": replays.format_moves(game.moves)}
+
+
+def post_games(url: str, games: Iterator[SimulatedGame], args):
+    """Submit games through the API as one user, with their replays"""
+    import httpx
+    import schemas
+
+    credentials = {"username": args.username, "password": args.password}
+    with httpx.Client(base_url=url, timeout=60) as client:
+        client.post("/api/auth/signup", json=credentials)
+        response = client.post("/api/auth/login/json", json=credentials)
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        batch = []
+        for game in games:
+            batch.append(game)
+            if len(batch) == schemas.MAX_GAME_BATCH:
+                _post_batch(client, headers, batch, args.replays)
+                batch = []
+        if batch:
+            _post_batch(client, headers, batch, args.replays)
+
+
+def _post_batch(client, headers: dict, batch: List[SimulatedGame], upload: bool):
+    started_at = datetime.utcnow() - timedelta(days=1)
+    response = client.post(
+        "/api/games/batch",
+        json={"games": [completed_game(game, started_at) for game in batch]},
+        headers=headers,
+    )
+    response.raise_for_status()
+    if upload:
+        for game, submitted in zip(batch, response.json()):
+            client.put(
+                f"/api/games/{submitted['game']['id']}/replay",
+                json=replay_upload(game),
+                headers=headers,
+            ).raise_for_status()
+
+
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--games", type=_positive_int, default=10_000)
+    parser.add_argument(
+        "--policies", default=",".join(POLICIES), help="comma-separated bots"
+    )
+    parser.add_argument("--processes", type=int, default=0, help="0: one per CPU")
+    parser.add_argument("--max-ticks", type=int, default=MAX_TICKS)
+    parser.add_argument("--random-seed", type=int, default=0)
+    parser.add_argument("--out", help="write games and move logs as NDJSON")
+    parser.add_argument("--post", metavar="URL", help="submit games to a server")
+    parser.add_argument("--replays", action="store_true", help="upload replays too")
+    parser.add_argument("--username", default="simulator")
+    parser.add_argument("--password", default="simulator123")
+    args = parser.parse_args(arguments)
+
+    started = time.perf_counter()
+    ticks = score = 0
+    by_policy = {}
+
+    def counted(games):
+        nonlocal ticks, score
+        for game in games:
+            ticks += len(game.moves)
+            score += game.score
+            by_policy[game.policy] = by_policy.get(game.policy, 0) + 1
+            yield game
+
+    games = counted(
+        simulate(
+            args.games,
+            args.policies.split(","),
+            processes=args.processes,
+            max_ticks=args.max_ticks,
+            random_seed=args.random_seed,
+        )
+    )
+    if args.post:
+        post_games(args.post, games, args)
+    elif args.out:
+        with open(args.out, "wb") as out:
+            for game in games:
+                record = game._asdict()
+                record["moves"] = replays.format_moves(game.moves)
+                out.write(orjson.dumps(record) + b"\n")
+    else:
+        deque(games, maxlen=0)
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"{args.games} games ({by_policy}), {ticks} ticks in {elapsed:.2f}s: "
+        f"{ticks / elapsed:,.0f} ticks/s, average score {score / args.games:.1f}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Request coalescing for hot read endpoints
+
+``SingleFlight.do(key, func)`` runs func once for all concurrent callers
+with the same key: the first caller (the leader) runs it, callers arriving
+while it is in flight wait and receive the same result (or exception).
+Nothing is kept once the call finishes; it only collapses bursts.
+
+A caller that joins a flight gets a result read when the flight started,
+which can be before the caller arrived, and so before a write it has
+seen. To rule that out, put the version of the data read in the key (as
+routers/leaderboard.py does with the query cache's table versions): a
+caller arriving after an invalidation then starts a new flight.
+
+Sync endpoints run in FastAPI's threadpool, so waiting callers block their
+worker thread rather than the event loop. Like the caches, coalescing is
+per worker process.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+_registry: Dict[str, "SingleFlight"] = {}
+
+
+class _Call:
+    """One in-flight call and its outcome"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """Share one in-flight call between concurrent callers with the same key"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.leaders = 0
+        self.collapsed = 0
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        _registry[name] = self
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """Return func(), or the result of an identical call already running"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.collapsed += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> dict:
+        """Leader and collapsed-caller counters"""
+        calls = self.leaders + self.collapsed
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "collapsed": self.collapsed,
+            "collapsed_rate": round(self.collapsed / calls, 4) if calls else 0.0,
+        }
+
+
+def stats() -> dict:
+    """Counters of every registered group, by name"""
+    return {name: group.stats() for name, group in _registry.items()}
+
+
+# GET /api/leaderboard and /api/leaderboard/stats/{username}
+leaderboard_reads = SingleFlight("leaderboard_reads")
@@ -0,0 +1,313 @@
+"""
+Server-side snake rules and replay verification
+
+A Python port of the movement, collision and food rules of the frontend
+(``App.tsx``, ``utils/gameLogic.ts``) for both game modes:
+
+- the board is 20x20; the snake starts as one segment at (10, 10) heading
+  right
+- every tick the head moves one cell in the current direction; turning
+  straight back is ignored
+- walls: leaving the board ends the game; pass-through: the head wraps
+- moving onto any segment of the snake, tail included, ends the game
+- eating food grows the snake by one and scores 15 (walls) or 10
+  (pass-through) points; the next food appears on a random cell
+
+The browser places food with ``Math.random``, which can't be replayed.
+Here food comes from a xorshift32 generator seeded per game, so a client
+using the same generator can submit its seed and move log (the direction
+of every tick, ``Direction`` values) and have its result recomputed
+exactly.
+
+``SnakeGame``/``replay`` step one game in plain Python. ``replay_batch``
+steps a whole batch in lockstep with NumPy, one vectorized update per tick
+for every game still running, which is how ``verify_batch`` checks
+thousands of submitted results per second off the request path.
+"""
+
+import enum
+from collections import deque
+from typing import Iterable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+from models import GameMode
+
+GRID_SIZE = 20
+CELLS = GRID_SIZE * GRID_SIZE
+START_CELL = 10 * GRID_SIZE + 10
+FOOD_POINTS = {GameMode.WALLS: 15, GameMode.PASS_THROUGH: 10}
+
+_MASK = 0xFFFFFFFF
+# xorshift32 never leaves 0, so seeds that map to it use this instead
+_ZERO_SEED_STATE = 0x9E3779B9
+
+
+class Direction(enum.IntEnum):
+    """Move log values; (d + 2) % 4 is the opposite of d"""
+
+    UP = 0
+    RIGHT = 1
+    DOWN = 2
+    LEFT = 3
+
+
+_DX = (0, 1, 0, -1)
+_DY = (-1, 0, 1, 0)
+
+
+class ReplayResult(NamedTuple):
+    score: int
+    snake_length: int
+    food_eaten: int
+    # Moves played, including the one that ended the game
+    ticks: int
+    alive: bool
+
+
+class Claim(NamedTuple):
+    """A submitted result to check against its move log"""
+
+    game_mode: GameMode
+    seed: int
+    moves: Sequence[int]
+    score: int
+    snake_length: int
+
+
+def seed_state(seed: int) -> int:
+    """Initial xorshift32 state for a game seed"""
+    return (seed & _MASK) or _ZERO_SEED_STATE
+
+
+def xorshift32(state: int) -> int:
+    """Next xorshift32 state (13, 17, 5); food goes on cell state % CELLS"""
+    state ^= (state << 13) & _MASK
+    state ^= state >> 17
+    state ^= (state << 5) & _MASK
+    return state
+
+
+def position(cell: int):
+    """(x, y) of a cell index"""
+    return cell % GRID_SIZE, cell // GRID_SIZE
+
+
+class SnakeGame:
+    """One game, stepped a tick at a time"""
+
+    def __init__(self, game_mode: GameMode, seed: int):
+        self.game_mode = GameMode(game_mode)
+        self.wraps = self.game_mode == GameMode.PASS_THROUGH
+        self.points = FOOD_POINTS[self.game_mode]
+        self._rng = xorshift32(seed_state(seed))
+        self.food = self._rng % CELLS
+        # Head first; the cells are unique, since overlapping ends the game
+        self.body = deque([START_CELL])
+        self._occupied = {START_CELL}
+        self.direction = Direction.RIGHT
+        self.score = 0
+        self.food_eaten = 0
+        self.ticks = 0
+        self.alive = True
+
+    @property
+    def snake_length(self) -> int:
+        return len(self.body)
+
+    def turn(self, direction: int) -> Direction:
+        """Direction after asking for direction (a reversal is ignored)"""
+        if direction != (self.direction + 2) % 4:
+            return Direction(direction)
+        return self.direction
+
+    def next_cell(self, direction: int) -> Optional[int]:
+        """Cell the head would move to heading in direction, or None when
+        that leaves a walled board"""
+        x, y = position(self.body[0])
+        x, y = x + _DX[direction], y + _DY[direction]
+        if self.wraps:
+            x, y = x % GRID_SIZE, y % GRID_SIZE
+        elif not (0 <= x < GRID_SIZE and 0 <= y < GRID_SIZE):
+            return None
+        return y * GRID_SIZE + x
+
+    def is_free(self, cell: Optional[int]) -> bool:
+        """Whether moving onto cell would not end the game"""
+        return cell is not None and cell not in self._occupied
+
+    def step(self, direction: Optional[int] = None) -> bool:
+        """Play one tick, turning first if direction is given; returns
+        whether the snake is still alive"""
+        if not self.alive:
+            raise ValueError("The game is over")
+        if direction is not None:
+            self.direction = self.turn(direction)
+        self.ticks += 1
+
+        cell = self.next_cell(self.direction)
+        if not self.is_free(cell):
+            self.alive = False
+            return False
+
+        self.body.appendleft(cell)
+        self._occupied.add(cell)
+        if cell == self.food:
+            self.score += self.points
+            self.food_eaten += 1
+            self._rng = xorshift32(self._rng)
+            self.food = self._rng % CELLS
+        else:
+            self._occupied.discard(self.body.pop())
+        return True
+
+    def result(self) -> ReplayResult:
+        return ReplayResult(
+            self.score, self.snake_length, self.food_eaten, self.ticks, self.alive
+        )
+
+
+def replay(game_mode: GameMode, seed: int, moves: Iterable[int]) -> ReplayResult:
+    """Play a move log from its seed; moves after the game ended are ignored"""
+    game = SnakeGame(game_mode, seed)
+    for move in moves:
+        if not game.step(move):
+            break
+    return game.result()
+
+
+def replay_batch(
+    game_modes: Sequence[GameMode],
+    seeds: Sequence[int],
+    move_logs: Sequence[Sequence[int]],
+) -> List[ReplayResult]:
+    """replay() for many games at once, vectorized across the batch.
+
+    Games are sorted by log length, so the games still to move at tick t
+    are a prefix of the arrays; each game keeps its body in a ring buffer
+    and its occupied cells in a boolean grid, so a tick costs a fixed number
+    of array operations whatever the snake lengths.
+    """
+    count = len(move_logs)
+    if not count:
+        return []
+    logs = [np.frombuffer(bytes(bytearray(log)), dtype=np.uint8) for log in move_logs]
+    lengths = np.array([len(log) for log in logs], dtype=np.int64)
+    order = np.argsort(-lengths, kind="stable")
+    lengths = lengths[order]
+    moves = np.zeros((count, int(lengths[0])), dtype=np.uint8)
+    for row, game in enumerate(order):
+        moves[row, : lengths[row]] = logs[game]
+    if moves.size and moves.max() > Direction.LEFT:
+        raise ValueError("Move logs may only contain Direction values")
+
+    modes = [GameMode(game_modes[game]) for game in order]
+    wraps = np.array([mode == GameMode.PASS_THROUGH for mode in modes])
+    points = np.array([FOOD_POINTS[mode] for mode in modes], dtype=np.int64)
+    rng = np.array(
+        [xorshift32(seed_state(seeds[game])) for game in order], dtype=np.uint32
+    )
+    food = (rng % CELLS).astype(np.int64)
+
+    dx, dy = np.array(_DX), np.array(_DY)
+    x = np.full(count, START_CELL % GRID_SIZE, dtype=np.int64)
+    y = np.full(count, START_CELL // GRID_SIZE, dtype=np.int64)
+    direction = np.full(count, int(Direction.RIGHT), dtype=np.int64)
+    alive = np.ones(count, dtype=bool)
+    ticks = np.zeros(count, dtype=np.int64)
+    score = np.zeros(count, dtype=np.int64)
+    eaten = np.zeros(count, dtype=np.int64)
+    length = np.ones(count, dtype=np.int64)
+    # Body ring buffer: front is the head's slot, back the tail's
+    ring = np.zeros((count, CELLS), dtype=np.int16)
+    ring[:, 0] = START_CELL
+    front = np.zeros(count, dtype=np.int64)
+    back = np.zeros(count, dtype=np.int64)
+    occupied = np.zeros((count, CELLS), dtype=bool)
+    occupied[:, START_CELL] = True
+
+    for tick in range(moves.shape[1]):
+        playing = int(np.searchsorted(-lengths, -tick, side="left"))
+        live = alive[:playing]
+        if not live.any():
+            continue
+        rows = np.arange(playing)
+
+        asked = moves[:playing, tick].astype(np.int64)
+        current = direction[:playing]
+        turned = np.where(asked == (current + 2) % 4, current, asked)
+        turned = np.where(live, turned, current)
+        direction[:playing] = turned
+
+        nx = x[:playing] + dx[turned]
+        ny = y[:playing] + dy[turned]
+        wrapped = wraps[:playing]
+        nx = np.where(wrapped, nx % GRID_SIZE, nx)
+        ny = np.where(wrapped, ny % GRID_SIZE, ny)
+        outside = (nx < 0) | (nx >= GRID_SIZE) | (ny < 0) | (ny >= GRID_SIZE)
+        cell = np.where(outside, 0, ny * GRID_SIZE + nx)
+
+        dies = live & (outside | occupied[rows, cell])
+        moving = live & ~dies
+        ticks[:playing] += live
+        alive[:playing] = moving
+
+        ate = moving & (cell == food[:playing])
+        shrinks = moving & ~ate
+        movers = rows[moving]
+        x[movers], y[movers] = nx[moving], ny[moving]
+        front[movers] = (front[movers] + 1) % CELLS
+        ring[movers, front[movers]] = cell[moving]
+        occupied[movers, cell[moving]] = True
+
+        tails = rows[shrinks]
+        occupied[tails, ring[tails, back[tails]]] = False
+        back[tails] = (back[tails] + 1) % CELLS
+
+        eaters = rows[ate]
+        if eaters.size:
+            score[eaters] += points[eaters]
+            eaten[eaters] += 1
+            length[eaters] += 1
+            state = rng[eaters]
+            state ^= state << np.uint32(13)
+            state ^= state >> np.uint32(17)
+            state ^= state << np.uint32(5)
+            rng[eaters] = state
+            food[eaters] = state % CELLS
+
+    # Games whose log ran out are still alive, like replay()
+    results = [None] * count
+    for row, game in enumerate(order):
+        results[game] = ReplayResult(
+            int(score[row]),
+            int(length[row]),
+            int(eaten[row]),
+            int(ticks[row]),
+            bool(alive[row]),
+        )
+    return results
+
+
+def matches(result: ReplayResult, claim: Claim) -> bool:
+    """Whether a replay backs a claim: same score and length, and no moves
+    logged after the game ended"""
+    return (
+        result.score == claim.score
+        and result.snake_length == claim.snake_length
+        and result.ticks == len(claim.moves)
+    )
+
+
+def verify(claim: Claim) -> bool:
+    """Check one claimed result by replaying its move log"""
+    return matches(replay(claim.game_mode, claim.seed, claim.moves), claim)
+
+
+def verify_batch(claims: Sequence[Claim]) -> List[bool]:
+    """Check many claimed results in one vectorized replay"""
+    results = replay_batch(
+        [claim.game_mode for claim in claims],
+        [claim.seed for claim in claims],
+        [claim.moves for claim in claims],
+    )
+    return [matches(result, claim) for result, claim in zip(results, claims)]
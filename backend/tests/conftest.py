@@ -2,28 +2,51 @@
 Pytest configuration and fixtures for backend tests
 """
 
+import os
 import sys
 from pathlib import Path
 
 # Add parent directory to path so we can import backend modules
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+# Use in-memory SQLite for tests
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+
+# Background tasks started by the app (index refresh) use the test database too
+os.environ["DATABASE_URL"] = SQLALCHEMY_DATABASE_URL
+
+import cache
 import models
+import versions
+import write_behind
 import pytest
-from database import Base, get_db
+from database import (
+    Base,
+    get_async_db,
+    get_async_url,
+    get_db,
+    get_session_factory,
+)
 from fastapi.testclient import TestClient
 from main import app
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-
-# Use in-memory SQLite for tests
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+from sqlalchemy.pool import NullPool
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Each TestClient runs its own event loop, so don't pool async connections
+async_engine = create_async_engine(
+    get_async_url(SQLALCHEMY_DATABASE_URL), poolclass=NullPool
+)
+TestingAsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+
 
 def override_get_db():
     """Override database dependency for tests"""
@@ -34,6 +57,12 @@ def override_get_db():
         db.close()
 
 
+async def override_get_async_db():
+    """Override async database dependency for tests"""
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+
 @pytest.fixture(scope="function")
 def db_session():
     """Create a fresh database for each test"""
@@ -44,17 +73,35 @@ def db_session():
     finally:
         db.close()
         Base.metadata.drop_all(bind=engine)
+        cache.clear_all()
+        versions.counters.reset()
+        write_behind.buffer.clear()
 
 
 @pytest.fixture(scope="function")
 def client(db_session):
     """Create a test client with overridden database"""
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_session_factory] = lambda: TestingSessionLocal
     with TestClient(app) as test_client:
         yield test_client
     app.dependency_overrides.clear()
 
 
+@pytest.fixture
+def statements():
+    """SQL statements executed by the async routers while the fixture is active"""
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+
 @pytest.fixture
 def test_user_data():
     """Sample user data for tests"""
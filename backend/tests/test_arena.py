@@ -0,0 +1,166 @@
+"""
+Tests for the multiplayer arena
+"""
+
+import asyncio
+
+import orjson
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+
+def _occupancy(room):
+    bits = 0
+    for player in room.players.values():
+        for cell in player.body:
+            bits |= 1 << cell
+    return bits
+
+
+def _place(room, player, cells, direction):
+    room._clear(player)
+    player.body.extend(cells)
+    for cell in cells:
+        room.occupied |= 1 << cell
+    player.direction = player.turn_to = direction
+
+
+def test_room_moves_eats_and_keeps_occupancy():
+    """Test snakes move, grow on food and the bitset tracks their bodies"""
+    import arena
+    from models import GameMode
+
+    room = arena.Room("r", GameMode.WALLS, seed=7)
+    first, second = room.join("a"), room.join("b")
+    _place(room, first, [5 * arena.GRID_SIZE + 5], 1)
+    _place(room, second, [9 * arena.GRID_SIZE + 9], 2)
+    room.food = 5 * arena.GRID_SIZE + 6
+
+    delta = orjson.loads(orjson.dumps(room.step()))
+    assert delta["t"] == 1
+    assert sorted(delta["m"]) == [
+        [first.id, 5 * arena.GRID_SIZE + 6, 1],
+        [second.id, 10 * arena.GRID_SIZE + 9, 0],
+    ]
+    assert delta["p"] == [[first.id, 15]]
+    assert delta["f"] == room.food
+    assert len(first.body) == 2 and len(second.body) == 1
+    assert room.occupied == _occupancy(room)
+
+    # A reversal is ignored
+    room.turn(first.id, 3)
+    room.step()
+    assert first.body[0] == 5 * arena.GRID_SIZE + 7
+    assert room.occupied == _occupancy(room)
+
+
+def test_room_collisions_and_respawn():
+    """Test head-to-head and wall collisions kill, and the dead respawn"""
+    import arena
+    from models import GameMode
+
+    room = arena.Room("r", GameMode.WALLS, seed=1)
+    left, right, edge = room.join("a"), room.join("b"), room.join("c")
+    _place(room, left, [3], 1)
+    _place(room, right, [5], 3)
+    _place(room, edge, [arena.GRID_SIZE * 10], 3)
+    room.food = arena.CELLS - 1
+
+    delta = room.step()
+    assert sorted(delta["x"]) == [left.id, right.id, edge.id]
+    assert "m" not in delta
+    assert room.occupied == 0
+
+    for _ in range(arena.RESPAWN_TICKS - 1):
+        assert "s" not in room.step()
+    spawned = room.step()["s"]
+    assert sorted(player_id for player_id, _ in spawned) == [
+        left.id,
+        right.id,
+        edge.id,
+    ]
+    assert room.occupied == _occupancy(room)
+
+
+def test_room_is_capped():
+    """Test joining a full room fails"""
+    import arena
+    from models import GameMode
+
+    room = arena.Room("r", GameMode.PASS_THROUGH)
+    for player in range(arena.ROOM_PLAYERS):
+        room.join(str(player))
+    with pytest.raises(arena.RoomFull):
+        room.join("late")
+
+
+def test_slow_subscriber_is_resynced():
+    """Test a subscriber that falls behind gets one keyframe, not a backlog"""
+    import arena
+    from models import GameMode
+
+    async def run():
+        scheduler = arena.TickScheduler()
+        room = scheduler.rooms["r"] = arena.Room("r", GameMode.WALLS)
+        room.join("a")
+        subscriber = room.subscribe()
+        for _ in range(arena.SEND_QUEUE + 3):
+            scheduler.tick_all()
+        return subscriber, scheduler
+
+    subscriber, scheduler = asyncio.run(run())
+    assert subscriber.resyncs == 1
+    assert len(subscriber.messages) <= arena.SEND_QUEUE
+    messages = [orjson.loads(message) for message in subscriber.messages]
+    assert messages[0]["k"] == 1
+    assert [message["t"] for message in messages[1:]] == list(
+        range(messages[0]["t"] + 1, scheduler.ticks + 1)
+    )
+    assert scheduler.stats()["ticks"] == arena.SEND_QUEUE + 3
+
+
+def test_arena_websocket(client, authenticated_user, monkeypatch):
+    """Test playing over the WebSocket and the arena metrics"""
+    import arena
+
+    monkeypatch.setattr(arena.scheduler, "interval", 0.01)
+    token = authenticated_user["token"]
+    with client.websocket_connect(f"/api/arena/lobby?token={token}") as websocket:
+        player = websocket.receive_json()["player"]
+        keyframe = websocket.receive_json()
+        assert keyframe["k"] == 1
+        assert [p["id"] for p in keyframe["players"]] == [player]
+        assert keyframe["players"][0]["name"] == authenticated_user["user"]["username"]
+
+        websocket.send_text("not json")
+        websocket.send_bytes(b"\xff\x00")
+        websocket.send_bytes(b'{"turn": "L"}')
+        websocket.send_json({"turn": "D"})
+        ticks = [websocket.receive_json()["t"] for _ in range(3)]
+        assert ticks == sorted(ticks)
+
+        metrics = client.get("/api/metrics").json()["arena"]
+        assert metrics["rooms"] == 1 and metrics["players"] == 1
+        assert metrics["ticks"] >= 3
+
+    with pytest.raises(WebSocketDisconnect) as error:
+        with client.websocket_connect("/api/arena/lobby?token=bad") as websocket:
+            websocket.receive_json()
+    assert error.value.code == 1008
+
+
+def test_arena_websocket_inactive_user(client, authenticated_user, db_session):
+    """Test a deactivated user cannot join a room"""
+    import crud
+    import schemas
+
+    crud.update_user(
+        db_session,
+        authenticated_user["user"]["id"],
+        schemas.UserUpdate(is_active=False),
+    )
+    token = authenticated_user["token"]
+    with pytest.raises(WebSocketDisconnect) as error:
+        with client.websocket_connect(f"/api/arena/lobby?token={token}") as websocket:
+            websocket.receive_json()
+    assert error.value.code == 1008
@@ -88,3 +88,96 @@ def test_get_current_user_unauthorized(client):
     response = client.get("/api/auth/me")
 
     assert response.status_code == 401
+
+
+def test_login_backpressure(client, test_user_data, monkeypatch):
+    """Test logins are rejected with 503 when the hashing pool is saturated"""
+    from auth import password_pool
+
+    client.post("/api/auth/signup", json=test_user_data)
+    rejected = password_pool.stats()["rejected"]
+
+    monkeypatch.setattr(password_pool, "max_pending", 0)
+    response = client.post(
+        "/api/auth/login/json",
+        json={
+            "username": test_user_data["username"],
+            "password": test_user_data["password"],
+        },
+    )
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+    metrics = client.get("/api/metrics").json()["password_hashing"]
+    assert metrics["rejected"] == rejected + 1
+    assert metrics["pending"] == 0
+
+
+def test_password_pool_counts_failures():
+    """Test a hash that raises counts as failed, not completed"""
+    import asyncio
+
+    from auth import PasswordHashPool
+    from passwords import get_password_hash, verify_password
+
+    pool = PasswordHashPool(1, 4)
+
+    async def run():
+        assert await pool.run(verify_password, "pw", get_password_hash("pw"))
+        with pytest.raises(ValueError):
+            await pool.run(verify_password, "pw", "not a hash")
+
+    try:
+        asyncio.run(run())
+        assert (pool.completed, pool.failed, pool.pending) == (1, 1, 0)
+    finally:
+        pool.shutdown()
+
+
+def test_current_user_cache(client, authenticated_user, db_session):
+    """Test authenticated users are cached and invalidated on update/delete"""
+    import cache
+    import crud
+    import schemas
+
+    headers = authenticated_user["headers"]
+    user_id = authenticated_user["user"]["id"]
+
+    client.get("/api/auth/me", headers=headers)
+    hits = cache.auth_users.hits
+    response = client.get("/api/auth/me", headers=headers)
+    assert response.status_code == 200
+    assert cache.auth_users.hits == hits + 1
+    assert cache.auth_tokens.stats()["hits"] >= 1
+
+    crud.update_user(db_session, user_id, schemas.UserUpdate(is_active=False))
+    response = client.get("/api/auth/me", headers=headers)
+    assert response.status_code == 400
+
+    crud.delete_user(db_session, user_id)
+    response = client.get("/api/auth/me", headers=headers)
+    assert response.status_code == 401
+
+
+def test_current_user_cache_across_workers(client, authenticated_user, db_session):
+    """Test a deactivation is seen at once by a worker with a cached user"""
+    import cache
+    import crud
+    import schemas
+
+    headers = authenticated_user["headers"]
+    username = authenticated_user["user"]["username"]
+    client.get("/api/auth/me", headers=headers)
+    snapshot = cache.auth_users.get(username)
+
+    crud.update_user(
+        db_session,
+        authenticated_user["user"]["id"],
+        schemas.UserUpdate(is_active=False),
+    )
+    # Still cached by the worker that didn't make the change
+    cache.auth_users.set(username, snapshot)
+
+    response = client.get("/api/auth/me", headers=headers)
+    assert response.status_code == 400
@@ -0,0 +1,129 @@
+"""
+Tests for the admin export endpoints
+"""
+
+import csv
+import io
+import json
+
+
+def _finish_games(client, authenticated_user, scores):
+    headers = authenticated_user["headers"]
+    for game_mode, score in scores:
+        game_id = client.post(
+            "/api/games/start",
+            json={"user_id": authenticated_user["user"]["id"], "game_mode": game_mode},
+            headers=headers,
+        ).json()["id"]
+        client.post(f"/api/games/{game_id}/end", json={"score": score}, headers=headers)
+
+
+def test_export_requires_admin(client, authenticated_user, db_session, capsys):
+    """Test only admins may export, and admin access is granted to existing
+    accounts only"""
+    import crud
+    import init_db
+    import pytest
+
+    response = client.get("/api/export/games")
+    assert response.status_code == 401
+
+    headers = authenticated_user["headers"]
+    response = client.get("/api/export/games", headers=headers)
+    assert response.status_code == 403
+
+    # Unlike a list of usernames, nobody can sign up into an admin account
+    with pytest.raises(SystemExit) as error:
+        init_db.set_admin("root")
+    assert error.value.code == 1
+    assert "sign up first" in capsys.readouterr().out
+
+    username = authenticated_user["user"]["username"]
+    init_db.set_admin(username)
+    assert client.get("/api/export/games", headers=headers).status_code == 200
+    assert client.get("/api/auth/me", headers=headers).json()["is_admin"] is True
+
+    crud.set_user_admin(db_session, username, False)
+    assert client.get("/api/export/games", headers=headers).status_code == 403
+
+
+def test_export_games_ndjson(client, authenticated_user, db_session, monkeypatch):
+    """Test games stream as NDJSON, filtered by mode and date"""
+    import crud
+
+    crud.set_user_admin(db_session, authenticated_user["user"]["username"], True)
+    _finish_games(
+        client, authenticated_user, [("walls", 10), ("pass-through", 20), ("walls", 0)]
+    )
+
+    # Small batches, so the export spans several of them
+    export_games = crud.export_games
+    monkeypatch.setattr(
+        crud,
+        "export_games",
+        lambda *args: export_games(*args, batch_size=2),
+    )
+
+    headers = authenticated_user["headers"]
+    response = client.get("/api/export/games", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    games = [json.loads(line) for line in response.text.splitlines()]
+    assert [game["score"] for game in games] == [10, 20, 0]
+    assert games[0]["game_mode"] == "walls"
+    assert games[0]["is_completed"] is True
+
+    response = client.get(
+        "/api/export/games", params={"game_mode": "walls"}, headers=headers
+    )
+    assert [json.loads(line)["score"] for line in response.text.splitlines()] == [
+        10,
+        0,
+    ]
+
+    response = client.get(
+        "/api/export/games", params={"since": "2100-01-01T00:00:00"}, headers=headers
+    )
+    assert response.text == ""
+
+
+def test_export_leaderboard_csv(client, authenticated_user, db_session):
+    """Test leaderboard entries stream as CSV with usernames"""
+    import crud
+
+    username = authenticated_user["user"]["username"]
+    crud.set_user_admin(db_session, username, True)
+    _finish_games(client, authenticated_user, [("walls", 30), ("pass-through", 40)])
+
+    response = client.get(
+        "/api/export/leaderboard",
+        params={"format": "csv"},
+        headers=authenticated_user["headers"],
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert "leaderboard.csv" in response.headers["content-disposition"]
+
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [(row["score"], row["game_mode"]) for row in rows] == [
+        ("30", "walls"),
+        ("40", "pass-through"),
+    ]
+    assert {row["username"] for row in rows} == {username}
+
+    # No rows: just the header
+    response = client.get(
+        "/api/export/leaderboard",
+        params={"format": "csv", "game_mode": "walls", "since": "2100-01-01T00:00:00"},
+        headers=authenticated_user["headers"],
+    )
+    assert response.text.splitlines() == [
+        "id,user_id,game_id,score,snake_length,game_mode,rank,created_at,username"
+    ]
+
+    response = client.get(
+        "/api/export/leaderboard",
+        params={"format": "xml"},
+        headers=authenticated_user["headers"],
+    )
+    assert response.status_code == 422
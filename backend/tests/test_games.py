@@ -84,6 +84,23 @@ def test_end_game_zero_score_no_leaderboard(client, authenticated_user):
     assert "message" in data
 
 
+def test_end_game_rejects_huge_score(client, authenticated_user):
+    """Test scores above schemas.MAX_SCORE are rejected"""
+    start_response = client.post(
+        "/api/games/start",
+        json={"user_id": authenticated_user["user"]["id"], "game_mode": "walls"},
+        headers=authenticated_user["headers"],
+    )
+    game_id = start_response.json()["id"]
+
+    end_response = client.post(
+        f"/api/games/{game_id}/end",
+        json={"score": 10**8, "snake_length": 1, "is_completed": True},
+        headers=authenticated_user["headers"],
+    )
+    assert end_response.status_code == 422
+
+
 def test_get_my_games(client, authenticated_user):
     """Test getting user's game history"""
     # Start and end a few games
@@ -146,3 +163,465 @@ def test_cannot_end_another_users_game(client, authenticated_user, test_user_dat
     )
 
     assert response.status_code == 403
+
+
+def test_my_games_cursor_pagination(client, authenticated_user):
+    """Test paging through game history with cursors"""
+    game_ids = []
+    for _ in range(5):
+        start_response = client.post(
+            "/api/games/start",
+            json={"user_id": authenticated_user["user"]["id"], "game_mode": "walls"},
+            headers=authenticated_user["headers"],
+        )
+        game_ids.append(start_response.json()["id"])
+
+    seen = []
+    cursor = None
+    while True:
+        url = "/api/games/my-games?limit=2" + (f"&cursor={cursor}" if cursor else "")
+        response = client.get(url, headers=authenticated_user["headers"])
+        assert response.status_code == 200
+        seen.extend(game["id"] for game in response.json())
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            break
+
+        # A game started mid-pagination doesn't shift later pages
+        if len(seen) == 2:
+            client.post(
+                "/api/games/start",
+                json={
+                    "user_id": authenticated_user["user"]["id"],
+                    "game_mode": "walls",
+                },
+                headers=authenticated_user["headers"],
+            )
+
+    assert seen == sorted(game_ids, reverse=True)
+
+    response = client.get(
+        "/api/games/my-games?cursor=not-a-cursor", headers=authenticated_user["headers"]
+    )
+    assert response.status_code == 400
+
+
+def test_legacy_scores_cursor_pagination(client, db_session):
+    """Test paging through legacy scores with cursors, ties included"""
+    import models
+
+    for player, score in [("a", 30), ("b", 50), ("c", 30), ("d", 10)]:
+        client.post("/api/scores", json={"player_name": player, "score": score})
+    # Left by old clients; skipped rather than ending the pages
+    db_session.add(models.Score(player_name="e", score=None))
+    db_session.commit()
+
+    first = client.get("/api/scores?limit=2")
+    assert [s["player_name"] for s in first.json()] == ["b", "c"]
+
+    cursor = first.headers["x-next-cursor"]
+    second = client.get(f"/api/scores?limit=2&cursor={cursor}")
+    assert [s["player_name"] for s in second.json()] == ["a", "d"]
+
+    response = client.get("/api/scores?limit=10")
+    assert [s["player_name"] for s in response.json()] == ["b", "c", "a", "d"]
+
+
+def test_end_game_single_transaction(client, authenticated_user, statements):
+    """Ending a game commits once and does not re-select what it wrote"""
+    headers = authenticated_user["headers"]
+    game_id = client.post(
+        "/api/games/start",
+        json={"user_id": authenticated_user["user"]["id"], "game_mode": "walls"},
+        headers=headers,
+    ).json()["id"]
+    client.get("/api/auth/me", headers=headers)  # warm the current-user cache
+
+    statements.clear()
+    response = client.post(
+        f"/api/games/{game_id}/end",
+        json={"score": 150, "snake_length": 15},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["game"]["is_completed"] is True
+    assert data["leaderboard_entry"]["score"] == 150
+    assert data["leaderboard_entry"]["rank"] == 1
+
+    selects = [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+    inserts = [s for s in statements if s.lstrip().upper().startswith("INSERT")]
+    # Load the game, rank the score, compute the percentile
+    assert len(selects) <= 3
+    # user_stats upsert, entry INSERT ... RETURNING, score counter upsert
+    assert len(inserts) == 3
+    assert any("RETURNING" in s for s in inserts)
+    assert len(statements) <= 7
+
+
+def test_end_game_ignores_cached_game(client, authenticated_user, db_session):
+    """Test ending a game decides from the stored row, not this worker's
+    cached copy of it"""
+    import models
+
+    headers = authenticated_user["headers"]
+    game_id = client.post(
+        "/api/games/start",
+        json={"user_id": authenticated_user["user"]["id"], "game_mode": "walls"},
+        headers=headers,
+    ).json()["id"]
+    assert client.get(f"/api/games/{game_id}", headers=headers).json()["score"] == 0
+
+    # Progress written by another worker: this worker's cache is not told
+    db_game = db_session.get(models.Game, game_id)
+    db_game.score = 70
+    db_session.commit()
+    assert client.get(f"/api/games/{game_id}", headers=headers).json()["score"] == 0
+
+    response = client.post(f"/api/games/{game_id}/end", json={}, headers=headers)
+    assert response.json()["game"]["score"] == 70
+    assert response.json()["leaderboard_entry"]["score"] == 70
+
+
+def test_my_games_etag(client, authenticated_user, statements):
+    """Test game history revalidates with 304 until the user's games change"""
+    headers = authenticated_user["headers"]
+    user_id = authenticated_user["user"]["id"]
+    client.post(
+        "/api/games/start",
+        json={"user_id": user_id, "game_mode": "walls"},
+        headers=headers,
+    )
+
+    response = client.get("/api/games/my-games", headers=headers)
+    etag = response.headers["ETag"]
+    assert response.status_code == 200
+
+    statements.clear()
+    response = client.get(
+        "/api/games/my-games", headers={**headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert statements == []
+
+    # Other pages have their own tags
+    response = client.get(
+        "/api/games/my-games?limit=1", headers={**headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+
+    client.post(
+        "/api/games/start",
+        json={"user_id": user_id, "game_mode": "walls"},
+        headers=headers,
+    )
+    response = client.get(
+        "/api/games/my-games", headers={**headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert len(response.json()) == 2
+    assert response.headers["ETag"] != etag
+
+
+def test_write_behind_game_updates(client, authenticated_user, db_session, monkeypatch):
+    """Test buffered progress is served, flushed in batches and kept at the end"""
+    import models
+    import write_behind
+
+    monkeypatch.setattr(write_behind.buffer, "enabled", True)
+    headers = authenticated_user["headers"]
+
+    def start():
+        return client.post(
+            "/api/games/start",
+            json={"user_id": authenticated_user["user"]["id"], "game_mode": "walls"},
+            headers=headers,
+        ).json()["id"]
+
+    def stored(game_id):
+        db_session.expire_all()
+        return db_session.get(models.Game, game_id)
+
+    first, second = start(), start()
+    for score in (10, 20):
+        response = client.patch(
+            f"/api/games/{first}", json={"score": score}, headers=headers
+        )
+        assert response.json()["score"] == score
+    client.patch(f"/api/games/{first}", json={"snake_length": 3}, headers=headers)
+    client.patch(f"/api/games/{second}", json={"score": 15}, headers=headers)
+
+    # Nothing written yet, but reads of the game include the pending values
+    assert stored(first).score == 0
+    game = client.get(f"/api/games/{first}", headers=headers).json()
+    assert (game["score"], game["snake_length"]) == (20, 3)
+
+    assert write_behind.buffer.flush(db_session) == 2
+    assert (stored(first).score, stored(first).snake_length) == (20, 3)
+    assert stored(second).score == 15
+
+    # end_game commits pending progress with the final result
+    client.patch(f"/api/games/{first}", json={"score": 45}, headers=headers)
+    response = client.post(f"/api/games/{first}/end", json={}, headers=headers)
+    assert response.json()["game"]["score"] == 45
+    assert write_behind.buffer.pending(first) == {}
+
+    # A late flush never overwrites a completed game
+    write_behind.buffer.put(first, authenticated_user["user"]["id"], {"score": 5})
+    assert write_behind.buffer.flush(db_session) == 0
+    assert stored(first).score == 45
+
+
+def test_update_game_completion_stats(client, authenticated_user):
+    """Test completing a game or changing its score by PATCH keeps user stats"""
+    headers = authenticated_user["headers"]
+    username = authenticated_user["user"]["username"]
+    game_id = client.post(
+        "/api/games/start",
+        json={"user_id": authenticated_user["user"]["id"], "game_mode": "walls"},
+        headers=headers,
+    ).json()["id"]
+
+    def stats():
+        return client.get(f"/api/leaderboard/stats/{username}").json()
+
+    response = client.patch(
+        f"/api/games/{game_id}",
+        json={"score": 40, "is_completed": True},
+        headers=headers,
+    )
+    assert response.json()["is_completed"] is True
+    ended = (response.json()["ended_at"], response.json()["duration_seconds"])
+    assert (stats()["games_played"], stats()["total_score"]) == (1, 40)
+
+    client.post(f"/api/games/{game_id}/end", json={"score": 50}, headers=headers)
+    data = stats()
+    assert (data["games_played"], data["total_score"]) == (1, 50)
+    assert (data["best_score"], data["average_score"]) == (50, 50.0)
+
+    # A lower score lowers the best score too
+    response = client.patch(
+        f"/api/games/{game_id}", json={"score": 30}, headers=headers
+    )
+    # Corrections keep the time the game ended
+    assert (response.json()["ended_at"], response.json()["duration_seconds"]) == ended
+    data = stats()
+    assert (data["games_played"], data["total_score"], data["best_score"]) == (
+        1,
+        30,
+        30,
+    )
+
+    response = client.patch(
+        f"/api/games/{game_id}", json={"is_completed": False}, headers=headers
+    )
+    assert response.status_code == 400
+
+
+def test_group_commit_end_game(client, authenticated_user, db_session, monkeypatch):
+    """Test concurrent end_game calls are committed together with correct ranks"""
+    import threading
+
+    import crud
+    import group_commit
+    import models
+
+    monkeypatch.setattr(group_commit.queue, "enabled", True)
+    monkeypatch.setattr(group_commit.queue, "window", 0.2)
+    headers = authenticated_user["headers"]
+    batches = group_commit.queue.batches
+
+    game_ids = [
+        client.post(
+            "/api/games/start",
+            json={"user_id": authenticated_user["user"]["id"], "game_mode": "walls"},
+            headers=headers,
+        ).json()["id"]
+        for _ in range(6)
+    ]
+    scores = [30, 50, 10, 50, 40, 0]
+
+    responses = {}
+
+    def end(game_id, score):
+        responses[game_id] = client.post(
+            f"/api/games/{game_id}/end", json={"score": score}, headers=headers
+        )
+
+    threads = [
+        threading.Thread(target=end, args=(game_id, score))
+        for game_id, score in zip(game_ids, scores)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(response.status_code == 200 for response in responses.values())
+    assert group_commit.queue.batches - batches < 6
+    assert responses[game_ids[-1]].json()["leaderboard_entry"] is None
+
+    # Entries are inserted in arrival order; each rank counts the entries
+    # scoring higher that were committed before it or earlier in its batch
+    entries = sorted(
+        (response.json()["leaderboard_entry"] for response in responses.values()),
+        key=lambda entry: entry["id"] if entry else 0,
+    )[1:]
+    assert sorted(entry["score"] for entry in entries) == [10, 30, 40, 50, 50]
+    for position, entry in enumerate(entries):
+        higher = sum(
+            earlier["score"] > entry["score"] for earlier in entries[:position]
+        )
+        assert entry["rank"] == higher + 1
+        assert entry["game_id"] in game_ids
+
+    assert db_session.query(models.LeaderboardEntry).count() == 5
+    assert crud.check_leaderboard_score_counts(db_session) == []
+    stats = client.get("/api/metrics").json()["group_commit"]
+    assert stats["committed"] >= 6
+
+
+def test_submit_game_batch(client, authenticated_user, db_session, statements):
+    """Test offline games are stored and ranked in a few statements"""
+    import crud
+    import models
+
+    headers = authenticated_user["headers"]
+    scores = [30, 50, 0, 10, 50, 40] * 20
+    games = [
+        {
+            "game_mode": "walls" if index % 2 else "pass-through",
+            "score": score,
+            "snake_length": 3,
+            "started_at": "2024-01-01T10:00:00Z",
+            "ended_at": "2024-01-01T10:01:30Z",
+        }
+        for index, score in enumerate(scores)
+    ]
+
+    statements.clear()
+    response = client.post("/api/games/batch", json={"games": games}, headers=headers)
+    assert response.status_code == 201
+    inserts = [sql for sql in statements if sql.lstrip().upper().startswith("INSERT")]
+    # games, user_stats per mode, entries, and a counter upsert per (mode, score)
+    assert len(inserts) <= 1 + 2 + 1 + 8
+
+    submitted = response.json()
+    assert len(submitted) == len(scores)
+    assert [item["game"]["score"] for item in submitted] == scores
+    assert all(item["game"]["is_completed"] for item in submitted)
+    assert submitted[0]["game"]["duration_seconds"] == 90
+    assert submitted[2]["leaderboard_entry"] is None
+
+    # Ranks as if the entries had been submitted one by one
+    entries = [item["leaderboard_entry"] for item in submitted]
+    entries = [entry for entry in entries if entry]
+    for position, entry in enumerate(entries):
+        higher = sum(
+            earlier["score"] > entry["score"]
+            for earlier in entries[:position]
+            if earlier["game_mode"] == entry["game_mode"]
+        )
+        assert entry["rank"] == higher + 1
+    assert crud.check_leaderboard_score_counts(db_session) == []
+
+    stats = client.get(
+        f"/api/leaderboard/stats/{authenticated_user['user']['username']}"
+    ).json()
+    assert stats["games_played"] == len(scores)
+    assert stats["best_score"] == 50
+    assert db_session.query(models.LeaderboardEntry).count() == len(entries)
+
+
+def test_entries_paired_with_games_by_id(
+    client, authenticated_user, db_session, monkeypatch
+):
+    """Test entries are matched to their games by game_id, whatever order
+    INSERT ... RETURNING gives them back in"""
+    import crud
+    import models
+    import schemas
+
+    insert_returning = crud._insert_returning
+
+    def shuffled(db, model, rows):
+        instances = insert_returning(db, model, rows)
+        if model is models.LeaderboardEntry:
+            instances.reverse()
+        return instances
+
+    monkeypatch.setattr(crud, "_insert_returning", shuffled)
+    headers = authenticated_user["headers"]
+    games = [
+        {
+            "game_mode": "walls",
+            "score": score,
+            "started_at": "2024-01-01T10:00:00",
+            "ended_at": "2024-01-01T10:01:00",
+        }
+        for score in [10, 0, 20, 30]
+    ]
+    response = client.post("/api/games/batch", json={"games": games}, headers=headers)
+    submitted = response.json()
+    assert [item["game"]["score"] for item in submitted] == [10, 0, 20, 30]
+    for item in submitted:
+        entry = item["leaderboard_entry"]
+        if item["game"]["score"]:
+            assert entry["game_id"] == item["game"]["id"]
+            assert entry["score"] == item["game"]["score"]
+        else:
+            assert entry is None
+
+    # finish_games, as group commit calls it for several games at once
+    user = authenticated_user["user"]
+    game_ids = [
+        crud.create_game(
+            db_session,
+            schemas.GameCreate(user_id=user["id"], game_mode=models.GameMode.WALLS),
+        ).id
+        for _ in range(3)
+    ]
+    loaded = crud.get_games_for_update(db_session, game_ids)
+    finishes = [
+        (loaded[game_id], score, 2, user["username"])
+        for game_id, score in zip(game_ids, [15, 0, 45])
+    ]
+    for db_game, db_entry in crud.finish_games(db_session, finishes):
+        if db_game.score:
+            assert (db_entry.game_id, db_entry.score) == (db_game.id, db_game.score)
+        else:
+            assert db_entry is None
+
+
+def test_submit_game_batch_validation(client, authenticated_user):
+    """Test a batch with an invalid game is rejected as a whole"""
+    game = {
+        "game_mode": "walls",
+        "score": 10,
+        "started_at": "2024-01-01T10:00:00",
+        "ended_at": "2024-01-01T10:01:00",
+    }
+    bad = {**game, "ended_at": "2024-01-01T09:00:00"}
+    response = client.post(
+        "/api/games/batch",
+        json={"games": [game, bad]},
+        headers=authenticated_user["headers"],
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"][:3] == ["body", "games", 1]
+
+    response = client.post(
+        "/api/games/batch", json={"games": []}, headers=authenticated_user["headers"]
+    )
+    assert response.status_code == 422
+
+    response = client.post(
+        "/api/games/batch",
+        json={"games": [{**game, "score": 10**8}]},
+        headers=authenticated_user["headers"],
+    )
+    assert response.status_code == 422
+
+    response = client.post("/api/games/batch", json={"games": [game]})
+    assert response.status_code == 401
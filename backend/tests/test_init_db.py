@@ -0,0 +1,129 @@
+"""
+Tests for the database initialization script
+"""
+
+
+def test_seed_database(db_session):
+    """Test synthetic data is consistent and usable by the API"""
+    import crud
+    import init_db
+    import models
+    from passwords import verify_password
+    from sqlalchemy import func
+
+    init_db.seed_database(users=20, games=500, batch_size=64, random_seed=1)
+
+    assert db_session.query(models.User).count() == 20
+    assert db_session.query(models.Game).count() == 500
+    completed = (
+        db_session.query(models.Game)
+        .filter(models.Game.is_completed == True, models.Game.score > 0)
+        .count()
+    )
+    assert 0 < completed < 500
+    assert db_session.query(models.LeaderboardEntry).count() == completed
+    assert crud.check_leaderboard_score_counts(db_session) == []
+
+    played = db_session.query(func.sum(models.UserStats.games_played)).scalar()
+    assert played == db_session.query(models.Game).filter_by(is_completed=True).count()
+
+    # Seeded rows read back like ones written by the app
+    best = db_session.query(models.LeaderboardEntry).order_by(
+        models.LeaderboardEntry.score.desc()
+    )[0]
+    assert crud.get_score_rank(db_session, best.game_mode, best.score) == 1
+    assert isinstance(best.game_mode, models.GameMode)
+    assert best.created_at == best.game.ended_at
+
+    user = db_session.query(models.User).first()
+    assert verify_password(init_db.SEED_PASSWORD, user.hashed_password)
+
+
+def test_seed_database_simulated(db_session, tmp_path, monkeypatch):
+    """Test games played by simulator bots are loaded with their replays"""
+    import os
+
+    import init_db
+    import models
+    import replays
+    from snake_engine import replay
+
+    monkeypatch.setattr(replays, "REPLAY_DIR", str(tmp_path))
+    init_db.seed_database(
+        users=5,
+        games=40,
+        batch_size=16,
+        policies=["greedy", "wall"],
+        processes=1,
+        max_ticks=400,
+        save_replays=True,
+    )
+
+    games = db_session.query(models.Game).all()
+    assert len(games) == 40 and all(game.is_completed for game in games)
+    for game in games:
+        with open(replays.path(game.id), "rb") as file:
+            seed, moves = replays.unpack(file.read())
+        result = replay(game.game_mode, seed, moves)
+        assert (result.score, result.snake_length) == (game.score, game.snake_length)
+        assert game.moves_count == len(moves)
+    assert db_session.query(models.LeaderboardEntry).count() == sum(
+        game.score > 0 for game in games
+    )
+
+    # Seeded replays are checked in batches; a tampered one is not marked
+    tampered, missing = [game for game in games if game.score > 0][:2]
+    with open(replays.path(tampered.id), "rb") as file:
+        seed, moves = replays.unpack(file.read())
+    replays.save(tampered.id, replays.pack(seed ^ 1, moves))
+    os.remove(replays.path(missing.id))
+    init_db.verify_replays(batch_size=16)
+    db_session.expire_all()
+    verified = {game.id for game in games if game.replay_verified}
+    assert verified == {game.id for game in games} - {tampered.id, missing.id}
+
+
+def test_upgrade_database(db_session):
+    """Test tables, columns and indexes added since a database was created
+    are backfilled by init_db"""
+    import cache
+    import crud
+    import init_db
+    import models
+    from database import engine
+    from sqlalchemy import inspect
+
+    init_db.seed_database(users=5, games=100, batch_size=50, random_seed=2)
+    stats = crud.get_user_stats(db_session, 1)
+    db_session.close()
+
+    # As an older version left it
+    models.UserStats.__table__.drop(engine)
+    models.LeaderboardScoreCount.__table__.drop(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX ix_games_user_started_id")
+        connection.exec_driver_sql("ALTER TABLE games DROP COLUMN replay_verified")
+
+    init_db.init_database()
+    cache.clear_all()
+
+    indexes = {index["name"] for index in inspect(engine).get_indexes("games")}
+    assert "ix_games_user_started_id" in indexes
+    assert not any(game.replay_verified for game in db_session.query(models.Game))
+    assert crud.check_leaderboard_score_counts(db_session) == []
+    assert db_session.query(models.LeaderboardScoreCount).count() > 0
+    assert stats["games_played"] > 0
+    assert crud.get_user_stats(db_session, 1) == stats
+
+
+def test_seed_command_rejects_non_positive_counts(capsys):
+    """Test --seed refuses counts below 1 instead of seeding nothing or
+    looping on an empty batch"""
+    import init_db
+    import pytest
+
+    for option in ["--users", "--games", "--batch-size"]:
+        with pytest.raises(SystemExit) as error:
+            init_db.seed_command([option, "0"])
+        assert error.value.code == 2
+        assert "must be at least 1" in capsys.readouterr().err
@@ -140,3 +140,777 @@ def test_get_stats_nonexistent_user(client):
     data = response.json()
     assert "error" in data
     assert data["games_played"] == 0
+
+
+def test_leaderboard_ranks_with_ties(client, authenticated_user):
+    """Test ranks are computed on read and shared by tied scores"""
+    submitted_ranks = []
+    for score in [100, 200, 200, 50]:
+        start_response = client.post(
+            "/api/games/start",
+            json={"user_id": authenticated_user["user"]["id"], "game_mode": "walls"},
+            headers=authenticated_user["headers"]
+        )
+        game_id = start_response.json()["id"]
+
+        end_response = client.post(
+            f"/api/games/{game_id}/end",
+            json={"score": score, "snake_length": score // 10, "is_completed": True},
+            headers=authenticated_user["headers"]
+        )
+        submitted_ranks.append(end_response.json()["leaderboard_entry"]["rank"])
+
+    # Rank at submission time
+    assert submitted_ranks == [1, 1, 1, 4]
+
+    response = client.get("/api/leaderboard?game_mode=walls&limit=10")
+    data = response.json()
+    assert [entry["score"] for entry in data] == [200, 200, 100, 50]
+    assert [entry["rank"] for entry in data] == [1, 1, 3, 4]
+
+
+def test_leaderboard_score_counts_consistency(db_session):
+    """Test the rank counters can be checked and rebuilt"""
+    import crud
+    import models
+    import schemas
+
+    user = models.User(username="ranker", hashed_password="x")
+    db_session.add(user)
+    db_session.commit()
+
+    for score in [30, 60, 60]:
+        crud.create_leaderboard_entry(
+            db_session,
+            schemas.LeaderboardEntryCreate(
+                user_id=user.id,
+                score=score,
+                snake_length=3,
+                game_mode=models.GameMode.PASS_THROUGH,
+            ),
+        )
+
+    assert crud.check_leaderboard_score_counts(db_session) == []
+    assert crud.get_score_rank(db_session, models.GameMode.PASS_THROUGH, 30) == 3
+    assert crud.get_score_rank(db_session, models.GameMode.WALLS, 30) == 1
+
+    db_session.query(models.LeaderboardScoreCount).delete()
+    db_session.commit()
+    mismatches = crud.check_leaderboard_score_counts(db_session)
+    assert {(m["score"], m["expected"], m["actual"]) for m in mismatches} == {
+        (30, 1, 0),
+        (60, 2, 0),
+    }
+
+    crud.rebuild_leaderboard_score_counts(db_session)
+    assert crud.check_leaderboard_score_counts(db_session) == []
+
+
+def test_leaderboard_index_matches_sql(db_session):
+    """Test the in-memory index serves the same leaderboard as SQL"""
+    import crud
+    import models
+    import schemas
+    from leaderboard_index import index
+
+    users = [models.User(username=name, hashed_password="x") for name in "ab"]
+    db_session.add_all(users)
+    db_session.commit()
+
+    def submit(user, score, mode):
+        crud.create_leaderboard_entry(
+            db_session,
+            schemas.LeaderboardEntryCreate(
+                user_id=user.id, score=score, snake_length=2, game_mode=mode
+            ),
+        )
+
+    submit(users[0], 45, models.GameMode.WALLS)
+    submit(users[1], 90, models.GameMode.PASS_THROUGH)
+
+    try:
+        index.rebuild(db_session)
+        assert index.is_warm()
+
+        # Added incrementally once warm
+        submit(users[1], 45, models.GameMode.WALLS)
+        submit(users[0], 60, models.GameMode.WALLS)
+
+        for mode in [None, models.GameMode.WALLS, models.GameMode.PASS_THROUGH]:
+            indexed = crud.get_leaderboard(db_session, game_mode=mode, limit=10)
+            index.invalidate()
+            assert crud.get_leaderboard(db_session, game_mode=mode, limit=10) == (
+                indexed
+            )
+            index.rebuild(db_session)
+
+        walls = crud.get_leaderboard(db_session, models.GameMode.WALLS)
+        assert [entry["score"] for entry in walls] == [60, 45, 45]
+        assert [entry["rank"] for entry in walls] == [1, 2, 2]
+        assert index.rank(models.GameMode.WALLS, 45) == 2
+    finally:
+        index.invalidate()
+
+    # Cold index falls back to SQL
+    assert index.top(models.GameMode.WALLS) is None
+    assert len(crud.get_leaderboard(db_session, models.GameMode.WALLS)) == 3
+
+
+def test_leaderboard_index_catches_up_lower_ids(db_session):
+    """Test entries another worker committed are caught up even after this
+    worker added a higher id itself"""
+    import crud
+    import models
+    import schemas
+    from leaderboard_index import LeaderboardIndex
+
+    users = [models.User(username=name, hashed_password="x") for name in "ab"]
+    db_session.add_all(users)
+    db_session.commit()
+
+    def submit(user, score):
+        return crud.create_leaderboard_entry(
+            db_session,
+            schemas.LeaderboardEntryCreate(
+                user_id=user.id,
+                score=score,
+                snake_length=2,
+                game_mode=models.GameMode.WALLS,
+            ),
+        )
+
+    # This worker's index, warm before either entry exists
+    worker = LeaderboardIndex()
+    worker.rebuild(db_session)
+
+    # Committed by another worker, never added here
+    submit(users[0], 500)
+    # Committed and added by this worker
+    worker.add(submit(users[1], 10), "b")
+
+    worker.catch_up(db_session)
+    top = worker.top(models.GameMode.WALLS)
+    assert [(e["username"], e["score"]) for e in top] == [("a", 500), ("b", 10)]
+    assert [e["score"] for e in crud.get_leaderboard(db_session)] == [500, 10]
+
+
+def test_leaderboard_index_catches_up_late_commits(db_session):
+    """Test an entry whose id is below one already read, committed late as
+    PostgreSQL sequences allow, is still caught up"""
+    from datetime import datetime
+
+    import models
+    from leaderboard_index import LeaderboardIndex
+
+    user = models.User(username="a", hashed_password="x")
+    db_session.add(user)
+    db_session.commit()
+
+    def commit(entry_id, score):
+        db_session.add(
+            models.LeaderboardEntry(
+                id=entry_id,
+                user_id=user.id,
+                score=score,
+                snake_length=2,
+                game_mode=models.GameMode.WALLS,
+                created_at=datetime.utcnow(),
+            )
+        )
+        db_session.commit()
+
+    worker = LeaderboardIndex()
+    worker.rebuild(db_session)
+    commit(5, 50)
+    worker.catch_up(db_session)
+    commit(3, 30)
+    worker.catch_up(db_session)
+    worker.catch_up(db_session)
+
+    top = worker.top(models.GameMode.WALLS)
+    assert [(e["id"], e["score"]) for e in top] == [(5, 50), (3, 30)]
+
+
+def test_leaderboard_index_discards_loads_before_invalidate(db_session):
+    """Test rows loaded before an invalidate are not swapped in"""
+    import models
+    from leaderboard_index import LeaderboardIndex
+
+    worker = LeaderboardIndex()
+    load = worker._load
+
+    def load_then_invalidate(db, after_id=0):
+        rows = load(db, after_id)
+        worker.invalidate()
+        return rows
+
+    worker._load = load_then_invalidate
+    worker.rebuild(db_session)
+    assert not worker.is_warm()
+    assert worker.top(models.GameMode.WALLS) is None
+
+    worker._load = load
+    worker.rebuild(db_session)
+    worker._load = load_then_invalidate
+    worker.catch_up(db_session)
+    assert not worker.is_warm()
+
+
+def test_leaderboard_index_rebuild_outside_lock(db_session):
+    """Test a rebuild only takes the lock to swap the new index in, and keeps
+    entries added while it was building"""
+    import crud
+    import models
+    import schemas
+    from leaderboard_index import LeaderboardIndex
+
+    user = models.User(username="a", hashed_password="x")
+    db_session.add(user)
+    db_session.commit()
+
+    def submit(score):
+        return crud.create_leaderboard_entry(
+            db_session,
+            schemas.LeaderboardEntryCreate(
+                user_id=user.id,
+                score=score,
+                snake_length=2,
+                game_mode=models.GameMode.WALLS,
+            ),
+        )
+
+    worker = LeaderboardIndex()
+    worker.rebuild(db_session)
+    submit(30)
+
+    def build(rows):
+        assert not worker._lock.locked()
+        # Committed and added by this worker mid-rebuild
+        worker.add(submit(70), "a")
+        return LeaderboardIndex._build(rows)
+
+    worker._build = build
+    worker.rebuild(db_session)
+    top = worker.top(models.GameMode.WALLS)
+    assert [(e["score"], e["rank"]) for e in top] == [(70, 1), (30, 2)]
+
+
+def test_leaderboard_around_user(client, db_session):
+    """Test a user's rank and neighbours, from the index and from SQL"""
+    import crud
+    import models
+    import schemas
+    from leaderboard_index import index
+
+    users = [
+        models.User(username=f"player{i}", hashed_password="x") for i in range(30)
+    ]
+    db_session.add_all(users)
+    db_session.commit()
+    for i, user in enumerate(users):
+        crud.create_leaderboard_entry(
+            db_session,
+            schemas.LeaderboardEntryCreate(
+                user_id=user.id,
+                score=(30 - i) * 15,
+                snake_length=2,
+                game_mode=models.GameMode.WALLS,
+            ),
+        )
+
+    index.invalidate()
+    response = client.get("/api/leaderboard/around/player15?game_mode=walls&radius=3")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["rank"] == 16
+    assert [entry["username"] for entry in data["entries"]] == [
+        f"player{i}" for i in range(12, 19)
+    ]
+    assert [entry["rank"] for entry in data["entries"]] == list(range(13, 20))
+
+    index.rebuild(db_session)
+    try:
+        indexed = client.get(
+            "/api/leaderboard/around/player15?game_mode=walls&radius=3"
+        )
+        assert indexed.json() == data
+
+        top = client.get("/api/leaderboard/around/player0?game_mode=walls&radius=3")
+        assert [entry["rank"] for entry in top.json()["entries"]] == [1, 2, 3, 4]
+    finally:
+        index.invalidate()
+
+    response = client.get("/api/leaderboard/around/player0?game_mode=pass-through")
+    assert response.status_code == 404
+
+    response = client.get("/api/leaderboard/around/nobody?game_mode=walls")
+    assert response.status_code == 404
+
+
+def test_score_sketch_error_bound(db_session):
+    """Test sketch percentiles stay within the documented error bound"""
+    import random
+
+    import crud
+    import models
+    import schemas
+    from score_sketch import ScoreSketch
+
+    user = models.User(username="sketcher", hashed_password="x")
+    db_session.add(user)
+    db_session.commit()
+
+    rng = random.Random(4)
+    scores = [rng.randrange(0, 2000) for _ in range(500)]
+    for score in scores:
+        crud._adjust_score_count(db_session, models.GameMode.WALLS, score, 1)
+    db_session.commit()
+
+    exact_sketch = ScoreSketch(bucket_width=1)
+    coarse_sketch = ScoreSketch(bucket_width=50)
+    exact_sketch.rebuild(db_session)
+    coarse_sketch.rebuild(db_session)
+
+    for probe in range(0, 2100, 7):
+        exact = 100 * sum(score < probe for score in scores) / len(scores)
+        assert exact_sketch.percentile(models.GameMode.WALLS, probe) == {
+            "percentile": exact,
+            "error_bound": 0.0,
+        }
+
+        coarse = coarse_sketch.percentile(models.GameMode.WALLS, probe)
+        assert coarse["percentile"] <= exact
+        assert exact - coarse["percentile"] <= coarse["error_bound"] + 1e-9
+        if probe % 50 == 0:
+            assert coarse["error_bound"] == 0.0
+
+    # Incremental adds land in the same buckets as a rebuild
+    crud.create_leaderboard_entry(
+        db_session,
+        schemas.LeaderboardEntryCreate(
+            user_id=user.id, score=0, snake_length=1, game_mode=models.GameMode.WALLS
+        ),
+    )
+    coarse_sketch.add(models.GameMode.WALLS, 0)
+    rebuilt = ScoreSketch(bucket_width=50)
+    rebuilt.rebuild(db_session)
+    assert coarse_sketch.percentile(models.GameMode.WALLS, 1000) == (
+        rebuilt.percentile(models.GameMode.WALLS, 1000)
+    )
+
+
+def test_score_sketch_caps_buckets():
+    """Test huge scores share the top bucket instead of growing the sketch"""
+    import time
+
+    import models
+    from score_sketch import ScoreSketch
+
+    sketch = ScoreSketch(bucket_width=5, max_buckets=8)
+    sketch._refreshed_at = time.monotonic()
+    for score in [0, 10, 35, 40, 10**8]:
+        sketch.add(models.GameMode.WALLS, score)
+    # Never grown past its initial 64 buckets
+    assert len(sketch._histograms[models.GameMode.WALLS].counts) == 64
+
+    assert sketch.percentile(models.GameMode.WALLS, 10) == {
+        "percentile": 20.0,
+        "error_bound": 0.0,
+    }
+    # 35 and up share the top bucket, so it is never counted as beaten
+    assert sketch.percentile(models.GameMode.WALLS, 40) == {
+        "percentile": 40.0,
+        "error_bound": 60.0,
+    }
+    assert sketch.percentile(models.GameMode.WALLS, 10**9)["percentile"] == 40.0
+
+
+def test_score_percentile(client, authenticated_user):
+    """Test percentile lookups and the percentile reported by end_game"""
+    percentiles = []
+    for score in [30, 60, 90, 120]:
+        start_response = client.post(
+            "/api/games/start",
+            json={"user_id": authenticated_user["user"]["id"], "game_mode": "walls"},
+            headers=authenticated_user["headers"]
+        )
+        game_id = start_response.json()["id"]
+
+        end_response = client.post(
+            f"/api/games/{game_id}/end",
+            json={"score": score, "snake_length": score // 10, "is_completed": True},
+            headers=authenticated_user["headers"]
+        )
+        percentiles.append(end_response.json()["percentile"])
+
+    assert percentiles == [0.0, 50.0, 66.67, 75.0]
+
+    response = client.get("/api/leaderboard/percentile?game_mode=walls&score=100")
+    assert response.status_code == 200
+    assert response.json()["percentile"] == 75.0
+
+    response = client.get(
+        "/api/leaderboard/percentile?game_mode=pass-through&score=100"
+    )
+    assert response.json()["percentile"] == 0.0
+
+
+def test_user_stats_per_mode(client, authenticated_user, db_session):
+    """Test stats are maintained per mode on completion and can be rebuilt"""
+    import crud
+    import models
+
+    for mode, score in [("walls", 45), ("walls", 15), ("pass-through", 100)]:
+        start_response = client.post(
+            "/api/games/start",
+            json={"user_id": authenticated_user["user"]["id"], "game_mode": mode},
+            headers=authenticated_user["headers"]
+        )
+        game_id = start_response.json()["id"]
+
+        client.post(
+            f"/api/games/{game_id}/end",
+            json={"score": score, "snake_length": 3, "is_completed": True},
+            headers=authenticated_user["headers"]
+        )
+
+    # Ending the same game twice only applies the score difference
+    client.post(
+        f"/api/games/{game_id}/end",
+        json={"score": 120, "snake_length": 3, "is_completed": True},
+        headers=authenticated_user["headers"]
+    )
+
+    username = authenticated_user["user"]["username"]
+    data = client.get(f"/api/leaderboard/stats/{username}").json()
+    assert data["games_played"] == 3
+    assert data["total_score"] == 180
+    assert data["best_score"] == 120
+    assert data["average_score"] == 60.0
+    assert data["modes"] == {
+        "walls": {
+            "games_played": 2,
+            "total_score": 60,
+            "best_score": 45,
+            "average_score": 30.0,
+        },
+        "pass-through": {
+            "games_played": 1,
+            "total_score": 120,
+            "best_score": 120,
+            "average_score": 120.0,
+        },
+    }
+
+    db_session.query(models.UserStats).delete()
+    db_session.commit()
+    crud.rebuild_user_stats(db_session)
+    assert client.get(f"/api/leaderboard/stats/{username}").json() == data
+
+
+def test_query_cache_invalidated_by_writes(client, authenticated_user):
+    """Test cached reads are served until a write touches their tables"""
+    import cache
+
+    username = authenticated_user["user"]["username"]
+    headers = authenticated_user["headers"]
+
+    assert client.get(f"/api/leaderboard/stats/{username}").json()["games_played"] == 0
+    hits = cache.queries.hits
+    assert client.get(f"/api/leaderboard/stats/{username}").json()["games_played"] == 0
+    assert cache.queries.hits > hits
+
+    start_response = client.post(
+        "/api/games/start",
+        json={"user_id": authenticated_user["user"]["id"], "game_mode": "walls"},
+        headers=headers
+    )
+    game_id = start_response.json()["id"]
+    client.get(f"/api/games/{game_id}", headers=headers)
+    client.post(
+        f"/api/games/{game_id}/end",
+        json={"score": 30, "snake_length": 3},
+        headers=headers
+    )
+
+    # Completing the game invalidated both the cached game and the stats
+    assert client.get(f"/api/games/{game_id}", headers=headers).json()["is_completed"]
+    data = client.get(f"/api/leaderboard/stats/{username}").json()
+    assert data["games_played"] == 1
+    assert data["best_score"] == 30
+
+    stats = client.get("/api/metrics").json()["caches"]["queries"]
+    assert stats["hits"] > 0
+    assert stats["invalidations"] > 0
+
+    # A result read before an invalidation of its table is not cached
+    versions = cache.queries.versions(("games",))
+    cache.queries.invalidate("games")
+    cache.queries.set("stale", 1, ("games",), versions)
+    assert cache.queries.get("stale") is None
+
+
+def test_concurrent_reads_are_coalesced(client, authenticated_user, monkeypatch):
+    """Test concurrent identical stats requests share one query"""
+    import threading
+    import time
+
+    import crud
+    import singleflight
+
+    queries = []
+    get_user_stats = crud.get_user_stats
+
+    def slow_get_user_stats(*args, **kwargs):
+        queries.append(1)
+        time.sleep(0.2)
+        return get_user_stats(*args, **kwargs)
+
+    monkeypatch.setattr(crud, "get_user_stats", slow_get_user_stats)
+    collapsed = singleflight.leaderboard_reads.collapsed
+    username = authenticated_user["user"]["username"]
+
+    responses = []
+    threads = [
+        threading.Thread(
+            target=lambda: responses.append(
+                client.get(f"/api/leaderboard/stats/{username}")
+            )
+        )
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [response.status_code for response in responses] == [200] * 8
+    assert all(response.json()["games_played"] == 0 for response in responses)
+    assert len(queries) < 8
+    assert singleflight.leaderboard_reads.collapsed - collapsed == 8 - len(queries)
+
+    metrics = client.get("/api/metrics").json()["singleflight"]
+    assert metrics["leaderboard_reads"]["in_flight"] == 0
+
+
+def test_coalesced_read_after_invalidation(db_session):
+    """Test a read arriving after an invalidation doesn't join a build that
+    started before it"""
+    import threading
+
+    import cache
+    from routers.leaderboard import _cached_json
+
+    started, release = threading.Event(), threading.Event()
+
+    def old_build():
+        started.set()
+        release.wait(5)
+        return b"old"
+
+    def read(build, out):
+        out.append(_cached_json(("coalesced",), ("leaderboard_entries",), build).body)
+
+    first, second = [], []
+    leader = threading.Thread(target=read, args=(old_build, first))
+    leader.start()
+    started.wait(5)
+    cache.queries.invalidate("leaderboard_entries")
+    read(lambda: b"new", second)
+    release.set()
+    leader.join()
+
+    assert (first, second) == ([b"old"], [b"new"])
+
+
+def test_leaderboard_snapshot(tmp_path):
+    """Test the shared snapshot serves published rows and refuses dirty ones"""
+    import models
+    from leaderboard_snapshot import LeaderboardSnapshot
+
+    def row(entry_id, score, rank):
+        return {
+            "id": entry_id,
+            "user_id": 1,
+            "username": "snake",
+            "score": score,
+            "snake_length": 3,
+            "game_mode": "walls",
+            "rank": rank,
+            "created_at": "2024-01-01T00:00:00",
+        }
+
+    def row_json(entry_id, score, rank):
+        return (
+            f'{{"id":{entry_id},"user_id":1,"username":"snake","score":{score},'
+            f'"snake_length":3,"game_mode":"walls","rank":{rank},'
+            f'"created_at":"2024-01-01T00:00:00"}}'
+        ).encode()
+
+    rows = {
+        None: [row(2, 30, 1), row(1, 15, 2)],
+        models.GameMode.WALLS: [row(2, 30, 1)],
+        models.GameMode.PASS_THROUGH: [],
+    }
+    writer = LeaderboardSnapshot(str(tmp_path / "board.snapshot"), 4096, 2)
+    reader = LeaderboardSnapshot(str(tmp_path / "board.snapshot"), 4096, 2)
+
+    assert reader.read(None, 2) is None
+    assert writer.acquire_writer()
+    assert not reader.acquire_writer()
+    assert writer.needs_publish()
+    writer.publish(lambda game_mode, limit: rows[game_mode][:limit])
+    assert not writer.needs_publish()
+
+    first, second = row_json(2, 30, 1), row_json(1, 15, 2)
+    assert reader.read(None, 2) == b"[" + first + b"," + second + b"]"
+    assert reader.read(None, 1) == b"[" + first + b"]"
+    assert reader.read(models.GameMode.WALLS, 2) == b"[" + first + b"]"
+    assert reader.read(models.GameMode.PASS_THROUGH, 2) == b"[]"
+    assert reader.read(None, 3) is None  # beyond the published top-K
+
+    # A change from any worker makes readers fall back until republished
+    reader.mark_dirty()
+    assert reader.read(None, 2) is None
+    assert writer.needs_publish()
+    rows[None] = rows[None][:1]
+    writer.publish(lambda game_mode, limit: rows[game_mode][:limit])
+    assert reader.read(None, 2) == b"[" + first + b"]"
+
+    # The writer withdraws the snapshot and hands over the lock on shutdown
+    writer.release_writer()
+    assert reader.read(None, 2) is None
+    assert reader.acquire_writer()
+    reader.release_writer()
+
+
+def test_leaderboard_served_from_snapshot(client, authenticated_user):
+    """Test the endpoint serves the same JSON from the snapshot as from SQL"""
+    import time
+
+    import leaderboard_snapshot
+
+    for score in [30, 60]:
+        start_response = client.post(
+            "/api/games/start",
+            json={"user_id": authenticated_user["user"]["id"], "game_mode": "walls"},
+            headers=authenticated_user["headers"]
+        )
+        client.post(
+            f"/api/games/{start_response.json()['id']}/end",
+            json={"score": score, "snake_length": 3},
+            headers=authenticated_user["headers"]
+        )
+
+    # Right after a write the snapshot is dirty and the local path answers
+    expected = client.get("/api/leaderboard?limit=5").json()
+    assert [entry["score"] for entry in expected] == [60, 30]
+
+    snapshot = leaderboard_snapshot.snapshot
+    deadline = time.monotonic() + 5
+    while snapshot.read(None, 5) is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    hits = snapshot.hits
+    assert client.get("/api/leaderboard?limit=5").json() == expected
+    assert snapshot.hits == hits + 1
+
+
+def test_stats_json_encoded_once(client, authenticated_user, monkeypatch):
+    """Test stats JSON is encoded once and re-encoded only after a write"""
+    from routers import leaderboard as leaderboard_router
+
+    encoded = []
+    encode = leaderboard_router._encode
+
+    def counting_encode(adapter, value):
+        encoded.append(value)
+        return encode(adapter, value)
+
+    monkeypatch.setattr(leaderboard_router, "_encode", counting_encode)
+    username = authenticated_user["user"]["username"]
+
+    first = client.get(f"/api/leaderboard/stats/{username}")
+    second = client.get(f"/api/leaderboard/stats/{username}")
+    assert first.content == second.content
+    assert first.headers["content-type"] == "application/json"
+    assert "error" not in first.json()
+    assert len(encoded) == 1
+
+    start_response = client.post(
+        "/api/games/start",
+        json={"user_id": authenticated_user["user"]["id"], "game_mode": "walls"},
+        headers=authenticated_user["headers"]
+    )
+    client.post(
+        f"/api/games/{start_response.json()['id']}/end",
+        json={"score": 45, "snake_length": 4},
+        headers=authenticated_user["headers"]
+    )
+
+    data = client.get(f"/api/leaderboard/stats/{username}").json()
+    assert len(encoded) == 2
+    assert data["modes"]["walls"]["best_score"] == 45
+
+    schema = client.get("/openapi.json").json()["components"]["schemas"]
+    assert "LeaderboardRow" in schema and "UserStats" in schema
+
+
+def test_leaderboard_and_stats_etags(client, authenticated_user):
+    """Test leaderboard and stats revalidate with 304 until a write"""
+    import time
+
+    import leaderboard_snapshot
+    import models
+
+    username = authenticated_user["user"]["username"]
+    headers = authenticated_user["headers"]
+
+    def play(score):
+        start_response = client.post(
+            "/api/games/start",
+            json={"user_id": authenticated_user["user"]["id"], "game_mode": "walls"},
+            headers=headers
+        )
+        client.post(
+            f"/api/games/{start_response.json()['id']}/end",
+            json={"score": score, "snake_length": 3},
+            headers=headers
+        )
+
+    play(30)
+
+    stats = client.get(f"/api/leaderboard/stats/{username}")
+    etag = stats.headers["ETag"]
+    unchanged = client.get(
+        f"/api/leaderboard/stats/{username}", headers={"If-None-Match": etag}
+    )
+    assert unchanged.status_code == 304
+    assert unchanged.content == b""
+
+    # Leaderboard responses are tagged once served from the shared snapshot
+    deadline = time.monotonic() + 5
+    while (
+        leaderboard_snapshot.snapshot.read(models.GameMode.WALLS, 10) is None
+        and time.monotonic() < deadline
+    ):
+        time.sleep(0.05)
+    board = client.get("/api/leaderboard?game_mode=walls")
+    board_etag = board.headers["ETag"]
+    assert client.get(
+        "/api/leaderboard?game_mode=walls", headers={"If-None-Match": board_etag}
+    ).status_code == 304
+
+    play(60)
+
+    stats = client.get(
+        f"/api/leaderboard/stats/{username}", headers={"If-None-Match": etag}
+    )
+    assert stats.status_code == 200
+    assert stats.json()["best_score"] == 60
+
+    board = client.get(
+        "/api/leaderboard?game_mode=walls", headers={"If-None-Match": board_etag}
+    )
+    assert board.status_code == 200
+    assert [entry["score"] for entry in board.json()] == [60, 30]
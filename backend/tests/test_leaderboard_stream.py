@@ -0,0 +1,143 @@
+"""
+Tests for the live leaderboard stream
+"""
+
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import orjson
+
+
+def _entry(entry_id, score, game_mode):
+    return SimpleNamespace(
+        id=entry_id,
+        user_id=entry_id,
+        score=score,
+        snake_length=3,
+        game_mode=game_mode,
+        created_at=datetime(2024, 1, 1),
+    )
+
+
+def _parse(frame: bytes):
+    event, data = frame.decode().rstrip("\n").split("\n")
+    return event.removeprefix("event: "), orjson.loads(data.removeprefix("data: "))
+
+
+def test_stream_snapshot_then_batched_diffs(db_session):
+    """Test a viewer gets its top entries, then one diff per batch that
+    rebuilds the same list, and a snapshot again after a rebuild"""
+    from leaderboard_index import LeaderboardIndex
+    from leaderboard_stream import LeaderboardStream
+    from models import GameMode
+
+    index = LeaderboardIndex()
+    index.rebuild(db_session)
+    index.add(_entry(1, 100, GameMode.WALLS), "a")
+    index.add(_entry(2, 50, GameMode.WALLS), "b")
+
+    async def run():
+        stream = LeaderboardStream(index, batch=0.01, keepalive=60)
+        body = stream.events(GameMode.WALLS, 3)
+        snapshot = _parse(await body.__anext__())
+
+        index.add(_entry(3, 300, GameMode.WALLS), "c")
+        index.add(_entry(4, 999, GameMode.PASS_THROUGH), "d")
+        # Below the top 3 by then
+        index.add(_entry(5, 10, GameMode.WALLS), "e")
+        index.add(_entry(6, 75, GameMode.WALLS), "f")
+        diff = _parse(await asyncio.wait_for(body.__anext__(), 1))
+        stats = stream.stats()
+        top = [row["id"] for row in index.top(GameMode.WALLS, 3)]
+
+        index.rebuild(db_session)
+        resync = _parse(await asyncio.wait_for(body.__anext__(), 1))
+        await body.aclose()
+        after = stream.stats()
+        await stream.stop()
+        return snapshot, diff, top, stats, resync, after
+
+    snapshot, diff, top, stats, resync, after = asyncio.run(run())
+
+    assert snapshot[0] == "snapshot"
+    assert [row["id"] for row in snapshot[1]["entries"]] == [1, 2]
+    assert diff[0] == "diff"
+    assert diff[1]["seq"] > snapshot[1]["seq"]
+    assert [(i["position"], i["entry"]["id"]) for i in diff[1]["inserted"]] == [
+        (0, 3),
+        (2, 6),
+    ]
+
+    rows = snapshot[1]["entries"]
+    for inserted in diff[1]["inserted"]:
+        rows.insert(inserted["position"], inserted["entry"])
+    assert [row["id"] for row in rows[:3]] == top
+    assert stats["viewers"] == 1 and stats["batches"] == 1 and stats["inserts"] == 4
+
+    # Rebuilt from the (empty) database
+    assert resync == ("snapshot", {"seq": resync[1]["seq"], "entries": []})
+    assert after["viewers"] == 0
+
+
+def test_slow_viewer_is_resynced():
+    """Test a viewer that stops reading is capped, then sent a snapshot"""
+    import leaderboard_stream
+
+    async def run():
+        viewer = leaderboard_stream.Viewer(None, 10)
+        viewer.since, viewer.stale = 0, False
+        for seq in range(1, leaderboard_stream.QUEUE + 2):
+            viewer.push((seq, seq, [], b""))
+        return viewer, await viewer.get()
+
+    viewer, message = asyncio.run(run())
+    assert viewer.resyncs == 1
+    assert not viewer.messages
+    assert message is None
+
+
+def test_stream_endpoint(db_session):
+    """Test the endpoint streams Server-Sent Events until the client leaves"""
+    import leaderboard_stream
+    from main import app
+
+    async def run():
+        sent = []
+        first_event = asyncio.Event()
+
+        async def receive():
+            await first_event.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+            if message.get("body"):
+                first_event.set()
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": "/api/leaderboard/stream",
+            "raw_path": b"/api/leaderboard/stream",
+            "root_path": "",
+            "query_string": b"game_mode=walls&limit=5",
+            "headers": [],
+            "client": ("testclient", 50000),
+            "server": ("testserver", 80),
+        }
+        await asyncio.wait_for(app(scope, receive, send), 5)
+        stats = leaderboard_stream.stream.stats()
+        await leaderboard_stream.stream.stop()
+        return sent, stats
+
+    sent, stats = asyncio.run(run())
+    start = sent[0]
+    assert start["status"] == 200
+    assert (b"content-type", b"text/event-stream; charset=utf-8") in start["headers"]
+    event, data = _parse(sent[1]["body"])
+    assert (event, data["entries"]) == ("snapshot", [])
+    assert stats["viewers"] == 0
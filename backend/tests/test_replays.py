@@ -0,0 +1,212 @@
+"""
+Tests for packed replays and the replay endpoints
+"""
+
+import os
+import random
+
+import pytest
+
+
+@pytest.fixture
+def replay_dir(tmp_path, monkeypatch):
+    import replays
+
+    monkeypatch.setattr(replays, "REPLAY_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_pack_round_trip():
+    """Test packing keeps every move and a long game stays small"""
+    import replays
+    from snake_engine import Direction
+
+    rng = random.Random(5)
+    moves = bytearray()
+    while len(moves) < 10_000:
+        moves += bytes([rng.choice(list(Direction))]) * rng.randint(1, 8)
+    moves += bytes([Direction.LEFT]) * 200
+    moves = bytes(moves)
+
+    data = replays.pack(123456789, moves)
+    assert replays.unpack(data) == (123456789, moves)
+    assert len(data) < 4096
+    assert replays.unpack(replays.pack(0, b"")) == (0, b"")
+
+    with pytest.raises(ValueError):
+        replays.unpack(data[:-1])
+    assert replays.parse_moves("URDL") == bytes(
+        [Direction.UP, Direction.RIGHT, Direction.DOWN, Direction.LEFT]
+    )
+
+
+def _submit(client, headers, game):
+    """Submit a simulated game through the batch endpoint, returning its ID"""
+    from datetime import datetime
+
+    import simulator
+
+    response = client.post(
+        "/api/games/batch",
+        json={"games": [simulator.completed_game(game, datetime(2024, 1, 1))]},
+        headers=headers,
+    )
+    assert response.status_code == 201
+    return response.json()[0]["game"]["id"]
+
+
+def test_upload_and_download_replay(
+    client, authenticated_user, replay_dir, monkeypatch
+):
+    """Test a replay is stored packed and served whole or by range"""
+    import replays
+    import simulator
+    from models import GameMode
+
+    headers = authenticated_user["headers"]
+    game = simulator.play("wall", GameMode.WALLS, 42, random.Random(1), max_ticks=1000)
+    game_id = _submit(client, headers, game)
+
+    response = client.get(f"/api/games/{game_id}/replay", headers=headers)
+    assert response.status_code == 404
+
+    moves = replays.format_moves(game.moves)
+    response = client.put(
+        f"/api/games/{game_id}/replay",
+        json=simulator.replay_upload(game),
+        headers=headers,
+    )
+    assert response.status_code == 200
+    info = response.json()
+    assert info["ticks"] == len(moves)
+    assert info["size_bytes"] < len(moves) // 3
+
+    response = client.get(f"/api/games/{game_id}/replay", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["content-type"] == replays.MEDIA_TYPE
+    full = response.content
+    assert len(full) == info["size_bytes"]
+    assert replays.unpack(full) == (42, game.moves)
+
+    # Short reads and several chunks still send the whole range
+    real_pread = os.pread
+    with monkeypatch.context() as patch:
+        patch.setattr(replays, "CHUNK_SIZE", 7)
+        patch.setattr(os, "pread", lambda fd, n, offset: real_pread(fd, 3, offset))
+        response = client.get(f"/api/games/{game_id}/replay", headers=headers)
+    assert response.content == full
+
+    response = client.get(
+        f"/api/games/{game_id}/replay", headers={**headers, "Range": "bytes=4-11"}
+    )
+    assert response.status_code == 206
+    assert response.content == full[4:12]
+    assert response.headers["content-range"] == f"bytes 4-11/{len(full)}"
+
+    response = client.get(
+        f"/api/games/{game_id}/replay", headers={**headers, "Range": "bytes=-5"}
+    )
+    assert (response.status_code, response.content) == (206, full[-5:])
+
+    response = client.get(
+        f"/api/games/{game_id}/replay",
+        headers={**headers, "Range": f"bytes={len(full)}-"},
+    )
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(full)}"
+
+
+def test_upload_replay_validation(client, authenticated_user, replay_dir):
+    """Test only the owner may upload, only well-formed move logs that
+    reproduce the finished game"""
+    import replays
+    import simulator
+    from models import GameMode
+
+    headers = authenticated_user["headers"]
+    game = simulator.play("greedy", GameMode.WALLS, 7, random.Random(2))
+    assert game.score > 0
+    game_id = _submit(client, headers, game)
+    upload = simulator.replay_upload(game)
+
+    response = client.put(
+        f"/api/games/{game_id}/replay",
+        json={"seed": 1, "moves": "RRX"},
+        headers=headers,
+    )
+    assert response.status_code == 422
+
+    response = client.put(
+        f"/api/games/{game_id}/replay",
+        json={**upload, "seed": -1},
+        headers=headers,
+    )
+    assert response.status_code == 422
+
+    # Logs that do not replay to the stored result
+    for bad in [
+        {**upload, "seed": upload["seed"] + 1},
+        {**upload, "moves": upload["moves"][: len(upload["moves"]) // 2]},
+        {**upload, "moves": upload["moves"] + "R"},
+    ]:
+        response = client.put(f"/api/games/{game_id}/replay", json=bad, headers=headers)
+        assert response.status_code == 422
+    assert not list(replay_dir.iterdir())
+
+    # A game still being played has no result to check against
+    live_id = client.post(
+        "/api/games/start",
+        json={"user_id": authenticated_user["user"]["id"], "game_mode": "walls"},
+        headers=headers,
+    ).json()["id"]
+    response = client.put(
+        f"/api/games/{live_id}/replay",
+        json={"seed": 1, "moves": "RR"},
+        headers=headers,
+    )
+    assert response.status_code == 409
+
+    client.post(
+        "/api/auth/signup",
+        json={"username": "other", "email": "other@example.com", "password": "pw"},
+    )
+    token = client.post(
+        "/api/auth/login", data={"username": "other", "password": "pw"}
+    ).json()["access_token"]
+    other_headers = {"Authorization": f"Bearer {token}"}
+    response = client.put(
+        f"/api/games/{game_id}/replay", json=upload, headers=other_headers
+    )
+    assert response.status_code == 403
+    assert not list(replay_dir.iterdir())
+
+    game_url = f"/api/games/{game_id}"
+    assert client.get(game_url, headers=headers).json()["replay_verified"] is False
+    response = client.put(f"{game_url}/replay", json=upload, headers=headers)
+    assert response.status_code == 200
+    assert client.get(game_url, headers=headers).json()["replay_verified"] is True
+
+    # The game is on the leaderboard, so anyone signed in may watch it
+    response = client.get(f"/api/games/{game_id}/replay", headers=other_headers)
+    assert response.status_code == 200
+    assert replays.unpack(response.content) == (game.seed, game.moves)
+    assert client.get(f"/api/games/{game_id}/replay").status_code == 401
+
+    # Games that never reached the leaderboard stay private
+    unranked = simulator.SimulatedGame("none", GameMode.WALLS, 3, b"\x01", 0, 1, 0)
+    unranked_id = _submit(client, headers, unranked)
+    response = client.put(
+        f"/api/games/{unranked_id}/replay",
+        json=simulator.replay_upload(unranked),
+        headers=headers,
+    )
+    assert response.status_code == 200
+    response = client.get(f"/api/games/{unranked_id}/replay", headers=other_headers)
+    assert response.status_code == 403
+    response = client.get(f"/api/games/{unranked_id}/replay", headers=headers)
+    assert response.status_code == 200
+
+    # Correcting the result voids the check
+    response = client.patch(game_url, json={"score": game.score + 15}, headers=headers)
+    assert response.json()["replay_verified"] is False
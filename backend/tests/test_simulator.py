@@ -0,0 +1,84 @@
+"""
+Tests for the self-play simulator
+"""
+
+
+def test_bot_games_replay():
+    """Test every policy plays games whose move logs back their results"""
+    import simulator
+    from snake_engine import Claim, verify
+
+    games = list(simulator.simulate(60, processes=1, max_ticks=2000))
+    assert len(games) == 60
+    assert {game.policy for game in games} == set(simulator.POLICIES)
+    for game in games:
+        assert 0 < len(game.moves) <= 2000
+        assert verify(
+            Claim(game.game_mode, game.seed, game.moves, game.score, game.snake_length)
+        )
+    assert any(game.food_eaten for game in games if game.policy == "greedy")
+
+
+def test_simulate_is_reproducible():
+    """Test a run plays the same games whatever the number of processes"""
+    import simulator
+
+    options = dict(
+        policies=["greedy", "random"], max_ticks=300, random_seed=3, chunk_size=7
+    )
+    inline = list(simulator.simulate(30, processes=1, **options))
+    pooled = list(simulator.simulate(30, processes=2, **options))
+    assert inline == pooled
+    assert inline != list(
+        simulator.simulate(30, processes=1, **{**options, "random_seed": 4})
+    )
+
+
+def test_main_rejects_no_games(capsys):
+    """Test the command line refuses --games 0 instead of dividing by it"""
+    import pytest
+    import simulator
+
+    with pytest.raises(SystemExit) as error:
+        simulator.main(["--games", "0"])
+    assert error.value.code == 2
+    assert "must be at least 1" in capsys.readouterr().err
+
+    simulator.main(["--games", "3", "--processes", "1", "--max-ticks", "50"])
+    assert "3 games" in capsys.readouterr().err
+
+
+def test_simulated_games_through_api(client, authenticated_user, tmp_path, monkeypatch):
+    """Test simulated games and replays are accepted by the API"""
+    from datetime import datetime, timedelta
+
+    import replays
+    import simulator
+    from snake_engine import replay
+
+    monkeypatch.setattr(replays, "REPLAY_DIR", str(tmp_path))
+    headers = authenticated_user["headers"]
+    games = list(simulator.simulate(5, ["greedy"], processes=1, max_ticks=500))
+    started_at = datetime.utcnow() - timedelta(hours=1)
+
+    response = client.post(
+        "/api/games/batch",
+        json={"games": [simulator.completed_game(g, started_at) for g in games]},
+        headers=headers,
+    )
+    assert response.status_code == 201
+    submitted = response.json()
+    assert [s["game"]["score"] for s in submitted] == [g.score for g in games]
+    assert submitted[0]["game"]["moves_count"] == len(games[0].moves)
+
+    game_id = submitted[0]["game"]["id"]
+    response = client.put(
+        f"/api/games/{game_id}/replay",
+        json=simulator.replay_upload(games[0]),
+        headers=headers,
+    )
+    assert response.status_code == 200
+    seed, moves = replays.unpack(
+        client.get(f"/api/games/{game_id}/replay", headers=headers).content
+    )
+    assert replay(games[0].game_mode, seed, moves).score == games[0].score
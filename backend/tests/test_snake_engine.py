@@ -0,0 +1,116 @@
+"""
+Tests for the server-side snake rules and replay verification
+"""
+
+import random
+
+import pytest
+from models import GameMode
+from snake_engine import (
+    CELLS,
+    Claim,
+    Direction,
+    SnakeGame,
+    position,
+    replay,
+    replay_batch,
+    verify,
+    verify_batch,
+)
+
+
+def play(game_mode, seed, rng, limit=3000):
+    """Move log of a greedy player that heads for the food, avoids dying
+    while it can and sometimes wanders off at random"""
+    game = SnakeGame(game_mode, seed)
+    moves = []
+    while game.alive and len(moves) < limit:
+        options = [d for d in Direction if game.turn(d) == d]
+        safe = [d for d in options if game.is_free(game.next_cell(d))]
+        if safe and rng.random() > 0.02:
+            fx, fy = position(game.food)
+
+            def distance(direction):
+                x, y = position(game.next_cell(direction))
+                return abs(fx - x) + abs(fy - y)
+
+            move = min(safe, key=distance)
+        else:
+            move = rng.choice(list(Direction))
+        moves.append(move)
+        game.step(move)
+    return moves
+
+
+def test_walls_end_the_game():
+    """Test leaving a walled board ends the game, but wraps in pass-through"""
+    result = replay(GameMode.WALLS, 1, [Direction.RIGHT] * 12)
+    assert (result.alive, result.ticks, result.snake_length) == (False, 10, 1)
+
+    result = replay(GameMode.PASS_THROUGH, 1, [Direction.RIGHT] * 12)
+    assert (result.alive, result.ticks) == (True, 12)
+
+
+def test_reversal_is_ignored():
+    """Test turning straight back keeps the current direction"""
+    game = SnakeGame(GameMode.PASS_THROUGH, 7)
+    game.step(Direction.LEFT)
+    assert game.direction == Direction.RIGHT
+    assert position(game.body[0]) == (11, 10)
+
+
+def test_food_is_deterministic():
+    """Test the same seed places the same food and eating scores per mode"""
+    for game_mode, points in ((GameMode.WALLS, 15), (GameMode.PASS_THROUGH, 10)):
+        moves = play(game_mode, 42, random.Random(0))
+        first = replay(game_mode, 42, moves)
+        assert first == replay(game_mode, 42, moves)
+        assert first.food_eaten > 3
+        assert first.score == first.food_eaten * points
+        assert first.snake_length == first.food_eaten + 1
+        assert not first.alive
+    assert SnakeGame(GameMode.WALLS, 1).food != SnakeGame(GameMode.WALLS, 2).food
+    assert 0 <= SnakeGame(GameMode.WALLS, 0).food < CELLS
+
+
+def test_replay_batch_matches_replay():
+    """Test vectorized replays agree with the reference, collisions included"""
+    rng = random.Random(3)
+    game_modes, seeds, logs = [], [], []
+    for index in range(120):
+        game_mode = rng.choice(list(GameMode))
+        seed = rng.getrandbits(32)
+        if index % 3:
+            log = play(game_mode, seed, rng)
+        else:
+            log = [rng.randrange(4) for _ in range(rng.randrange(0, 200))]
+        game_modes.append(game_mode)
+        seeds.append(seed)
+        logs.append(log)
+
+    expected = [replay(*game) for game in zip(game_modes, seeds, logs)]
+    assert replay_batch(game_modes, seeds, logs) == expected
+    assert any(result.snake_length > 10 for result in expected)
+    assert {result.alive for result in expected} == {True, False}
+
+    with pytest.raises(ValueError):
+        replay_batch([GameMode.WALLS], [1], [[4]])
+
+
+def test_verify_claims():
+    """Test claims are accepted only when the replay backs them"""
+    moves = play(GameMode.WALLS, 9, random.Random(1))
+    result = replay(GameMode.WALLS, 9, moves)
+    honest = Claim(GameMode.WALLS, 9, moves, result.score, result.snake_length)
+    inflated = honest._replace(score=result.score + 15)
+    padded = honest._replace(moves=moves + [Direction.UP])
+    other_seed = honest._replace(seed=10)
+
+    assert verify(honest)
+    assert not verify(inflated)
+    assert verify_batch([honest, inflated, padded, other_seed]) == [
+        True,
+        False,
+        False,
+        False,
+    ]
@@ -0,0 +1,150 @@
+"""
+Shared version counters for conditional GETs
+
+Write paths bump the version of what they changed (a game mode's
+leaderboard, a user's games and stats); read endpoints derive a strong ETag
+from the versions their response depends on plus the request parameters,
+and answer a matching ``If-None-Match`` with 304 before touching the
+database or serializing anything.
+
+The counters live in a memory-mapped file (see
+``database.shared_memory_path``) so every worker sees every bump. Scopes
+are hashed onto a fixed table of slots; two scopes sharing a slot only
+cause extra revalidations. A bump stores a fresh random value rather than
+incrementing, so concurrent bumps from two workers can never cancel out.
+The file also holds an epoch, replaced by ``reset`` (and whenever the file
+is created), so ETags from before a bulk change or a reboot never match.
+
+Versions only cover writes made through ``crud``; run ``reset`` after
+changing the database by other means.
+"""
+
+import hashlib
+import mmap
+import os
+import random
+import struct
+from typing import Iterable, Optional
+
+from database import shared_memory_path
+from fastapi import Request, Response, status
+
+# Counter file; an empty value disables ETags
+PATH = os.getenv("ETAG_VERSIONS_PATH", shared_memory_path("versions"))
+# Number of counter slots
+SLOTS = int(os.getenv("ETAG_VERSION_SLOTS", "8192"))
+
+_MAGIC = b"SVT1"
+_HEADER = struct.Struct("<4s4xQ")
+_SLOT = struct.Struct("<Q")
+
+
+def _slot(scope: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(scope.encode(), digest_size=8).digest(), "little"
+    )
+
+
+class VersionCounters:
+    """Per-scope version counters shared by all workers"""
+
+    def __init__(self, path: str = PATH, slots: int = SLOTS):
+        self.path = path
+        self.slots = slots
+        self._map = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _mapping(self):
+        if self._map is None:
+            size = _HEADER.size + self.slots * _SLOT.size
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                if os.fstat(fd).st_size < size:
+                    os.ftruncate(fd, size)
+                self._map = mmap.mmap(fd, size)
+            finally:
+                os.close(fd)
+            if self._map[:4] != _MAGIC:
+                self.reset()
+        return self._map
+
+    def _offset(self, scope: str) -> int:
+        return _HEADER.size + (_slot(scope) % self.slots) * _SLOT.size
+
+    def bump(self, *scopes: str):
+        """Record that the data behind each scope changed"""
+        if not self.enabled:
+            return
+        mapping = self._mapping()
+        for scope in scopes:
+            _SLOT.pack_into(mapping, self._offset(scope), random.getrandbits(64))
+
+    def version(self, scope: str) -> int:
+        """Current version of scope (0 while disabled)"""
+        if not self.enabled:
+            return 0
+        return _SLOT.unpack_from(self._mapping(), self._offset(scope))[0]
+
+    def reset(self):
+        """Start a new epoch, so that no earlier ETag matches"""
+        if self.enabled:
+            _HEADER.pack_into(self._mapping(), 0, _MAGIC, random.getrandbits(64))
+
+    def etag(self, scopes: Iterable[str], *params) -> Optional[str]:
+        """Strong ETag of the current versions of scopes and the parameters"""
+        if not self.enabled:
+            return None
+        mapping = self._mapping()
+        digest = hashlib.blake2b(digest_size=12)
+        digest.update(mapping[: _HEADER.size])
+        for scope in scopes:
+            offset = self._offset(scope)
+            digest.update(mapping[offset : offset + _SLOT.size])
+        digest.update(repr(params).encode())
+        return f'"{digest.hexdigest()}"'
+
+
+counters = VersionCounters()
+
+
+def leaderboard_scope(game_mode) -> str:
+    """Scope of a game mode's leaderboard (None for every mode)"""
+    return f"leaderboard:{game_mode.value if game_mode else 'all'}"
+
+
+def user_scope(user_id: int) -> str:
+    """Scope of a user's games and stats"""
+    return f"user:{user_id}"
+
+
+def account_scope(username: str) -> str:
+    """Scope of the user row behind a username (see auth.cached_user)"""
+    return f"account:{username}"
+
+
+def not_modified(request: Request, etag: Optional[str]) -> Optional[Response]:
+    """A 304 response if the request's If-None-Match matches etag"""
+    if etag is None:
+        return None
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    if etag in candidates or "*" in candidates:
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers=_headers(etag)
+        )
+    return None
+
+
+def set_etag(response: Response, etag: Optional[str]):
+    """Attach etag to a response clients should revalidate"""
+    if etag is not None:
+        response.headers.update(_headers(etag))
+
+
+def _headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": "no-cache"}
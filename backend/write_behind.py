@@ -0,0 +1,121 @@
+"""
+Opt-in write-behind buffer for in-progress game updates
+
+With ``GAME_WRITE_BEHIND=1``, ``PATCH /api/games/{game_id}`` no longer
+writes each progress update (score, length, moves, ...) to the database.
+The latest values per game are merged in memory and flushed in one
+transaction every ``GAME_WRITE_BEHIND_FLUSH_SECONDS``; ``end_game`` takes a
+game's pending values and commits them with the final result.
+
+Crash safety: buffered progress is only in the worker's memory. If the
+worker is killed, up to ``GAME_WRITE_BEHIND_FLUSH_SECONDS`` of progress per
+game is lost and the stored game shows its last flushed values; a clean
+shutdown flushes. Completed games are never affected: ``end_game`` is
+written through and commits before it returns, and a flush skips games
+that are already completed, so a late flush can't overwrite a final
+score. Updates that complete a game or set ``ended_at`` are written
+through as before. With several workers, progress for one game that
+reaches different workers may be flushed out of order; the values
+submitted to ``end_game`` are what counts.
+
+Off by default, so every PATCH stays durable when it returns.
+"""
+
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import crud
+import schemas
+from sqlalchemy.orm import Session
+
+# Buffer progress updates instead of writing each one
+ENABLED = os.getenv("GAME_WRITE_BEHIND", "0").lower() in ("1", "true", "yes")
+# Seconds between flushes
+FLUSH_SECONDS = float(os.getenv("GAME_WRITE_BEHIND_FLUSH_SECONDS", "1"))
+
+# Fields a progress update may buffer; anything else is written through
+PROGRESS_FIELDS = frozenset(
+    {"score", "snake_length", "duration_seconds", "moves_count", "food_eaten"}
+)
+
+
+class GameUpdateBuffer:
+    """Latest pending progress fields per game, flushed in batches"""
+
+    def __init__(self, enabled: bool = ENABLED):
+        self.enabled = enabled
+        self.buffered = 0
+        self.flushes = 0
+        self.flushed_games = 0
+        self._lock = threading.Lock()
+        self._pending: Dict[int, Tuple[int, dict]] = {}
+
+    def accepts(self, fields: dict) -> bool:
+        """Whether an update with these fields may be buffered"""
+        return self.enabled and bool(fields) and fields.keys() <= PROGRESS_FIELDS
+
+    def put(self, game_id: int, user_id: int, fields: dict) -> dict:
+        """Merge fields into the game's pending update; returns the merged fields"""
+        with self._lock:
+            _, pending = self._pending.get(game_id, (user_id, {}))
+            pending = {**pending, **fields}
+            self._pending[game_id] = (user_id, pending)
+            self.buffered += 1
+            return dict(pending)
+
+    def pending(self, game_id: int) -> dict:
+        """Fields buffered for a game and not yet flushed"""
+        with self._lock:
+            return dict(self._pending.get(game_id, (None, {}))[1])
+
+    def take(self, game_id: int) -> dict:
+        """Remove and return a game's pending fields, to write them through"""
+        with self._lock:
+            return self._pending.pop(game_id, (None, {}))[1]
+
+    def clear(self):
+        """Drop every pending update without writing it"""
+        with self._lock:
+            self._pending.clear()
+
+    def flush(self, db: Session) -> int:
+        """Write every pending update in one transaction"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        try:
+            updated = crud.update_games_progress(db, pending)
+        except Exception:
+            db.rollback()
+            # Put the updates back under anything buffered since
+            with self._lock:
+                for game_id, (user_id, fields) in pending.items():
+                    _, newer = self._pending.get(game_id, (user_id, {}))
+                    self._pending[game_id] = (user_id, {**fields, **newer})
+            raise
+
+        self.flushes += 1
+        self.flushed_games += len(pending)
+        return updated
+
+    def stats(self) -> dict:
+        """Pending games and flush counters"""
+        return {
+            "enabled": self.enabled,
+            "pending_games": len(self._pending),
+            "buffered_updates": self.buffered,
+            "flushes": self.flushes,
+            "flushed_games": self.flushed_games,
+        }
+
+
+buffer = GameUpdateBuffer()
+
+
+def overlay(game, pending: Optional[dict]) -> schemas.Game:
+    """Response model of a game with its pending fields applied"""
+    model = schemas.Game.model_validate(game)
+    return model.model_copy(update=pending) if pending else model
@@ -42,6 +42,12 @@ fi
 echo "Starting nginx on port $NGINX_PORT..."
 nginx
 
+# Create missing tables and indexes, and backfill the rank counters and
+# user stats of a database created by an older version, once before the
+# workers start
+echo "Upgrading database..."
+python init_db.py
+
 # Start FastAPI backend
 echo "Starting FastAPI backend..."
 exec uvicorn main:app --host 127.0.0.1 --port 3000 --workers 2